@@ -0,0 +1,30 @@
+-- Adds the statistics tables the language analyzers add their document
+-- frequencies to, and counts the postings stored before they existed.
+-- Run it with the analyzers stopped, after utils/backfill_postings.py if
+-- term frequencies still had to be moved over.
+--
+-- psql -U unshadow -d unshadow -f corpus_statistics.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS term_statistic (
+    term_id INTEGER NOT NULL PRIMARY KEY,
+    document_count BIGINT NOT NULL,
+    term_count BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS corpus_statistic (
+    name VARCHAR NOT NULL PRIMARY KEY,
+    value BIGINT NOT NULL
+);
+
+DELETE FROM term_statistic;
+
+INSERT INTO term_statistic (term_id, document_count, term_count)
+SELECT term_id, count(*), sum(count) FROM posting GROUP BY term_id;
+
+INSERT INTO corpus_statistic (name, value)
+SELECT 'documents', count(DISTINCT fingerprint_id) FROM posting
+ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value;
+
+COMMIT;
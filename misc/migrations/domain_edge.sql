@@ -0,0 +1,37 @@
+-- Folds the graph table, one row per link seen, into the domain_edge
+-- table the frontier now keeps, one weighted row per pair of domains.
+-- Links seen before have no date, they are dated from the migration.
+-- Run it with the frontiers stopped, after frontier_unique_indexes.sql.
+--
+-- psql -U unshadow -d unshadow -f domain_edge.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS domain_edge (
+    src_id INTEGER NOT NULL,
+    dst_id INTEGER NOT NULL,
+    link_count BIGINT NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (src_id, dst_id)
+);
+
+CREATE INDEX IF NOT EXISTS domain_edge_dst_id_idx ON domain_edge (dst_id);
+
+INSERT INTO domain_edge (src_id, dst_id, link_count, first_seen, last_seen)
+SELECT
+    src.id,
+    dst.id,
+    count(*),
+    extract(epoch FROM now())::integer,
+    extract(epoch FROM now())::integer
+FROM graph
+JOIN domain src ON src.location = graph.src
+JOIN domain dst ON dst.location = graph.dst
+GROUP BY src.id, dst.id
+ON CONFLICT (src_id, dst_id) DO UPDATE SET
+    link_count = domain_edge.link_count + EXCLUDED.link_count;
+
+DROP TABLE graph;
+
+COMMIT;
@@ -0,0 +1,38 @@
+-- Adds the fingerprint id and the term/posting tables the language
+-- analyzer writes term frequencies to, on a database created before they
+-- existed. Term frequencies stored as JSON before are moved over by
+-- utils/backfill_postings.py afterwards.
+--
+-- psql -U unshadow -d unshadow -f fingerprint_postings.sql
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.columns
+        WHERE table_name = 'fingerprint' AND column_name = 'id'
+    ) THEN
+        ALTER TABLE fingerprint ADD COLUMN id SERIAL NOT NULL PRIMARY KEY;
+    END IF;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS term (
+    id SERIAL NOT NULL PRIMARY KEY,
+    term VARCHAR NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS posting (
+    term_id INTEGER NOT NULL,
+    fingerprint_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (term_id, fingerprint_id)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS term_term_idx ON term (term);
+CREATE INDEX IF NOT EXISTS posting_fingerprint_id_idx
+    ON posting (fingerprint_id);
+CREATE INDEX IF NOT EXISTS fingerprint_domain_idx ON fingerprint (domain);
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- Builds the unique indexes the frontier's bulk upserts rely on, on a
+-- database created before they existed. Rows duplicated by the old
+-- check-then-insert ingestion are folded together first.
+--
+-- psql -U unshadow -d unshadow -f frontier_unique_indexes.sql
+
+BEGIN;
+
+UPDATE url SET domain_id = keep.id
+FROM domain duplicate
+JOIN (
+    SELECT location, min(id) AS id FROM domain GROUP BY location
+) keep ON keep.location = duplicate.location
+WHERE
+    url.domain_id = duplicate.id AND
+    duplicate.id <> keep.id;
+
+DELETE FROM domain duplicate
+USING domain keep
+WHERE
+    duplicate.location = keep.location AND
+    duplicate.id > keep.id;
+
+DELETE FROM url duplicate
+USING url keep
+WHERE
+    md5(duplicate.url) = md5(keep.url) AND
+    duplicate.url = keep.url AND
+    duplicate.ctid > keep.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS domain_location_idx ON domain (location);
+CREATE UNIQUE INDEX IF NOT EXISTS url_url_md5_idx ON url (md5(url));
+
+COMMIT;
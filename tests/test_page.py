@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+from unshadow.worker import page
+
+
+DOCUMENT = """<!DOCTYPE html>
+<html>
+<head>
+<title>Styled page</title>
+<meta name="description" content="A page with links in its styles">
+<link rel="stylesheet" href="/main.css">
+<style>
+@import "/imported.css";
+body { background: url(/bg.png); }
+.logo { background-image: url('/logo.png'); }
+.icon { background: url("/icon.svg") no-repeat; }
+</style>
+</head>
+<body style="background: url(/body.png)">
+<a href="/first">First</a>
+<div style="background: url(/one.png), url('/two.png')">
+<img src="/image.jpg">
+</div>
+<style></style>
+<a href="http://a.onion/second">Second</a>
+</body>
+</html>
+"""
+
+
+class StreamPageTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+
+        with os.fdopen(handle, 'w') as f:
+            f.write(DOCUMENT)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_streaming_matches_tree(self):
+        tree = page.get_page(page.load_document(self.path))
+
+        # Small chunks split the stylesheet between several data() calls.
+        for chunk_size in (7, 65536):
+            self.assertEqual(page.stream_page(self.path, chunk_size), tree)
+
+    def test_style_links(self):
+        links = page.stream_page(self.path)['links']
+
+        for link in (
+            '/imported.css',
+            '/bg.png',
+            '/logo.png',
+            '/icon.svg',
+            '/body.png',
+            '/one.png',
+            '/two.png'
+        ):
+            self.assertIn(link, links)
+
+
+class XmlDeclarationTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+
+        with os.fdopen(handle, 'w') as f:
+            f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            f.write(DOCUMENT.split('\n', 1)[1])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_document_is_parsed(self):
+        result = page.get_page(page.load_document(self.path))
+
+        self.assertEqual(result['title'], 'Styled page')
+        self.assertIn('/first', result['links'])
+        self.assertEqual(result, page.stream_page(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from unshadow.cache import BloomFilter
+from unshadow.worker.frontier import Frontier
+
+
+class BloomFilterCountTest(unittest.TestCase):
+    def test_count_ignores_repeated_keys(self):
+        bloom = BloomFilter(1000, 0.01)
+
+        for n in range(2):
+            for i in range(500):
+                bloom.add("key{}".format(i))
+
+        # Keys that are false positives when added aren't counted.
+        self.assertAlmostEqual(bloom.count, 500, delta=10)
+        self.assertAlmostEqual(bloom.estimate_count(), 500, delta=25)
+
+    def test_merged_count_is_estimated(self):
+        a = BloomFilter(1000, 0.01)
+        b = BloomFilter(1000, 0.01)
+
+        for i in range(300):
+            a.add("key{}".format(i))
+            b.add("key{}".format(i + 150))
+
+        a.update(b)
+
+        self.assertAlmostEqual(a.count, 450, delta=25)
+
+    def test_count_is_persisted(self):
+        bloom = BloomFilter(1000, 0.01)
+
+        for i in range(100):
+            bloom.add("key{}".format(i))
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "filter")
+            bloom.save(path)
+            loaded = BloomFilter.load(path)
+
+        self.assertEqual(loaded.count, 100)
+        self.assertIn("key42", loaded)
+
+    def test_legacy_file_count_is_estimated(self):
+        bloom = BloomFilter(1000, 0.01)
+
+        for i in range(100):
+            bloom.add("key{}".format(i))
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "filter")
+
+            with open(path, 'wb') as f:
+                header = BloomFilter.LEGACY_HEADER
+                f.write(header.pack(bloom.size, bloom.hashes))
+                f.write(bloom.bits)
+
+            loaded = BloomFilter.load(path)
+
+        self.assertAlmostEqual(loaded.count, 100, delta=10)
+        self.assertIn("key42", loaded)
+
+
+class UrlFilterSaturationTest(unittest.TestCase):
+    def create_frontier(self, capacity):
+        # Only the url filter state, no database is needed without warming.
+        frontier = Frontier.__new__(Frontier)
+        frontier.log = unittest.mock.Mock()
+        frontier.url_filter_capacity = capacity
+        frontier.url_filter_error_rate = 0.01
+        frontier.url_filter_warm = False
+        frontier.seen_urls = frontier.build_url_filter()
+
+        return frontier
+
+    def test_filter_is_kept_below_capacity(self):
+        frontier = self.create_frontier(100)
+        seen_urls = frontier.seen_urls
+
+        for i in range(99):
+            seen_urls.add("http://a.onion/{}".format(i))
+
+        frontier.check_url_filter()
+
+        self.assertIs(frontier.seen_urls, seen_urls)
+
+    def test_saturated_filter_is_rebuilt(self):
+        frontier = self.create_frontier(100)
+
+        for i in range(100):
+            frontier.seen_urls.add("http://a.onion/{}".format(i))
+
+        frontier.check_url_filter()
+
+        self.assertEqual(frontier.seen_urls.count, 0)
+        self.assertNotIn("http://a.onion/1", frontier.seen_urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import collections
+import hashlib
+import math
+import os
+import struct
+
+
+class LRUCache(object):
+    """
+    Bounded mapping that evicts the least recently used key.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self.items[key]
+        except KeyError:
+            return default
+
+        self.items.move_to_end(key)
+
+        return value
+
+    def set(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class BloomFilter(object):
+    """
+    Set membership with no false negatives and an error_rate chance of a
+    false positive once capacity keys have been added. count estimates how
+    many distinct keys were added, so users can tell when the filter is
+    past its capacity.
+    """
+
+    HEADER = struct.Struct('<QQQ')
+    # Filters saved before the count was kept.
+    LEGACY_HEADER = struct.Struct('<QQ')
+
+    def __init__(self, capacity=None, error_rate=None, size=None, hashes=None):
+        if size is None:
+            size = int(math.ceil(
+                -capacity * math.log(error_rate) / (math.log(2) ** 2)
+            ))
+            hashes = max(1, int(round(size / capacity * math.log(2))))
+
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        bits = self.bits
+        new = False
+
+        for position in self.positions(key):
+            mask = 1 << (position & 7)
+
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+
+        # Keys that set no new bit were added already, or are false
+        # positives that would be counted by estimate_count() neither.
+        if new:
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+
+        for position in self.positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def update(self, other):
+        """
+        Union with a filter of the same dimensions.
+        """
+
+        merged = int.from_bytes(self.bits, 'little') | \
+            int.from_bytes(other.bits, 'little')
+        self.bits = bytearray(merged.to_bytes(len(self.bits), 'little'))
+        # Both filters may hold the same keys, so counts can't be summed.
+        self.count = self.estimate_count()
+
+    def estimate_count(self):
+        """
+        Distinct keys added, estimated from the share of bits set.
+        """
+
+        ones = bin(int.from_bytes(self.bits, 'little')).count('1')
+
+        if ones >= self.size:
+            return math.inf
+
+        return int(round(
+            -self.size / self.hashes * math.log(1 - ones / self.size)
+        ))
+
+    def compatible(self, other):
+        return self.size == other.size and self.hashes == other.hashes
+
+    def save(self, path):
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+
+        with open(temp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.size, self.hashes, self.count))
+            f.write(self.bits)
+
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        try:
+            size, hashes = cls.LEGACY_HEADER.unpack_from(data)
+
+            if len(data) == cls.LEGACY_HEADER.size + (size + 7) // 8:
+                count = None
+                bits = data[cls.LEGACY_HEADER.size:]
+            else:
+                size, hashes, count = cls.HEADER.unpack_from(data)
+                bits = data[cls.HEADER.size:]
+        except struct.error:
+            raise ValueError("Truncated bloom filter {}".format(path))
+
+        bloom = cls(size=size, hashes=hashes)
+        bloom.bits = bytearray(bits)
+
+        if len(bloom.bits) != (size + 7) // 8:
+            raise ValueError("Truncated bloom filter {}".format(path))
+
+        bloom.count = bloom.estimate_count() if count is None else count
+
+        return bloom
@@ -11,8 +11,18 @@ import re
 
 NUM_CPUS = multiprocessing.cpu_count()
 DEFAULT_OUTBOX_MAX_SIZE = 450
-DEFAULT_MAX_ITERATIONS = 100
+# Workers make way for a fresh one once any of these is reached, None
+# disables a limit. The replacement is started first, and the worker stops
+# once it's ready or after the handoff timeout.
+DEFAULT_MAX_ITERATIONS = None
+DEFAULT_MAX_MESSAGES = 100000
+DEFAULT_MAX_RSS_MB = 1024
+DEFAULT_MAX_AGE = 6 * 3600
+DEFAULT_MAX_FDS = 512
+DEFAULT_HANDOFF_TIMEOUT = 30
 DEFAULT_MAX_POLL_DELAY_MS = 5000
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_MAX_WAIT_MS = 0
 
 
 ###############################################################################
@@ -26,6 +36,19 @@ INBOX_REGEX = re.compile(r'^[A-z]+_[0-9]+_[0-9]+_[0-9]+$')
 in_data = lambda *a: os.path.join(DATA_DIR, *a)
 
 
+###############################################################################
+# Mailboxes
+###############################################################################
+
+
+# Queue backend between stages, "file" (one file per message) or "sqlite"
+# (one WAL mode database per mailbox, claimed in batches).
+MAILBOX_BACKEND = 'file'
+MAILBOX_SQLITE_TIMEOUT = 30
+# Mailbox sizes are tracked in shared memory and rescanned this often.
+MAILBOX_OCCUPANCY_RESYNC_MS = 10000
+
+
 ###############################################################################
 # Logging
 ###############################################################################
@@ -40,7 +63,33 @@ LOG_PATH = None #  in_data('unshadow.log')
 ###############################################################################
 
 
-MANAGER_POLL_DELAY_MS = 2000
+# Workers that crash are restarted after MANAGER_RESTART_BACKOFF seconds,
+# doubled for every crash in a row up to MANAGER_MAX_RESTART_BACKOFF.
+# Workers that ran for MANAGER_STABLE_TIME seconds start over from zero.
+MANAGER_RESTART_BACKOFF = 1
+MANAGER_MAX_RESTART_BACKOFF = 300
+MANAGER_STABLE_TIME = 60
+# Scale the stages between their MIN and MAX worker counts every
+# MANAGER_AUTOSCALE_INTERVAL seconds. A stage grows while its workers are
+# busy over MANAGER_SCALE_UP_BUSY of the time and its inbox holds more than
+# MANAGER_SCALE_UP_BACKLOG seconds of work, as long as the load per CPU
+# stays under MANAGER_MAX_LOAD and MANAGER_MIN_FREE_MEMORY of the memory is
+# available. It shrinks once its workers were busy under
+# MANAGER_SCALE_DOWN_BUSY of the time for MANAGER_SCALE_DOWN_TICKS
+# intervals in a row, and keeps its size for MANAGER_SCALE_COOLDOWN seconds
+# after any change.
+MANAGER_AUTOSCALE_ENABLED = True
+MANAGER_AUTOSCALE_INTERVAL = 10
+MANAGER_SCALE_UP_BUSY = 0.75
+MANAGER_SCALE_UP_BACKLOG = 30
+MANAGER_SCALE_DOWN_BUSY = 0.25
+MANAGER_SCALE_DOWN_TICKS = 6
+MANAGER_SCALE_COOLDOWN = 30
+MANAGER_MAX_LOAD = 1.5
+MANAGER_MIN_FREE_MEMORY = 0.1
+# Load the stages' modules and models once in the manager and fork every
+# worker from it, instead of having each worker load its own.
+MANAGER_PRELOAD = True
 PROCESS_DEATH_FOLDER = in_data('death')
 
 
@@ -55,6 +104,18 @@ DB_USER = "unshadow"
 DB_PASS = ""
 
 
+###############################################################################
+# Content store
+###############################################################################
+
+
+# Fetched bodies are stored once per md5, and the extractor and language
+# analyzer reuse their results for bodies they have already seen.
+CONTENT_STORE_ENABLED = True
+CONTENT_STORE_FOLDER = in_data('content_store')
+CONTENT_STORE_RESULTS_TTL = 7 * 86400
+CONTENT_STORE_GC_DELAY = 600
+
 
 ###############################################################################
 # HTML Parser
@@ -62,12 +123,20 @@ DB_PASS = ""
 
 
 EXTRACTOR_WORKER_COUNT = NUM_CPUS
+EXTRACTOR_MIN_WORKER_COUNT = max(1, NUM_CPUS // 2)
+EXTRACTOR_MAX_WORKER_COUNT = NUM_CPUS * 2
 EXTRACTOR_MAX_POLL_DELAY_MS = DEFAULT_MAX_POLL_DELAY_MS
 EXTRACTOR_INBOX = in_data("extractor_inbox")
 EXTRACTOR_OUTBOX = in_data('extractor_outbox')
 EXTRACTOR_CONTENT = in_data('extractor_content')
 EXTRACTOR_MAX_ITERATIONS = DEFAULT_MAX_ITERATIONS
 EXTRACTOR_OUTBOX_MAX_SIZE = DEFAULT_OUTBOX_MAX_SIZE
+EXTRACTOR_BATCH_SIZE = 16
+EXTRACTOR_BATCH_MAX_WAIT_MS = 500
+# Extract links while the page is read instead of from a parsed document,
+# which keeps memory flat on very large pages.
+EXTRACTOR_STREAMING = False
+EXTRACTOR_STREAM_CHUNK_SIZE = 65536
 
 
 ###############################################################################
@@ -75,9 +144,18 @@ EXTRACTOR_OUTBOX_MAX_SIZE = DEFAULT_OUTBOX_MAX_SIZE
 ###############################################################################
 
 
+# Links are only followed when their host has one of these TLDs. Onion
+# hosts must also be valid addresses of an allowed version.
 ALLOWED_TLDS = [
     "onion"
 ]
+ALLOWED_ONION_VERSIONS = [2, 3]
+# Hosts that are never crawled, along with their subdomains.
+DENIED_DOMAINS = []
+# Regular expressions searched in the path and query of links. When there
+# are allowed patterns a link must match one of them.
+ALLOWED_PATH_PATTERNS = []
+DENIED_PATH_PATTERNS = []
 
 
 ###############################################################################
@@ -86,6 +164,8 @@ ALLOWED_TLDS = [
 
 
 LANGUAGE_ANALYZER_WORKER_COUNT = NUM_CPUS
+LANGUAGE_ANALYZER_MIN_WORKER_COUNT = max(1, NUM_CPUS // 2)
+LANGUAGE_ANALYZER_MAX_WORKER_COUNT = NUM_CPUS * 2
 LANGUAGE_ANALYZER_INBOX = in_data('language_inbox')
 LANGUAGE_ANALYZER_CONTENT = in_data('language_content')
 LANGUAGE_ANALYZER_OUTBOX = None
@@ -93,6 +173,23 @@ LANGUAGE_ANALYZER_MAX_ITERATIONS = DEFAULT_MAX_ITERATIONS
 LANGUAGE_ANALYZER_OUTBOX_MAX_SIZE = None
 LANGUAGE_ANALYZER_MAX_POLL_DELAY_MS = DEFAULT_MAX_POLL_DELAY_MS
 LANGUAGE_ANALYZER_TF_LIMIT = 50
+# Languages are detected on samples of the text, grown up to the maximum
+# size until the detector is confident enough.
+LANGUAGE_ANALYZER_LANGUAGE_BACKEND = 'langdetect'
+LANGUAGE_ANALYZER_LANGUAGE_SAMPLE_SIZE = 2000
+LANGUAGE_ANALYZER_LANGUAGE_MAX_SAMPLE_SIZE = 32000
+LANGUAGE_ANALYZER_LANGUAGE_CONFIDENCE = 0.95
+LANGUAGE_ANALYZER_LANGUAGE_DOMAIN_CONFIDENCE = 0.8
+LANGUAGE_ANALYZER_LANGUAGE_CACHE_SIZE = 100000
+LANGUAGE_ANALYZER_TERM_CACHE_SIZE = 100000
+# Every analyzer counts document frequencies itself and adds them to the
+# term_statistic table at most this many seconds later.
+LANGUAGE_ANALYZER_STATISTICS_FLUSH_DELAY = 60
+# Pages whose SimHash signatures differ in at most this many of their 64
+# bits are near duplicates.
+LANGUAGE_ANALYZER_DUPLICATE_DISTANCE = 3
+LANGUAGE_ANALYZER_BATCH_SIZE = 16
+LANGUAGE_ANALYZER_BATCH_MAX_WAIT_MS = 500
 LANGUAGE_ANALYZER_DB_HOST = DB_HOST
 LANGUAGE_ANALYZER_DB_PORT = DB_PORT
 LANGUAGE_ANALYZER_DB_USER = DB_USER
@@ -100,12 +197,35 @@ LANGUAGE_ANALYZER_DB_PASS = DB_PASS
 LANGUAGE_ANALYZER_DB_NAME = "unshadow"
 
 
+###############################################################################
+# Page Analyzer
+###############################################################################
+
+
+# Replaces the HTML parser and language analyzer with a single stage that
+# parses each page once.
+PAGE_ANALYZER_ENABLED = False
+PAGE_ANALYZER_WORKER_COUNT = NUM_CPUS
+PAGE_ANALYZER_MIN_WORKER_COUNT = max(1, NUM_CPUS // 2)
+PAGE_ANALYZER_MAX_WORKER_COUNT = NUM_CPUS * 2
+PAGE_ANALYZER_INBOX = in_data('page_analyzer_inbox')
+PAGE_ANALYZER_OUTBOX = EXTRACTOR_OUTBOX
+PAGE_ANALYZER_CONTENT = in_data('page_analyzer_content')
+PAGE_ANALYZER_MAX_ITERATIONS = DEFAULT_MAX_ITERATIONS
+PAGE_ANALYZER_OUTBOX_MAX_SIZE = DEFAULT_OUTBOX_MAX_SIZE
+PAGE_ANALYZER_MAX_POLL_DELAY_MS = DEFAULT_MAX_POLL_DELAY_MS
+PAGE_ANALYZER_BATCH_SIZE = 16
+PAGE_ANALYZER_BATCH_MAX_WAIT_MS = 500
+
+
 ###############################################################################
 # Link Fetcher
 ###############################################################################
 
 
 FETCHER_WORKER_COUNT = NUM_CPUS * 32
+FETCHER_MIN_WORKER_COUNT = NUM_CPUS * 8
+FETCHER_MAX_WORKER_COUNT = NUM_CPUS * 64
 FETCHER_MAX_POLL_DELAY_MS = DEFAULT_MAX_POLL_DELAY_MS
 FETCHER_INBOX = in_data('fetcher_inbox')
 FETCHER_OUTBOXES = [
@@ -118,15 +238,31 @@ FETCHER_OUTBOXES = [
         "content": LANGUAGE_ANALYZER_CONTENT
     }
 ]
+FETCHER_PAGE_ANALYZER_OUTBOXES = [
+    {
+        "inbox": PAGE_ANALYZER_INBOX,
+        "content": PAGE_ANALYZER_CONTENT
+    }
+]
 FETCHER_OUTBOX_MAX_SIZE = DEFAULT_OUTBOX_MAX_SIZE
 FETCHER_CONTENT_FOLDER = in_data('fetcher_content')
 FETCHER_MAX_ITERATIONS = DEFAULT_MAX_ITERATIONS
+FETCHER_BATCH_SIZE = DEFAULT_BATCH_SIZE
+FETCHER_BATCH_MAX_WAIT_MS = DEFAULT_BATCH_MAX_WAIT_MS
 FETCHER_USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; rv:31.0) Gecko/20100101 Firefox/31.0'
 FETCHER_INBOX_REGEX = re.compile(r'^[0-9]+\-[A-z]+_[0-9]+_[0-9]+_[0-9]+$')
 FETCHER_MAX_CONTENT_SIZE = 8000000
 FETCHER_SOCKS5_PROXY_ENABLED = True
 FETCHER_SOCKS5_PROXY_HOST = 'localhost'
 FETCHER_SOCKS5_PROXY_PORT = 9050
+FETCHER_TIMEOUT = 300
+# Transfers driven concurrently by each fetcher through a CurlMulti handle.
+# When raising this, lower FETCHER_WORKER_COUNT accordingly.
+FETCHER_CONCURRENCY = 1
+# Idle curl handles kept per fetcher so connections to a host survive
+# between fetches.
+FETCHER_CURL_POOL_SIZE = 64
+FETCHER_CURL_POOL_SIZE_PER_HOST = 4
 
 
 ###############################################################################
@@ -135,16 +271,49 @@ FETCHER_SOCKS5_PROXY_PORT = 9050
 
 
 FRONTIER_WORKER_COUNT = NUM_CPUS
+FRONTIER_MIN_WORKER_COUNT = max(1, NUM_CPUS // 2)
+FRONTIER_MAX_WORKER_COUNT = NUM_CPUS * 2
 FRONTIER_INBOX = EXTRACTOR_OUTBOX
 FRONTIER_OUTBOX = FETCHER_INBOX
 FRONTIER_MAX_ITERATIONS = DEFAULT_MAX_ITERATIONS
 FRONTIER_OUTBOX_MAX_SIZE = DEFAULT_OUTBOX_MAX_SIZE
 FRONTIER_MAX_POLL_DELAY_MS = DEFAULT_MAX_POLL_DELAY_MS
+FRONTIER_BATCH_SIZE = 64
+FRONTIER_BATCH_MAX_WAIT_MS = 500
 FRONTIER_DB_HOST = DB_HOST
 FRONTIER_DB_PORT = DB_PORT
 FRONTIER_DB_USER = DB_USER
 FRONTIER_DB_PASS = DB_PASS
 FRONTIER_DB_NAME = "unshadow"
+FRONTIER_DOMAIN_CACHE_SIZE = 100000
+# Seen-url bloom filter, about 18MB per frontier at these settings. A false
+# positive means a new url is dropped, so keep the error rate low.
+FRONTIER_URL_FILTER_CAPACITY = 10000000
+FRONTIER_URL_FILTER_ERROR_RATE = 0.001
+FRONTIER_URL_FILTER_PATH = in_data('frontier_url_filter')
+# Fill a new filter from the url table when no persisted one exists.
+FRONTIER_URL_FILTER_WARM = True
+# Per-domain politeness. A domain's delay follows its latency times
+# FRONTIER_LATENCY_FACTOR, never below Frontier.domain_delay nor above
+# FRONTIER_MAX_DELAY, and backs off on errors.
+FRONTIER_MAX_DELAY = 3600
+FRONTIER_MAX_URLS_PER_HOST = 1000
+FRONTIER_LATENCY_FACTOR = 10
+FRONTIER_CHECKPOINT_FOLDER = in_data('frontier_schedule')
+FRONTIER_CHECKPOINT_DELAY = 60
+# How often the url table is scanned for urls no scheduler holds.
+FRONTIER_REFILL_DELAY = 60
+# Revisit fetched pages, with conditional GETs. The revisit interval of a
+# page halves when it changed and doubles when it didn't.
+FRONTIER_RECRAWL_ENABLED = False
+FRONTIER_RECRAWL_MIN_INTERVAL = 86400
+FRONTIER_RECRAWL_MAX_INTERVAL = 2592000
+# New urls of a pattern (a url with its ids replaced) whose pages were near
+# duplicates at this rate, out of at least the minimum pages, are scheduled
+# after the other urls of their domain. None disables it.
+FRONTIER_DUPLICATE_RATE = 0.8
+FRONTIER_DUPLICATE_MIN_PAGES = 20
+FRONTIER_DUPLICATE_REFRESH_DELAY = 300
 
 
 ###############################################################################
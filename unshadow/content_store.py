@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+
+class ContentStore(object):
+    """
+    Fetched bodies stored once per content_md5, with cached results of the
+    work done on them.
+
+    Every stage reading a body gets its own hard link to the stored blob, so
+    the link count of a blob is its reference count: a blob whose only link
+    is the one in the store is no longer referenced and is removed by gc().
+    Results are JSON files per kind and hash, kept until results_ttl seconds
+    after they were last written.
+    """
+
+    def __init__(self, folder, results_ttl=7 * 86400):
+        self.folder = folder
+        self.blob_folder = os.path.join(folder, 'blobs')
+        self.result_folder = os.path.join(folder, 'results')
+        self.results_ttl = results_ttl
+
+        os.makedirs(self.blob_folder, exist_ok=True)
+        os.makedirs(self.result_folder, exist_ok=True)
+
+    def blob_path(self, md5):
+        return os.path.join(self.blob_folder, md5[:2], md5)
+
+    def result_path(self, kind, md5):
+        return os.path.join(self.result_folder, kind, md5[:2], md5)
+
+    def put(self, path, md5):
+        """
+        Store the body at path, returns False if an identical body was
+        already stored. The file at path is left in place.
+        """
+
+        blob_path = self.blob_path(md5)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        try:
+            os.link(path, blob_path)
+        except FileExistsError:
+            return False
+
+        return True
+
+    def link(self, md5, destination, fallback_path):
+        """
+        Hard link a stored body to destination. A blob collected by a
+        concurrent gc() is replaced by the file at fallback_path.
+        """
+
+        try:
+            os.link(self.blob_path(md5), destination)
+        except FileNotFoundError:
+            os.link(fallback_path, destination)
+
+    def get_result(self, kind, md5):
+        if not md5:
+            return None
+
+        try:
+            with open(self.result_path(kind, md5), 'r') as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set_result(self, kind, md5, result):
+        if not md5:
+            return
+
+        path = self.result_path(kind, md5)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(result))
+
+        os.replace(temp_path, path)
+
+    def gc(self, now=None):
+        """
+        Remove unreferenced blobs and expired results, returns the number of
+        files removed.
+        """
+
+        now = now or time.time()
+        removed = 0
+
+        for root, directories, files in os.walk(self.blob_folder):
+            for name in files:
+                path = os.path.join(root, name)
+
+                try:
+                    if os.stat(path).st_nlink <= 1:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+
+        for root, directories, files in os.walk(self.result_folder):
+            for name in files:
+                path = os.path.join(root, name)
+
+                try:
+                    if os.stat(path).st_mtime < now - self.results_ttl:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+
+        return removed
@@ -0,0 +1,178 @@
+import collections
+import math
+
+
+class DocumentFrequencies(object):
+    """
+    Document frequencies counted by one worker since its last flush.
+
+    Every worker counts the documents it stores and adds its counts to the
+    term_statistic and corpus_statistic tables now and then, so no row is
+    updated for every document.
+    """
+
+    UPSERT_TERMS_QUERY = """
+        INSERT INTO term_statistic (term_id, document_count, term_count)
+        VALUES {}
+        ON CONFLICT (term_id) DO UPDATE SET
+            document_count =
+                term_statistic.document_count + EXCLUDED.document_count,
+            term_count = term_statistic.term_count + EXCLUDED.term_count
+    """
+
+    UPSERT_CORPUS_QUERY = """
+        INSERT INTO corpus_statistic (name, value) VALUES ('documents', %s)
+        ON CONFLICT (name) DO UPDATE SET
+            value = corpus_statistic.value + EXCLUDED.value
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.document_counts = collections.Counter()
+        self.term_counts = collections.Counter()
+
+    def add(self, term_counts):
+        """
+        Count a document from its {term_id: count} mapping.
+        """
+
+        if not term_counts:
+            return
+
+        self.documents += 1
+        self.document_counts.update(term_counts.keys())
+        self.term_counts.update(term_counts)
+
+    def flush(self, database):
+        """
+        Add the counts to the tables of a DatabaseClass and reset them.
+        """
+
+        if not self.documents:
+            return
+
+        rows = [
+            (term_id, self.document_counts[term_id], self.term_counts[term_id])
+            for term_id in sorted(self.document_counts)
+        ]
+
+        with database.get_cursor() as cursor:
+            database.execute_values(
+                cursor,
+                self.UPSERT_TERMS_QUERY,
+                "(%s, %s, %s)",
+                rows
+            )
+            cursor.execute(self.UPSERT_CORPUS_QUERY, (self.documents,))
+
+            database.db.commit()
+
+        self.__init__()
+
+
+GET_DOCUMENT_COUNT_QUERY = """
+    SELECT value FROM corpus_statistic WHERE name = 'documents'
+"""
+
+GET_IDF_QUERY = """
+    SELECT term.term, term_statistic.document_count
+    FROM term
+    JOIN term_statistic ON term_statistic.term_id = term.id
+    WHERE term.term = ANY(%s)
+"""
+
+GET_DOCUMENT_TFIDF_QUERY = """
+    SELECT term.term, posting.count, term_statistic.document_count
+    FROM posting
+    JOIN term ON term.id = posting.term_id
+    JOIN term_statistic ON term_statistic.term_id = posting.term_id
+    WHERE posting.fingerprint_id = %s
+"""
+
+GET_DOMAIN_TFIDF_QUERY = """
+    SELECT term.term, sum(posting.count), term_statistic.document_count
+    FROM fingerprint
+    JOIN posting ON posting.fingerprint_id = fingerprint.id
+    JOIN term ON term.id = posting.term_id
+    JOIN term_statistic ON term_statistic.term_id = posting.term_id
+    WHERE fingerprint.domain = %s
+    GROUP BY term.term, term_statistic.document_count
+"""
+
+REBUILD_QUERIES = [
+    "DELETE FROM term_statistic",
+    """
+        INSERT INTO term_statistic (term_id, document_count, term_count)
+        SELECT term_id, count(*), sum(count) FROM posting GROUP BY term_id
+    """,
+    """
+        INSERT INTO corpus_statistic (name, value)
+        SELECT 'documents', count(DISTINCT fingerprint_id) FROM posting
+        ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value
+    """
+]
+
+
+def get_document_count(cursor):
+    cursor.execute(GET_DOCUMENT_COUNT_QUERY)
+    row = cursor.fetchone()
+
+    return row[0] if row else 0
+
+
+def idf(document_count, document_frequency):
+    return math.log(document_count / document_frequency)
+
+
+def get_idf(cursor, terms):
+    """
+    Inverse document frequency of every known term of terms.
+    """
+
+    document_count = get_document_count(cursor)
+    cursor.execute(GET_IDF_QUERY, (list(terms),))
+
+    return {
+        term: idf(document_count, document_frequency)
+        for term, document_frequency in cursor.fetchall()
+    }
+
+
+def get_tfidf(cursor, query, argument):
+    document_count = get_document_count(cursor)
+    cursor.execute(query, (argument,))
+
+    return sorted(
+        [
+            (term, count * idf(document_count, document_frequency))
+            for term, count, document_frequency in cursor.fetchall()
+        ],
+        key=lambda i: i[1],
+        reverse=True
+    )
+
+
+def get_document_tfidf(cursor, fingerprint_id):
+    """
+    (term, tf-idf) pairs of a fingerprint, highest first.
+    """
+
+    return get_tfidf(cursor, GET_DOCUMENT_TFIDF_QUERY, fingerprint_id)
+
+
+def get_domain_tfidf(cursor, domain):
+    """
+    (term, tf-idf) pairs of all the fingerprints of a domain, highest first.
+    """
+
+    return get_tfidf(cursor, GET_DOMAIN_TFIDF_QUERY, domain)
+
+
+def rebuild(cursor):
+    """
+    Recount the statistics from the postings, to include postings that
+    were backfilled or counts lost by workers that were killed.
+    """
+
+    for query in REBUILD_QUERIES:
+        cursor.execute(query)
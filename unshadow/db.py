@@ -1,14 +1,15 @@
 import contextlib
+import logging
 import psycopg2
 
 
 class DatabaseClass(object):
     _db = None
 
-    def setup_database(self, table_name):
+    def setup_database(self, table_name, schema=None):
         """
         Connect to the database and declare the schema if it doesn't already
-        exist.
+        exist. The schema defaults to the class' SCHEMA.
         """
 
         sql = """
@@ -29,11 +30,51 @@ class DatabaseClass(object):
 
             if not exists:
                 try:
-                    cursor.execute(self.SCHEMA)
+                    cursor.execute(schema or self.SCHEMA)
                     self.db_connection.commit()
                 except psycopg2.IntegrityError:
                     pass
 
+    def ensure_schema(self, sql):
+        """
+        Run idempotent schema statements (CREATE ... IF NOT EXISTS) that
+        also have to reach databases created by an older SCHEMA.
+        """
+
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(sql)
+                self.db_connection.commit()
+            except psycopg2.Error as e:
+                self.db_connection.rollback()
+                logging.warning("Schema update failed: {}".format(e))
+
+    def execute_values(self, cursor, query, template, rows, page_size=1000):
+        """
+        Execute query with its {} placeholder replaced by a multi-row VALUES
+        list built from rows, page_size rows per statement. Returns the
+        rows fetched from every page, if the query returns any.
+
+        Callers sort rows that update or lock existing rows, as they sort
+        the keys of every other query of the transaction, so concurrent
+        workers lock them in the same order instead of deadlocking.
+        """
+
+        results = []
+
+        for n in range(0, len(rows), page_size):
+            values = ",".join(
+                cursor.mogrify(template, row).decode('utf-8')
+                for row in rows[n:n + page_size]
+            )
+
+            cursor.execute(query.format(values))
+
+            if cursor.description is not None:
+                results.extend(cursor.fetchall())
+
+        return results
+
     @property
     def db_connection(self):
         if not self._db:
@@ -1,3 +1,4 @@
+from unshadow.dispatch.autoscale import Autoscaler
 from unshadow.dispatch.manager import Manager
 from unshadow.dispatch.worker import Stage
 from unshadow.dispatch.db_stage import DBStage
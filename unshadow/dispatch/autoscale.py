@@ -0,0 +1,197 @@
+import collections
+import math
+import os
+
+
+class StageLoad(object):
+    """
+    What the workers of a stage reported since the last decision.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.busy = 0.0
+
+    def add(self, messages, busy):
+        self.messages += messages
+        self.busy += busy
+
+
+class Autoscaler(object):
+    """
+    Decides every interval seconds how many workers each stage should run,
+    between its minimum and maximum.
+
+    Workers report how many messages they processed and how long they were
+    busy doing it. A stage grows while its workers are busy and its inbox
+    holds more than backlog seconds of work for them, and the host has CPU
+    and memory to spare. It shrinks once its workers were mostly idle for
+    down_ticks decisions in a row. Either way it then keeps its size for
+    cooldown seconds, so pools don't flap.
+    """
+
+    def __init__(
+        self,
+        interval=10,
+        backlog=30,
+        up_busy=0.75,
+        down_busy=0.25,
+        down_ticks=6,
+        cooldown=30,
+        max_load=1.5,
+        min_free_memory=0.1
+    ):
+        self.interval = interval
+        self.backlog = backlog
+        self.up_busy = up_busy
+        self.down_busy = down_busy
+        self.down_ticks = down_ticks
+        self.cooldown = cooldown
+        self.max_load = max_load
+        self.min_free_memory = min_free_memory
+        self.loads = collections.defaultdict(StageLoad)
+        # Seconds per message, averaged over the past decisions.
+        self.message_times = {}
+        self.idle_ticks = collections.Counter()
+        self.changed_at = {}
+        self.decided_at = None
+
+    def report(self, name, messages, busy):
+        self.loads[name].add(messages, busy)
+
+    def decide(self, now, stages):
+        """
+        New worker counts of the stages that should change, from
+        {name: (workers, minimum, maximum, inbox depth)}. Depths are None
+        when unknown.
+        """
+
+        elapsed = now - self.decided_at if self.decided_at else None
+        self.decided_at = now
+
+        if not elapsed:
+            self.loads.clear()
+            return {}
+
+        headroom = self.has_headroom()
+        targets = {}
+
+        for name, (workers, minimum, maximum, depth) in stages.items():
+            load = self.loads.pop(name, StageLoad())
+            target = self.decide_stage(
+                name,
+                now,
+                elapsed,
+                workers,
+                minimum,
+                maximum,
+                depth,
+                load,
+                headroom
+            )
+
+            if target != workers:
+                self.changed_at[name] = now
+                self.idle_ticks[name] = 0
+                targets[name] = target
+
+        return targets
+
+    def decide_stage(
+        self,
+        name,
+        now,
+        elapsed,
+        workers,
+        minimum,
+        maximum,
+        depth,
+        load,
+        headroom
+    ):
+        if load.messages:
+            message_time = load.busy / load.messages
+            previous = self.message_times.get(name, message_time)
+            self.message_times[name] = (previous + message_time) / 2
+
+        # Workers stuck on a full outbox are idle, and more of them wouldn't
+        # help.
+        busy = min(1.0, load.busy / (max(workers, 1) * elapsed))
+
+        if busy < self.down_busy:
+            self.idle_ticks[name] += 1
+        else:
+            self.idle_ticks[name] = 0
+
+        if workers < minimum:
+            return minimum
+
+        if workers > maximum:
+            return maximum
+
+        if now < self.changed_at.get(name, 0) + self.cooldown:
+            return workers
+
+        message_time = self.message_times.get(name)
+
+        if headroom and busy >= self.up_busy and depth and message_time:
+            backlog = depth * message_time / max(workers, 1)
+
+            if backlog > self.backlog:
+                # Enough workers to clear the inbox within backlog seconds,
+                # at most twice as many at once.
+                needed = math.ceil(workers * backlog / self.backlog)
+
+                return min(maximum, max(workers + 1, min(workers * 2, needed)))
+
+        if self.idle_ticks[name] >= self.down_ticks and workers > minimum:
+            # Enough workers to be busy halfway between the thresholds.
+            wanted = (self.up_busy + self.down_busy) / 2
+            needed = math.ceil(workers * busy / wanted)
+
+            return max(minimum, min(workers - 1, needed))
+
+        return workers
+
+    def has_headroom(self):
+        """
+        Whether the host has CPU and memory to spare for more workers.
+        """
+
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            load = 0
+
+        if self.max_load and load >= self.max_load:
+            return False
+
+        if self.min_free_memory:
+            memory = get_memory_info()
+            total = memory.get('MemTotal')
+            available = memory.get('MemAvailable', total)
+
+            if total and available / total < self.min_free_memory:
+                return False
+
+        return True
+
+
+def get_memory_info():
+    """
+    /proc/meminfo values in kB, empty where it doesn't exist.
+    """
+
+    values = {}
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                parts = line.split()
+
+                if len(parts) >= 2:
+                    values[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        pass
+
+    return values
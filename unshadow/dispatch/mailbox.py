@@ -0,0 +1,296 @@
+from unshadow import config
+from unshadow.dispatch import occupancy
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+
+
+class Mailbox(object):
+    """
+    Queue of JSON messages passed between two stages.
+
+    A message is claimed by exactly one worker and stays claimed until it is
+    acknowledged. Claimed messages that were never acknowledged are handed
+    out again after reclaim().
+    """
+
+    def __init__(self, path, regex=None):
+        self.path = path
+        self.regex = regex or config.INBOX_REGEX
+        self.counter = occupancy.get_counter(path)
+
+    def put(self, name, message, priority=None):
+        self.put_many([(name, message, priority)])
+
+    def put_many(self, items):
+        """
+        Add (name, message, priority) items. Lower priorities are claimed
+        first, messages without a priority are claimed as priority 0.
+        """
+
+        items = list(items)
+        self.store(items)
+
+        if self.counter:
+            self.counter.add(len(items))
+
+    def store(self, items):
+        raise NotImplementedError
+
+    def claim(self, count=1):
+        """
+        Claim up to count messages, returns a list of (receipt, message).
+        """
+
+        raise NotImplementedError
+
+    def ack(self, receipt):
+        self.ack_many([receipt])
+
+    def ack_many(self, receipts):
+        receipts = list(receipts)
+        self.remove(receipts)
+
+        if self.counter:
+            self.counter.add(-len(receipts))
+
+    def remove(self, receipts):
+        raise NotImplementedError
+
+    def size(self):
+        """
+        Number of messages in the mailbox, claimed or not.
+        """
+
+        if self.counter:
+            return self.counter.get(self.scan_size)
+        else:
+            return self.scan_size()
+
+    def scan_size(self):
+        raise NotImplementedError
+
+    def reclaim(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileMailbox(Mailbox):
+    """
+    One file per message in a directory. Claiming renames the file to
+    <name>.claimed.
+    """
+
+    def store(self, items):
+        for name, message, priority in items:
+            if priority is not None:
+                name = "{}-{}".format(priority, name)
+
+            path = os.path.join(self.path, name)
+            temp_path = os.path.join(self.path, ".{}.tmp".format(name))
+
+            with open(temp_path, 'w') as f:
+                f.write(json.dumps(message))
+
+            os.rename(temp_path, path)
+
+    def get_priority(self, name):
+        prefix, separator, rest = name.partition('-')
+
+        if separator and prefix.isdigit():
+            return int(prefix)
+
+        return 0
+
+    def claim(self, count=1):
+        claimed = []
+        names = filter(self.regex.match, os.listdir(self.path))
+
+        for name in sorted(names, key=self.get_priority):
+            path = os.path.join(self.path, name)
+            receipt = "{}.claimed".format(path)
+
+            try:
+                shutil.move(path, receipt)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                continue
+
+            try:
+                with open(receipt, 'r') as f:
+                    message = json.loads(f.read())
+            except ValueError:
+                logging.warning("Dropping unreadable message {}".format(path))
+                self.ack(receipt)
+            else:
+                claimed.append((receipt, message))
+
+                if len(claimed) >= count:
+                    break
+
+        return claimed
+
+    def remove(self, receipts):
+        for receipt in receipts:
+            os.remove(receipt)
+
+    def scan_size(self):
+        # Messages being written are hidden temporary files.
+        return len([
+            name for name in os.listdir(self.path)
+            if not name.startswith('.')
+        ])
+
+    def reclaim(self):
+        for file_name in os.listdir(self.path):
+            if file_name.endswith(".claimed"):
+                new_file_name = file_name.replace(".claimed", "")
+                old_file_path = os.path.join(self.path, file_name)
+                new_file_path = os.path.join(self.path, new_file_name)
+
+                shutil.move(old_file_path, new_file_path)
+
+
+class SQLiteMailbox(Mailbox):
+    """
+    Messages stored in a SQLite database in WAL mode next to the mailbox
+    directory. A batch of messages is claimed in a single transaction.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS message (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            body TEXT NOT NULL,
+            claimed_by INTEGER
+        );
+
+        CREATE INDEX IF NOT EXISTS message_claim_idx
+            ON message (claimed_by, priority, id);
+    """
+
+    INSERT_QUERY = """
+        INSERT INTO message (name, priority, body) VALUES (?, ?, ?)
+    """
+
+    CLAIMABLE_QUERY = """
+        SELECT id, body FROM message
+        WHERE claimed_by IS NULL
+        ORDER BY priority, id
+        LIMIT ?
+    """
+
+    CLAIM_QUERY = """
+        UPDATE message SET claimed_by = ? WHERE id = ?
+    """
+
+    DELETE_QUERY = """
+        DELETE FROM message WHERE id = ?
+    """
+
+    SIZE_QUERY = """
+        SELECT COUNT(*) FROM message
+    """
+
+    RECLAIM_QUERY = """
+        UPDATE message SET claimed_by = NULL WHERE claimed_by IS NOT NULL
+    """
+
+    _conn = None
+    _conn_pid = None
+
+    def __init__(self, path, regex=None):
+        super(SQLiteMailbox, self).__init__(path, regex)
+
+        self.db_path = "{}.sqlite3".format(path.rstrip(os.sep))
+
+    @property
+    def conn(self):
+        # Connections must not cross a fork.
+        if not self._conn or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.db_path,
+                timeout=config.MAILBOX_SQLITE_TIMEOUT,
+                isolation_level=None
+            )
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+        return self._conn
+
+    def transaction(self, fn, *args):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            result = fn(conn, *args)
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+        return result
+
+    def store(self, items):
+        rows = [
+            (name, priority or 0, json.dumps(message))
+            for name, message, priority in items
+        ]
+
+        if rows:
+            self.transaction(lambda c: c.executemany(self.INSERT_QUERY, rows))
+
+    def claim_rows(self, conn, count):
+        rows = conn.execute(self.CLAIMABLE_QUERY, (count,)).fetchall()
+        pid = os.getpid()
+
+        conn.executemany(self.CLAIM_QUERY, [(pid, i[0]) for i in rows])
+
+        return rows
+
+    def claim(self, count=1):
+        rows = self.transaction(self.claim_rows, count)
+
+        return [(_id, json.loads(body)) for _id, body in rows]
+
+    def remove(self, receipts):
+        params = [(receipt,) for receipt in receipts]
+
+        if params:
+            self.transaction(lambda c: c.executemany(self.DELETE_QUERY, params))
+
+    def scan_size(self):
+        return self.conn.execute(self.SIZE_QUERY).fetchone()[0]
+
+    def reclaim(self):
+        self.transaction(lambda c: c.execute(self.RECLAIM_QUERY))
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+MAILBOX_BACKENDS = {
+    'file': FileMailbox,
+    'sqlite': SQLiteMailbox
+}
+
+
+def open_mailbox(path, regex=None):
+    if not path:
+        return None
+
+    Mailbox = MAILBOX_BACKENDS[config.MAILBOX_BACKEND]
+
+    return Mailbox(path, regex)
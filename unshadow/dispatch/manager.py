@@ -1,9 +1,13 @@
 from unshadow import config
+from unshadow.dispatch import occupancy
 
 import collections
+import gc
+import heapq
 import logging
 import json
 import multiprocessing
+import multiprocessing.connection
 import os
 import shutil
 import signal
@@ -17,12 +21,22 @@ class Manager:
         (
             'Worker',
             'count',
+            'minimum',
+            'maximum',
             'args',
             'kwargs'
         )
     )
 
-    def __init__(self, poll_delay, death_folder):
+    def __init__(
+        self,
+        death_folder,
+        preload=False,
+        restart_backoff=1,
+        max_restart_backoff=300,
+        stable_time=60,
+        autoscaler=None
+    ):
         signal.signal(signal.SIGTERM, self.handle_sigterm)
 
         if config.LOG_PATH:
@@ -33,10 +47,43 @@ class Manager:
         self.log = logging.getLogger()
         self.log.setLevel(config.LOG_LEVEL)
 
-        self.poll_delay = poll_delay / 1000.0
         self.death_folder = death_folder
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.stable_time = stable_time
+        self.autoscaler = autoscaler
+        self.next_scaling = 0
         self.workers = {}
+        # Number of workers every stage should run.
+        self.targets = {}
         self.running_workers = collections.defaultdict(dict)
+        # (name, pid) of every running worker, by process sentinel.
+        self.sentinels = {}
+        self.spawn_times = {}
+        # Notices workers write to the manager, one JSON line each.
+        self.notices, self.notice_writer = os.pipe()
+        self.notice_buffer = b''
+        self.exit_notices = {}
+        # (spawn time, sequence, name) of the workers to start.
+        self.pending_spawns = []
+        self.spawn_sequence = 0
+        # Consecutive crashes and restart statistics, per stage.
+        self.crashes = collections.Counter()
+        self.stats = collections.defaultdict(collections.Counter)
+        # Workers that asked to retire and were replaced, and the pids of
+        # those still waiting for their replacement, by replacement pid.
+        self.retired = set()
+        self.replacements = {}
+        # Workers told to stop because their pool was scaled down.
+        self.stopping = set()
+        self.preload = preload
+
+        # Preloaded workers have to be forked to share the manager's memory,
+        # whatever the platform's default start method is.
+        if preload:
+            self.context = multiprocessing.get_context('fork')
+        else:
+            self.context = multiprocessing.get_context()
 
     def handle_sigterm(self, signum, frame):
         self.log.info("Caught sigterm, exiting.")
@@ -62,6 +109,9 @@ class Manager:
 
         os.makedirs(self.death_folder)
 
+        if self.preload:
+            self.warm_up()
+
         # Spawn workers
         for name in self.workers:
             info = self.workers[name]
@@ -75,14 +125,66 @@ class Manager:
         self.die(1)
 
     def add_worker(self, name, Worker, count, *args, **kwargs):
+        """
+        Run count workers of a stage. With an autoscaler, the stage is
+        scaled between the min_workers and max_workers kwargs, which
+        default to count.
+        """
+
+        minimum = kwargs.pop('min_workers', None) or count
+        maximum = max(kwargs.pop('max_workers', None) or count, minimum)
+        count = min(max(count, minimum), maximum)
+
         if count > 0:
-            self.workers[name] = self.worker_info(Worker, count, args, kwargs)
+            self.workers[name] = self.worker_info(
+                Worker,
+                count,
+                minimum,
+                maximum,
+                args,
+                kwargs
+            )
+            self.targets[name] = count
+
+    def warm_up(self):
+        """
+        Load the modules and models of every stage once, so the workers
+        forked afterwards share them copy-on-write instead of loading
+        their own.
+        """
+
+        for name, info in self.workers.items():
+            # Workers that aren't stages have nothing to warm up.
+            if not hasattr(info.Worker, 'warm_up'):
+                continue
+
+            start = time.time()
+
+            try:
+                info.Worker.warm_up(**info.kwargs)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                # Workers will load whatever failed themselves.
+                self.log.exception(e)
+            else:
+                elapsed = time.time() - start
+                self.log.info("Warmed up {} in {:.2f}s".format(name, elapsed))
+
+        # The collector writes to every object it tracks, which would copy
+        # the shared pages into each worker. Frozen objects are left alone.
+        gc.collect()
+        gc.freeze()
 
     def spawn_worker(self, name, info):
         start = lambda *a, **k: info.Worker(*a, **k).start()
         info.Worker.death_folder = self.death_folder
+        info.Worker.notice_fd = self.notice_writer
+
+        if self.autoscaler and info.minimum < info.maximum:
+            info.Worker.report_delay = self.autoscaler.interval
 
-        worker_process = multiprocessing.Process(
+        worker_process = self.context.Process(
             target=start,
             args=info.args,
             kwargs=info.kwargs,
@@ -92,6 +194,11 @@ class Manager:
         worker_process.start()
 
         self.running_workers[name][worker_process.pid] = worker_process
+        self.sentinels[worker_process.sentinel] = (name, worker_process.pid)
+        self.spawn_times[worker_process.pid] = time.time()
+        self.stats[name]['spawned'] += 1
+
+        return worker_process.pid
 
     def kill_everything(self):
         for name in self.running_workers:
@@ -108,56 +215,257 @@ class Manager:
             os.kill(process.pid, 9)
 
     def event_loop(self):
+        """
+        Sleep until a worker exits, writes a notice or has to be restarted.
+        """
+
         while True:
             try:
-                self.check_for_changes()
-                time.sleep(self.poll_delay)
+                wake_times = [i[0] for i in self.pending_spawns[:1]]
+                timeout = None
+
+                if self.autoscaler:
+                    wake_times.append(self.next_scaling)
+
+                if wake_times:
+                    timeout = max(0, min(wake_times) - time.time())
+
+                ready = multiprocessing.connection.wait(
+                    list(self.sentinels) + [self.notices],
+                    timeout
+                )
+
+                # Notices go first, an exiting worker's last one comes
+                # before its exit.
+                if self.notices in ready:
+                    self.read_notices()
+
+                for sentinel in ready:
+                    if sentinel in self.sentinels:
+                        self.handle_death(*self.sentinels.pop(sentinel))
+
+                self.spawn_pending()
+
+                if self.autoscaler and time.time() >= self.next_scaling:
+                    self.autoscale()
+                    self.next_scaling = time.time() + self.autoscaler.interval
             except (KeyboardInterrupt, SystemExit):
                 self.kill_everything_and_die()
             except Exception as e:
                 self.log.exception(e)
 
-    def check_for_changes(self):
-        for name in self.running_workers:
-            pid_map = self.running_workers[name]
+    def read_notices(self):
+        self.notice_buffer += os.read(self.notices, 65536)
+        *lines, self.notice_buffer = self.notice_buffer.split(b'\n')
+
+        for line in lines:
+            notice = json.loads(line.decode('utf-8'))
+            self.handle_notice(notice.pop('pid'), notice.pop('kind'), notice)
+
+    def handle_notice(self, pid, kind, notice):
+        names = [
+            name for name, pid_map in self.running_workers.items()
+            if pid in pid_map
+        ]
+
+        if not names:
+            return
+
+        if kind == 'exit':
+            self.exit_notices[pid] = notice
+        elif kind == 'retiring':
+            self.log.info("Worker {} retiring: {}".format(
+                pid,
+                notice.get('reason', None)
+            ))
+            self.retired.add(pid)
+            replacement = self.spawn_worker(names[0], self.workers[names[0]])
+            self.replacements[replacement] = pid
+        elif kind == 'ready':
+            self.hand_off(pid)
+        elif kind == 'load' and self.autoscaler:
+            self.autoscaler.report(
+                names[0],
+                notice.get('messages', 0),
+                notice.get('busy', 0)
+            )
+
+    def hand_off(self, pid):
+        """
+        Tell the worker pid replaces, if any, to stop.
+        """
+
+        retiring_pid = self.replacements.pop(pid, None)
+
+        if retiring_pid is None:
+            return
 
-            self.manage_pool(name, pid_map)
-
-    def manage_pool(self, name, pid_map):
-        for pid in pid_map:
-            process = pid_map[pid]
-            death_file_path = os.path.join(self.death_folder, str(pid))
+        try:
+            os.kill(retiring_pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
 
-            worker_is_dead = any([
-                not process.is_alive(),
-                os.path.exists(death_file_path)
-            ])
+    def forget_replacement(self, retired_pid):
+        for pid, retiring_pid in list(self.replacements.items()):
+            if retiring_pid == retired_pid:
+                del self.replacements[pid]
 
-            if worker_is_dead:
-                info = self.workers[name]
+    def handle_death(self, name, pid):
+        process = self.running_workers[name].pop(pid)
+        process.join()
 
-                self.handle_death(name, info.Worker, process, death_file_path)
-                self.spawn_worker(name, info)
+        # Workers that aren't stages, like the metric server, exit without
+        # a notice, their exit code says whether they succeeded.
+        if hasattr(self.workers[name].Worker, 'announce'):
+            notice = self.exit_notices.pop(pid, {})
+        else:
+            notice = {'success': True}
 
-    def handle_death(self, name, Worker, process, death_file_path):
-        pid = process.pid
+        lifetime = time.time() - self.spawn_times.pop(pid)
+        success = process.exitcode == 0 and notice.get('success', False)
+        stats = self.stats[name]
 
-        if process.is_alive():
-            self.log.warning("Force terminating pid".format(pid))
-            # TODO os.kill it
-            process.terminate()
-            os.kill(pid, 9)
+        msg = "Worker {} exited with {}, Success: {}, Message: {}"
+        self.log.info(msg.format(
+            pid,
+            process.exitcode,
+            success,
+            notice.get('message', None)
+        ))
 
-        del self.running_workers[name][pid]
+        self.replacements.pop(pid, None)
+        death_file_path = os.path.join(self.death_folder, str(pid))
 
         if os.path.exists(death_file_path):
-            with open(death_file_path, 'r') as f:
-                message = json.loads(f.read())
+            os.remove(death_file_path)
 
-            success = message.get(b'success', None)
-            death_message = message.get(b'message', None)
-            msg = "Worker {} termination Success: {}, Message: {}"
+        # Retired workers were replaced already.
+        if pid in self.retired:
+            self.retired.remove(pid)
+            self.forget_replacement(pid)
+            stats['retired'] += 1
 
-            self.log.info(msg.format(pid, success, death_message))
+            return
 
-            os.remove(death_file_path)
+        if pid in self.stopping:
+            self.stopping.remove(pid)
+            stats['stopped'] += 1
+
+            return
+
+        if success or lifetime >= self.stable_time:
+            self.crashes[name] = 0
+        else:
+            self.crashes[name] += 1
+
+        if not success:
+            stats['crashed'] += 1
+
+        delay = 0
+
+        if self.crashes[name]:
+            delay = min(
+                self.max_restart_backoff,
+                self.restart_backoff * 2 ** (self.crashes[name] - 1)
+            )
+
+            msg = "Restarting {} in {}s after {} crashes in a row ({})"
+            self.log.warning(msg.format(
+                name,
+                delay,
+                self.crashes[name],
+                ", ".join("{} {}".format(v, k) for k, v in stats.items())
+            ))
+
+        stats['restarted'] += 1
+        self.spawn_sequence += 1
+        heapq.heappush(
+            self.pending_spawns,
+            (time.time() + delay, self.spawn_sequence, name)
+        )
+
+    def spawn_pending(self):
+        now = time.time()
+
+        while self.pending_spawns and self.pending_spawns[0][0] <= now:
+            spawn_time, sequence, name = heapq.heappop(self.pending_spawns)
+
+            # The pool may have been scaled down since.
+            if len(self.get_active_pids(name)) < self.targets[name]:
+                self.spawn_worker(name, self.workers[name])
+
+    def get_active_pids(self, name):
+        """
+        Workers of a stage that are neither retiring nor stopping, oldest
+        first.
+        """
+
+        return sorted(
+            [
+                pid for pid in self.running_workers[name]
+                if pid not in self.retired and pid not in self.stopping
+            ],
+            key=lambda pid: self.spawn_times[pid]
+        )
+
+    def autoscale(self):
+        stages = {}
+
+        for name, info in self.workers.items():
+            if info.minimum == info.maximum:
+                continue
+
+            # The inboxes' shared counters, no need to scan them.
+            counter = occupancy.get_counter(info.args[0])
+            depth = counter.count.value if counter else None
+
+            stages[name] = (
+                self.targets[name],
+                info.minimum,
+                info.maximum,
+                depth
+            )
+
+        targets = self.autoscaler.decide(time.time(), stages)
+
+        for name in stages:
+            if name in targets:
+                msg = "Scaling {} from {} to {} workers ({})"
+                self.log.info(msg.format(
+                    name,
+                    self.targets[name],
+                    targets[name],
+                    ", ".join(
+                        "{} {}".format(v, k)
+                        for k, v in self.stats[name].items()
+                    )
+                ))
+                self.targets[name] = targets[name]
+
+            self.scale(name)
+
+    def scale(self, name):
+        """
+        Start or stop workers of a stage until it runs its target count.
+        """
+
+        active = self.get_active_pids(name)
+        # Workers waiting out a restart backoff count as running.
+        pending = [i for i in self.pending_spawns if i[2] == name]
+        missing = self.targets[name] - len(active) - len(pending)
+
+        if missing > 0:
+            for n in range(missing):
+                self.spawn_worker(name, self.workers[name])
+
+        # Replacements that aren't ready yet are left alone, the workers
+        # they replace are waiting for them.
+        stoppable = [pid for pid in active if pid not in self.replacements]
+
+        for pid in stoppable[:max(0, len(active) - self.targets[name])]:
+            self.stopping.add(pid)
+
+            try:
+                os.kill(pid, signal.SIGUSR1)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,65 @@
+from unshadow import config
+
+import multiprocessing
+import os
+import time
+
+
+COUNTERS = {}
+
+
+class OccupancyCounter(object):
+    """
+    Number of messages in a mailbox, kept in shared memory.
+
+    Producers add to it when they put messages and consumers subtract when
+    they acknowledge them, so every process forked after the counter was
+    created can check for space without scanning the mailbox. The count is
+    resynchronised with a real scan every resync_interval seconds to absorb
+    messages added from outside the pipeline.
+    """
+
+    def __init__(self, count, resync_interval):
+        self.count = multiprocessing.Value('q', count)
+        self.synced_at = multiprocessing.Value('d', time.time(), lock=False)
+        self.resync_interval = resync_interval
+
+    def add(self, n):
+        with self.count.get_lock():
+            self.count.value += n
+
+    def get(self, scan):
+        with self.count.get_lock():
+            now = time.time()
+
+            if now - self.synced_at.value < self.resync_interval:
+                return self.count.value
+
+            # Other processes skip the scan while this one runs it.
+            self.synced_at.value = now
+            before = self.count.value
+
+        # The scan runs without the lock so producers and consumers aren't
+        # held up, what they added meanwhile is carried over.
+        scanned = scan()
+
+        with self.count.get_lock():
+            self.count.value = scanned + self.count.value - before
+
+            return self.count.value
+
+
+def track(path, count):
+    """
+    Start tracking the occupancy of the mailbox at path. Must be called
+    before workers are forked.
+    """
+
+    counter = OccupancyCounter(count, config.MAILBOX_OCCUPANCY_RESYNC_MS / 1000.0)
+    COUNTERS[os.path.abspath(path)] = counter
+
+    return counter
+
+
+def get_counter(path):
+    return COUNTERS.get(os.path.abspath(path))
@@ -1,21 +1,35 @@
 from unshadow import config
+from unshadow.dispatch.mailbox import open_mailbox
 #from unshadow.metric_client import MetricClient
 import datetime
 import logging
 import json
 import os
 import random
-import shutil
+import resource
 import signal
 import sys
 import time
 
 
+# Longest exit message sent to the manager, the rest is in the death file.
+# Escaped as JSON, it stays under PIPE_BUF (4096 bytes on Linux).
+NOTICE_MESSAGE_LENGTH = 512
+
+
 class Stage(object):
     ignore_outbox = False
+    # Write end of the manager's notice pipe, set by the manager.
+    notice_fd = None
+    # Seconds between the load reports sent to the manager, set by the
+    # manager when it scales the stage.
+    report_delay = None
     check_delay = 0
     next_check = 0
     on_check = None
+    # Optional on_batch(messages) hook returning one result per message.
+    # Stages without it handle a claimed batch one on_message at a time.
+    on_batch = None
     #metrics = None
     #default_metrics = [
     #    "inbox_size"
@@ -34,6 +48,7 @@ class Stage(object):
         **kwargs
     ):
         signal.signal(signal.SIGTERM, self.handle_sigterm)
+        signal.signal(signal.SIGUSR1, self.handle_handoff)
 
         if config.LOG_PATH:
             logging.basicConfig(filename=config.LOG_PATH)
@@ -55,9 +70,33 @@ class Stage(object):
         self.death_folder = death_folder
         self.inbox_regex = inbox_regex
         self.sleep_time = random.randint(0, max_sleep_time) / 1000.0
+        self.batch_size = kwargs.pop('batch_size', 1)
+        self.batch_max_wait = kwargs.pop('batch_max_wait_ms', 0) / 1000.0
+        self.max_messages = kwargs.pop(
+            'max_messages',
+            config.DEFAULT_MAX_MESSAGES
+        )
+        self.max_rss = kwargs.pop('max_rss_mb', config.DEFAULT_MAX_RSS_MB)
+        self.max_age = kwargs.pop('max_age', config.DEFAULT_MAX_AGE)
+        self.max_fds = kwargs.pop('max_fds', config.DEFAULT_MAX_FDS)
+        self.handoff_timeout = kwargs.pop(
+            'handoff_timeout',
+            config.DEFAULT_HANDOFF_TIMEOUT
+        )
+        self.started = time.time()
+        self.processed = 0
+        self.busy = 0.0
+        self.reported = (0, 0.0)
+        self.next_report = 0
+        self.next_resource_check = 0
+        self.retiring = None
+        self.retire_reason = None
+        self.handed_off = False
         #self.metric_args = metric_args
 
         self.create_mailboxes()
+        self.inbox_mailbox = open_mailbox(inbox, inbox_regex)
+        self.outbox_mailbox = open_mailbox(outbox)
         #self.setup_metrics()
         #self.declare_metrics()
 
@@ -66,6 +105,22 @@ class Stage(object):
     def init(self, **kwargs):
         pass
 
+    @classmethod
+    def warm_up(cls, **kwargs):
+        """
+        Load what every worker of the stage would load on its own, once in
+        the manager before it forks them. Called with the stage's kwargs.
+        """
+
+        pass
+
+    def on_exit(self):
+        """
+        Called once before a worker that retired dies.
+        """
+
+        pass
+
     def setup_metrics(self):
         self.metric_client = MetricClient(**self.metric_args)
         self.declare_metrics()
@@ -91,6 +146,14 @@ class Stage(object):
     def handle_sigterm(self, signum, frame):
         self.kill_process()
 
+    def handle_handoff(self, signum, frame):
+        """
+        The manager's signal to stop, either because the replacement of a
+        retiring worker is ready or because the stage is scaled down.
+        """
+
+        self.handed_off = True
+
     def kill_process(self, code=0):
         try:
             sys.exit(code)
@@ -113,86 +176,209 @@ class Stage(object):
 
     def event_loop(self):
         self.next_check = int(time.time()) + self.check_delay
+        iterations = 0
 
-        for n in range(self.max_iterations):
+        while not self.handed_off:
             self.find_and_process_work()
+            iterations += 1
             now = int(time.time())
 
             if self.on_check and now >= self.next_check:
                 self.on_check()
                 self.next_check = int(time.time()) + self.check_delay
 
+            if self.report_delay and now >= self.next_report:
+                self.report_load()
+                self.next_report = now + self.report_delay
+
+            if self.retiring is None:
+                reason = self.get_retire_reason(now, iterations)
+
+                if reason:
+                    self.retire(reason)
+            elif now >= self.retiring + self.handoff_timeout:
+                # No replacement came, the manager will start one once this
+                # worker is gone.
+                break
+
+    def get_retire_reason(self, now, iterations):
+        """
+        Why this worker should make way for a fresh one, if it should.
+        """
+
+        if self.max_iterations and iterations >= self.max_iterations:
+            return "{} iterations".format(iterations)
+
+        if self.max_messages and self.processed >= self.max_messages:
+            return "{} messages processed".format(self.processed)
+
+        if self.max_age and now - self.started >= self.max_age:
+            return "{:.0f}s old".format(now - self.started)
+
+        # Resources are read from /proc, at most once a second.
+        if now < self.next_resource_check:
+            return None
+
+        self.next_resource_check = now + 1
+
+        try:
+            with open("/proc/self/statm") as f:
+                rss = int(f.read().split()[1]) * resource.getpagesize()
+
+            fds = len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return None
+
+        if self.max_rss and rss >= self.max_rss * 2 ** 20:
+            return "{:.0f} MB resident".format(rss / 2 ** 20)
+
+        if self.max_fds and fds >= self.max_fds:
+            return "{} open files".format(fds)
+
+    def retire(self, reason):
+        """
+        Ask the manager for a replacement, this worker keeps working until
+        the replacement is ready or handoff_timeout passed.
+        """
+
+        self.log.info("{} {} retiring: {}".format(self.name, self.pid, reason))
+        self.retiring = int(time.time())
+        self.retire_reason = reason
+        self.announce('retiring', {'reason': reason})
+
+    def report_load(self):
+        """
+        Tell the manager how many messages this worker processed since its
+        last report, and how long it was busy processing them.
+        """
+
+        messages, busy = self.reported
+        self.announce('load', {
+            'messages': self.processed - messages,
+            'busy': self.busy - busy
+        })
+        self.reported = (self.processed, self.busy)
+
+    def announce(self, kind, message=None):
+        """
+        Write a notice to the manager's pipe. Notices are single lines
+        shorter than PIPE_BUF, so the workers' writes don't interleave.
+        """
+
+        if self.notice_fd is None:
+            return
+
+        notice = dict(message or {}, pid=self.pid, kind=kind)
+        line = json.dumps(notice) + '\n'
+
+        try:
+            os.write(self.notice_fd, line.encode('utf-8'))
+        except OSError as e:
+            self.log.exception(e)
+
     def find_and_process_work(self):
-        path = self.claim_file()
+        claimed = self.claim_batch()
 
-        if path:
-            message = self.get_work_from_file(path)
-            success = self.process_work(message)
+        if claimed:
+            start = time.time()
+            receipts = [i[0] for i in claimed]
+            messages = [i[1] for i in claimed]
+            success = self.process_batch(messages)
 
             if success:
-                os.remove(path)
+                self.inbox_mailbox.ack_many(receipts)
+
+            self.processed += len(messages)
+            self.busy += time.time() - start
         else:
             time.sleep(self.sleep_time)
 
-    def process_work(self, message):
-        result = None
+    def claim_batch(self):
+        """
+        Claim up to batch_size messages, waiting at most batch_max_wait for
+        a partial batch to fill up.
+        """
+
+        claimed = self.claim_messages(self.batch_size)
+        deadline = time.time() + self.batch_max_wait
+
+        while claimed and len(claimed) < self.batch_size:
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                break
+
+            time.sleep(min(remaining, self.batch_max_wait / 10))
+            claimed += self.claim_messages(self.batch_size - len(claimed))
+
+        return claimed
+
+    def process_batch(self, messages):
+        if not self.on_batch:
+            return all([self.process_work(message) for message in messages])
 
         try:
-            result = self.on_message(message)
+            results = self.on_batch(messages)
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
+            # Fall back to one message at a time so a single bad message
+            # doesn't take the rest of the batch with it.
             self.log.exception(e)
-        finally:
-            if result is not None and self.outbox:
-                self.write_result(result)
+
+            return all([self.process_work(message) for message in messages])
+
+        if results and self.outbox:
+            self.write_results(results)
 
         return True
 
+    def process_work(self, message):
+        result = self.handle_message(message)
+
+        if result is not None and self.outbox:
+            self.write_result(result)
+
+        return True
+
+    def handle_message(self, message):
+        try:
+            return self.on_message(message)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            self.log.exception(e)
+
     @property
     def outbox_has_space(self):
         if self.ignore_outbox:
             return True
 
         if self.outbox and self.outbox_max_size:
-            return len(os.listdir(self.outbox)) < self.outbox_max_size
+            return self.outbox_mailbox.size() < self.outbox_max_size
         else:
             return True
 
     @property
     def outbox_space(self):
         if self.outbox and self.outbox_max_size:
-            size = self.outbox_max_size - len(os.listdir(self.outbox))
+            size = self.outbox_max_size - self.outbox_mailbox.size()
 
             if size > 0:
                 return size
             else:
                 return 0
 
-    def claim_specific_file(self, path):
-        new_path = "{}.claimed".format(path)
-
-        try:
-            shutil.move(path, new_path)
-        except (KeyboardInterrupt, SystemExit):
-            self.kill_process()
-        except:
-            return None
-        else:
-            return new_path
+    def claim_messages(self, count=1):
+        """
+        Claim up to count messages from the inbox, as (receipt, message)
+        pairs.
+        """
 
-    def claim_file(self):
         if self.outbox_has_space:
-            all_files = os.listdir(self.inbox)
-            #self.report_metric("inbox_size",  len(all_files))
-            paths = filter(self.inbox_regex.match, all_files)
-
-            for file_name in paths:
-                path = os.path.join(self.inbox, file_name)
-                new_path = self.claim_specific_file(path)
-
-                if new_path:
-                    return new_path
+            return self.inbox_mailbox.claim(count)
+        else:
+            return []
 
     def generate_unique_name(self, prefix=''):
         self.sequence += 1
@@ -205,23 +391,29 @@ class Stage(object):
             self.sequence
         )
 
-    def write_result(self, message, prefix='', path=None):
-        if not path:
-            name = self.generate_unique_name(prefix)
-            path = os.path.join(self.outbox, name)
-
-        with open(path, 'w') as f:
-            f.write(json.dumps(message))
+    def write_result(self, message, priority=None):
+        name = self.generate_unique_name()
 
-    def get_work_from_file(self, path):
-        with open(path, 'r') as f:
-            contents = json.loads(f.read())
+        self.outbox_mailbox.put(name, message, priority)
 
-        return contents
+    def write_results(self, messages, priority=None):
+        self.outbox_mailbox.put_many([
+            (self.generate_unique_name(), message, priority)
+            for message in messages
+            if message is not None
+        ])
 
     def die(self, success, message=None):
         death_file_path = os.path.join(self.death_folder, str(self.pid))
         self.log.debug("{} about to die".format(self.name))
+
+        try:
+            self.on_exit()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            self.log.exception(e)
+
         #self.send_metrics()
 
         death_message = {
@@ -234,8 +426,13 @@ class Stage(object):
         with open(death_file_path, 'w') as f:
             f.write(json.dumps(death_message))
 
+        if message:
+            death_message['message'] = str(message)[:NOTICE_MESSAGE_LENGTH]
+
+        self.announce('exit', death_message)
         self.kill_process()
 
     def start(self):
+        self.announce('ready')
         self.event_loop()
-        self.die(True)
+        self.die(True, self.retire_reason)
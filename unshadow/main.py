@@ -1,14 +1,19 @@
 import json
 import os
 import sys
-import shutil
 
 from unshadow import config
+from unshadow.dispatch import Autoscaler
 from unshadow.dispatch import Manager
+from unshadow.dispatch import occupancy
+from unshadow.dispatch.mailbox import open_mailbox
+from unshadow.scope import ScopeFilter
+from unshadow.worker.content_collector import ContentCollector
 from unshadow.worker.fetcher import Fetcher
 from unshadow.worker.parser import LinkExtractor
 from unshadow.worker.frontier import Frontier
 from unshadow.worker.language_analyzer import LanguageAnalyzer
+from unshadow.worker.page_analyzer import PageAnalyzer
 from unshadow.server.metric import MetricServer
 
 
@@ -31,21 +36,28 @@ def create_data_dir():
         pass
 
 
-def reclaim_files(*directories):
+def reclaim_mailboxes(*directories):
     for directory in directories:
         if os.path.exists(directory):
-            for file_name in os.listdir(directory):
-                if file_name.endswith(".claimed"):
-                    new_file_name = file_name.replace(".claimed", "")
-                    old_file_path = os.path.join(directory, file_name)
-                    new_file_path = os.path.join(directory, new_file_name)
+            mailbox = open_mailbox(directory)
+            mailbox.reclaim()
+            mailbox.close()
+
+
+def track_mailboxes(*directories):
+    for directory in set(directories):
+        os.makedirs(directory, exist_ok=True)
+        mailbox = open_mailbox(directory)
+        occupancy.track(directory, mailbox.scan_size())
+        mailbox.close()
 
-                    shutil.move(old_file_path, new_file_path)
 
 def start_metrics():
     manager = Manager(
-        config.MANAGER_POLL_DELAY_MS,
-        config.PROCESS_DEATH_FOLDER
+        config.PROCESS_DEATH_FOLDER,
+        restart_backoff=config.MANAGER_RESTART_BACKOFF,
+        max_restart_backoff=config.MANAGER_MAX_RESTART_BACKOFF,
+        stable_time=config.MANAGER_STABLE_TIME
     )
 
     manager.add_worker(
@@ -64,23 +76,73 @@ def start_metrics():
     manager.start()
 
 
+def get_content_store():
+    if config.CONTENT_STORE_ENABLED:
+        return config.CONTENT_STORE_FOLDER
+
+
+def get_scope():
+    return ScopeFilter(
+        allowed_tlds=config.ALLOWED_TLDS,
+        onion_versions=config.ALLOWED_ONION_VERSIONS,
+        denied_domains=config.DENIED_DOMAINS,
+        allowed_path_patterns=config.ALLOWED_PATH_PATTERNS,
+        denied_path_patterns=config.DENIED_PATH_PATTERNS
+    )
+
+
+def get_fetcher_outboxes():
+    if config.PAGE_ANALYZER_ENABLED:
+        return config.FETCHER_PAGE_ANALYZER_OUTBOXES
+    else:
+        return config.FETCHER_OUTBOXES
+
+
+def get_autoscaler():
+    if config.MANAGER_AUTOSCALE_ENABLED:
+        return Autoscaler(
+            interval=config.MANAGER_AUTOSCALE_INTERVAL,
+            backlog=config.MANAGER_SCALE_UP_BACKLOG,
+            up_busy=config.MANAGER_SCALE_UP_BUSY,
+            down_busy=config.MANAGER_SCALE_DOWN_BUSY,
+            down_ticks=config.MANAGER_SCALE_DOWN_TICKS,
+            cooldown=config.MANAGER_SCALE_COOLDOWN,
+            max_load=config.MANAGER_MAX_LOAD,
+            min_free_memory=config.MANAGER_MIN_FREE_MEMORY
+        )
+
+
 def start_crawler(config_file=None):
     if config_file:
         apply_configs(config_file)
 
     create_data_dir()
 
-    reclaim_files(
+    reclaim_mailboxes(
         config.FETCHER_INBOX,
         config.EXTRACTOR_INBOX,
         config.EXTRACTOR_OUTBOX,
         config.FRONTIER_INBOX,
-        config.LANGUAGE_ANALYZER_INBOX
+        config.LANGUAGE_ANALYZER_INBOX,
+        config.PAGE_ANALYZER_INBOX
+    )
+
+    track_mailboxes(
+        config.FETCHER_INBOX,
+        config.EXTRACTOR_INBOX,
+        config.EXTRACTOR_OUTBOX,
+        config.FRONTIER_INBOX,
+        config.LANGUAGE_ANALYZER_INBOX,
+        config.PAGE_ANALYZER_INBOX
     )
 
     manager = Manager(
-        config.MANAGER_POLL_DELAY_MS,
-        config.PROCESS_DEATH_FOLDER
+        config.PROCESS_DEATH_FOLDER,
+        preload=config.MANAGER_PRELOAD,
+        restart_backoff=config.MANAGER_RESTART_BACKOFF,
+        max_restart_backoff=config.MANAGER_MAX_RESTART_BACKOFF,
+        stable_time=config.MANAGER_STABLE_TIME,
+        autoscaler=get_autoscaler()
     )
 
     metric_args = {
@@ -103,28 +165,35 @@ def start_crawler(config_file=None):
         config.FETCHER_MAX_POLL_DELAY_MS,
         config.FETCHER_OUTBOX_MAX_SIZE,
         metric_args,
+        min_workers=config.FETCHER_MIN_WORKER_COUNT,
+        max_workers=config.FETCHER_MAX_WORKER_COUNT,
+        batch_size=config.FETCHER_BATCH_SIZE,
+        batch_max_wait_ms=config.FETCHER_BATCH_MAX_WAIT_MS,
         user_agent=config.FETCHER_USER_AGENT,
         max_size=config.FETCHER_MAX_CONTENT_SIZE,
         enable_proxy=config.FETCHER_SOCKS5_PROXY_ENABLED,
         proxy_host=config.FETCHER_SOCKS5_PROXY_HOST,
         proxy_port=config.FETCHER_SOCKS5_PROXY_PORT,
         content_folder=config.FETCHER_CONTENT_FOLDER,
-        outboxes=config.FETCHER_OUTBOXES,
+        outboxes=get_fetcher_outboxes(),
+        concurrency=config.FETCHER_CONCURRENCY,
+        timeout=config.FETCHER_TIMEOUT,
+        pool_size=config.FETCHER_CURL_POOL_SIZE,
+        pool_size_per_host=config.FETCHER_CURL_POOL_SIZE_PER_HOST,
+        content_store=get_content_store(),
+        content_store_results_ttl=config.CONTENT_STORE_RESULTS_TTL
     )
 
-    manager.add_worker(
-        'link_extractor',
-        LinkExtractor,
-        config.EXTRACTOR_WORKER_COUNT,
-        config.EXTRACTOR_INBOX,
-        config.EXTRACTOR_OUTBOX,
-        config.INBOX_REGEX,
-        config.EXTRACTOR_MAX_ITERATIONS,
-        config.PROCESS_DEATH_FOLDER,
-        config.EXTRACTOR_MAX_POLL_DELAY_MS,
-        config.EXTRACTOR_OUTBOX_MAX_SIZE,
-        metric_args,
-    )
+    # One collector for the whole store, gc() walks every file in it.
+    if config.CONTENT_STORE_ENABLED:
+        manager.add_worker(
+            'content_collector',
+            ContentCollector,
+            1,
+            config.CONTENT_STORE_FOLDER,
+            results_ttl=config.CONTENT_STORE_RESULTS_TTL,
+            gc_delay=config.CONTENT_STORE_GC_DELAY
+        )
 
     manager.add_worker(
         'frontier',
@@ -138,31 +207,137 @@ def start_crawler(config_file=None):
         config.FRONTIER_MAX_POLL_DELAY_MS,
         config.FRONTIER_OUTBOX_MAX_SIZE,
         metric_args,
+        min_workers=config.FRONTIER_MIN_WORKER_COUNT,
+        max_workers=config.FRONTIER_MAX_WORKER_COUNT,
+        batch_size=config.FRONTIER_BATCH_SIZE,
+        batch_max_wait_ms=config.FRONTIER_BATCH_MAX_WAIT_MS,
         db_name=config.FRONTIER_DB_NAME,
         db_user=config.FRONTIER_DB_USER,
         db_pass=config.FRONTIER_DB_PASS,
         db_host=config.FRONTIER_DB_HOST,
-        db_port=config.FRONTIER_DB_PORT
+        db_port=config.FRONTIER_DB_PORT,
+        domain_cache_size=config.FRONTIER_DOMAIN_CACHE_SIZE,
+        url_filter_capacity=config.FRONTIER_URL_FILTER_CAPACITY,
+        url_filter_error_rate=config.FRONTIER_URL_FILTER_ERROR_RATE,
+        url_filter_path=config.FRONTIER_URL_FILTER_PATH,
+        url_filter_warm=config.FRONTIER_URL_FILTER_WARM,
+        max_delay=config.FRONTIER_MAX_DELAY,
+        max_urls_per_host=config.FRONTIER_MAX_URLS_PER_HOST,
+        latency_factor=config.FRONTIER_LATENCY_FACTOR,
+        checkpoint_folder=config.FRONTIER_CHECKPOINT_FOLDER,
+        checkpoint_delay=config.FRONTIER_CHECKPOINT_DELAY,
+        refill_delay=config.FRONTIER_REFILL_DELAY,
+        recrawl=config.FRONTIER_RECRAWL_ENABLED,
+        recrawl_min_interval=config.FRONTIER_RECRAWL_MIN_INTERVAL,
+        recrawl_max_interval=config.FRONTIER_RECRAWL_MAX_INTERVAL,
+        duplicate_rate=config.FRONTIER_DUPLICATE_RATE,
+        duplicate_min_pages=config.FRONTIER_DUPLICATE_MIN_PAGES,
+        duplicate_refresh_delay=config.FRONTIER_DUPLICATE_REFRESH_DELAY,
+        scope=get_scope()
     )
 
-    manager.add_worker(
-        'language_analyzer',
-        LanguageAnalyzer,
-        config.LANGUAGE_ANALYZER_WORKER_COUNT,
-        config.LANGUAGE_ANALYZER_INBOX,
-        config.LANGUAGE_ANALYZER_OUTBOX,
-        config.INBOX_REGEX,
-        config.LANGUAGE_ANALYZER_MAX_ITERATIONS,
-        config.PROCESS_DEATH_FOLDER,
-        config.LANGUAGE_ANALYZER_MAX_POLL_DELAY_MS,
-        config.LANGUAGE_ANALYZER_OUTBOX_MAX_SIZE,
-        metric_args,
-        tf_limit=config.LANGUAGE_ANALYZER_TF_LIMIT,
-        db_name=config.LANGUAGE_ANALYZER_DB_NAME,
-        db_user=config.LANGUAGE_ANALYZER_DB_USER,
-        db_pass=config.LANGUAGE_ANALYZER_DB_PASS,
-        db_host=config.LANGUAGE_ANALYZER_DB_HOST,
-        db_port=config.LANGUAGE_ANALYZER_DB_PORT
-    )
+    if config.PAGE_ANALYZER_ENABLED:
+        manager.add_worker(
+            'page_analyzer',
+            PageAnalyzer,
+            config.PAGE_ANALYZER_WORKER_COUNT,
+            config.PAGE_ANALYZER_INBOX,
+            config.PAGE_ANALYZER_OUTBOX,
+            config.INBOX_REGEX,
+            config.PAGE_ANALYZER_MAX_ITERATIONS,
+            config.PROCESS_DEATH_FOLDER,
+            config.PAGE_ANALYZER_MAX_POLL_DELAY_MS,
+            config.PAGE_ANALYZER_OUTBOX_MAX_SIZE,
+            metric_args,
+            min_workers=config.PAGE_ANALYZER_MIN_WORKER_COUNT,
+            max_workers=config.PAGE_ANALYZER_MAX_WORKER_COUNT,
+            batch_size=config.PAGE_ANALYZER_BATCH_SIZE,
+            batch_max_wait_ms=config.PAGE_ANALYZER_BATCH_MAX_WAIT_MS,
+            tf_limit=config.LANGUAGE_ANALYZER_TF_LIMIT,
+            language_backend=config.LANGUAGE_ANALYZER_LANGUAGE_BACKEND,
+            language_sample_size=config.LANGUAGE_ANALYZER_LANGUAGE_SAMPLE_SIZE,
+            language_max_sample_size=(
+                config.LANGUAGE_ANALYZER_LANGUAGE_MAX_SAMPLE_SIZE
+            ),
+            language_confidence=config.LANGUAGE_ANALYZER_LANGUAGE_CONFIDENCE,
+            language_domain_confidence=(
+                config.LANGUAGE_ANALYZER_LANGUAGE_DOMAIN_CONFIDENCE
+            ),
+            language_cache_size=config.LANGUAGE_ANALYZER_LANGUAGE_CACHE_SIZE,
+            term_cache_size=config.LANGUAGE_ANALYZER_TERM_CACHE_SIZE,
+            statistics_flush_delay=(
+                config.LANGUAGE_ANALYZER_STATISTICS_FLUSH_DELAY
+            ),
+            duplicate_distance=config.LANGUAGE_ANALYZER_DUPLICATE_DISTANCE,
+            db_name=config.LANGUAGE_ANALYZER_DB_NAME,
+            db_user=config.LANGUAGE_ANALYZER_DB_USER,
+            db_pass=config.LANGUAGE_ANALYZER_DB_PASS,
+            db_host=config.LANGUAGE_ANALYZER_DB_HOST,
+            db_port=config.LANGUAGE_ANALYZER_DB_PORT,
+            content_store=get_content_store(),
+            scope=get_scope()
+        )
+    else:
+        manager.add_worker(
+            'link_extractor',
+            LinkExtractor,
+            config.EXTRACTOR_WORKER_COUNT,
+            config.EXTRACTOR_INBOX,
+            config.EXTRACTOR_OUTBOX,
+            config.INBOX_REGEX,
+            config.EXTRACTOR_MAX_ITERATIONS,
+            config.PROCESS_DEATH_FOLDER,
+            config.EXTRACTOR_MAX_POLL_DELAY_MS,
+            config.EXTRACTOR_OUTBOX_MAX_SIZE,
+            metric_args,
+            min_workers=config.EXTRACTOR_MIN_WORKER_COUNT,
+            max_workers=config.EXTRACTOR_MAX_WORKER_COUNT,
+            batch_size=config.EXTRACTOR_BATCH_SIZE,
+            batch_max_wait_ms=config.EXTRACTOR_BATCH_MAX_WAIT_MS,
+            content_store=get_content_store(),
+            streaming=config.EXTRACTOR_STREAMING,
+            chunk_size=config.EXTRACTOR_STREAM_CHUNK_SIZE,
+            scope=get_scope()
+        )
+
+        manager.add_worker(
+            'language_analyzer',
+            LanguageAnalyzer,
+            config.LANGUAGE_ANALYZER_WORKER_COUNT,
+            config.LANGUAGE_ANALYZER_INBOX,
+            config.LANGUAGE_ANALYZER_OUTBOX,
+            config.INBOX_REGEX,
+            config.LANGUAGE_ANALYZER_MAX_ITERATIONS,
+            config.PROCESS_DEATH_FOLDER,
+            config.LANGUAGE_ANALYZER_MAX_POLL_DELAY_MS,
+            config.LANGUAGE_ANALYZER_OUTBOX_MAX_SIZE,
+            metric_args,
+            min_workers=config.LANGUAGE_ANALYZER_MIN_WORKER_COUNT,
+            max_workers=config.LANGUAGE_ANALYZER_MAX_WORKER_COUNT,
+            batch_size=config.LANGUAGE_ANALYZER_BATCH_SIZE,
+            batch_max_wait_ms=config.LANGUAGE_ANALYZER_BATCH_MAX_WAIT_MS,
+            tf_limit=config.LANGUAGE_ANALYZER_TF_LIMIT,
+            language_backend=config.LANGUAGE_ANALYZER_LANGUAGE_BACKEND,
+            language_sample_size=config.LANGUAGE_ANALYZER_LANGUAGE_SAMPLE_SIZE,
+            language_max_sample_size=(
+                config.LANGUAGE_ANALYZER_LANGUAGE_MAX_SAMPLE_SIZE
+            ),
+            language_confidence=config.LANGUAGE_ANALYZER_LANGUAGE_CONFIDENCE,
+            language_domain_confidence=(
+                config.LANGUAGE_ANALYZER_LANGUAGE_DOMAIN_CONFIDENCE
+            ),
+            language_cache_size=config.LANGUAGE_ANALYZER_LANGUAGE_CACHE_SIZE,
+            term_cache_size=config.LANGUAGE_ANALYZER_TERM_CACHE_SIZE,
+            statistics_flush_delay=(
+                config.LANGUAGE_ANALYZER_STATISTICS_FLUSH_DELAY
+            ),
+            duplicate_distance=config.LANGUAGE_ANALYZER_DUPLICATE_DISTANCE,
+            db_name=config.LANGUAGE_ANALYZER_DB_NAME,
+            db_user=config.LANGUAGE_ANALYZER_DB_USER,
+            db_pass=config.LANGUAGE_ANALYZER_DB_PASS,
+            db_host=config.LANGUAGE_ANALYZER_DB_HOST,
+            db_port=config.LANGUAGE_ANALYZER_DB_PORT,
+            content_store=get_content_store()
+        )
 
     manager.start()
@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import re
+
+
+from unshadow.cache import LRUCache
+
+
+ONION_V2_RE = re.compile(r"^[a-z2-7]{16}$")
+ONION_V3_RE = re.compile(r"^[a-z2-7]{56}$")
+
+
+def is_onion_v3(address):
+    """
+    Checks the version and checksum encoded in a v3 onion address.
+    """
+
+    decoded = base64.b32decode(address.upper())
+    public_key, checksum, version = decoded[:32], decoded[32:34], decoded[34:]
+
+    if version != b'\x03':
+        return False
+
+    digest = hashlib.sha3_256(
+        b".onion checksum" + public_key + version
+    ).digest()
+
+    return digest[:2] == checksum
+
+
+def onion_version(host):
+    """
+    Version of the onion address host belongs to, or None if it isn't a
+    valid onion address.
+    """
+
+    labels = host.split('.')
+
+    if len(labels) < 2 or labels[-1] != 'onion':
+        return None
+
+    address = labels[-2]
+
+    if ONION_V2_RE.match(address):
+        return 2
+
+    if ONION_V3_RE.match(address) and is_onion_v3(address):
+        return 3
+
+    return None
+
+
+class ScopeFilter(object):
+    """
+    Decides which canonical urls are worth crawling.
+
+    A url is in scope when its host has an allowed TLD, is a valid onion
+    address of an allowed version if it is an onion, and isn't in or under
+    a denied domain. Its path and query must then match one of the allowed
+    path patterns, if any, and none of the denied ones. Host decisions are
+    cached since pages mostly link to a few hosts.
+    """
+
+    def __init__(
+        self,
+        allowed_tlds=('onion',),
+        onion_versions=(2, 3),
+        denied_domains=(),
+        allowed_path_patterns=(),
+        denied_path_patterns=(),
+        host_cache_size=100000
+    ):
+        self.allowed_tlds = frozenset(tld.lower() for tld in allowed_tlds)
+        self.onion_versions = frozenset(onion_versions)
+        self.denied_domains = frozenset(d.lower() for d in denied_domains)
+        self.allowed_path_re = self.compile(allowed_path_patterns)
+        self.denied_path_re = self.compile(denied_path_patterns)
+        self.hosts = LRUCache(host_cache_size)
+
+    def compile(self, patterns):
+        if not patterns:
+            return None
+
+        return re.compile("|".join("(?:{})".format(p) for p in patterns))
+
+    def allows(self, url):
+        """
+        Checks a canonical url, as returned by the URLNormalizer.
+        """
+
+        parts = url.split('/', 3)
+
+        if len(parts) < 3:
+            return False
+
+        host = parts[2]
+        allowed = self.hosts.get(host)
+
+        if allowed is None:
+            allowed = self.allows_host(host)
+            self.hosts.set(host, allowed)
+
+        if not allowed:
+            return False
+
+        path = '/' + parts[3] if len(parts) > 3 else '/'
+
+        if self.allowed_path_re and not self.allowed_path_re.search(path):
+            return False
+
+        if self.denied_path_re and self.denied_path_re.search(path):
+            return False
+
+        return True
+
+    def allows_host(self, host):
+        if not host.endswith(']'):
+            host = host.rsplit(':', 1)[0]
+
+        tld = host.rsplit('.', 1)[-1]
+
+        if tld not in self.allowed_tlds:
+            return False
+
+        if tld == 'onion' and onion_version(host) not in self.onion_versions:
+            return False
+
+        labels = host.split('.')
+
+        for i in range(len(labels)):
+            if '.'.join(labels[i:]) in self.denied_domains:
+                return False
+
+        return True
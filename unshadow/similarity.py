@@ -0,0 +1,123 @@
+import hashlib
+import re
+
+
+SIGNATURE_BITS = 64
+
+# Path segments and query values holding identifiers, dates or hashes.
+VARIABLE_SEGMENT_RE = re.compile(r"\d|^[0-9a-f]{16,}$|^[0-9a-z_-]{24,}$")
+
+# Near-duplicate counts per url pattern, written by the language analyzers
+# and read by the frontiers.
+URL_PATTERN_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS url_pattern (
+        pattern VARCHAR NOT NULL PRIMARY KEY,
+        pages BIGINT NOT NULL,
+        duplicates BIGINT NOT NULL
+    );
+"""
+
+
+def term_hash(term, bits=SIGNATURE_BITS):
+    digest = hashlib.blake2b(
+        term.encode('utf-8'),
+        digest_size=bits // 8
+    ).digest()
+
+    return int.from_bytes(digest, 'big')
+
+
+def simhash(term_counts, bits=SIGNATURE_BITS):
+    """
+    SimHash of a {term: count} mapping. Texts sharing most of their terms
+    get signatures that differ in few bits.
+    """
+
+    # A bit is set when the terms whose hash has it set weigh more than
+    # half of the total. Hashes are summed column by column as bit strings,
+    # grouped by count, which is faster than testing every bit of every
+    # hash.
+    total = 0
+    hashes = {}
+
+    for term, count in term_counts.items():
+        total += count
+        hashes.setdefault(count, []).append(
+            format(term_hash(term, bits), '0{}b'.format(bits))
+        )
+
+    weights = [0] * bits
+
+    for count, strings in hashes.items():
+        for i, column in enumerate(zip(*strings)):
+            weights[i] += count * column.count('1')
+
+    signature = 0
+
+    for i, weight in enumerate(weights):
+        if 2 * weight > total:
+            signature |= 1 << (bits - 1 - i)
+
+    return signature
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def bands(signature, count, bits=SIGNATURE_BITS):
+    """
+    Splits a signature in count bands, each tagged with its index. Two
+    signatures less than count bits apart share at least one band.
+    """
+
+    width = bits // count
+    mask = (1 << width) - 1
+
+    return [
+        (i << width) | (signature >> (i * width) & mask)
+        for i in range(count)
+    ]
+
+
+def to_signed(value, bits=SIGNATURE_BITS):
+    """
+    Unsigned signatures as stored in a signed BIGINT column.
+    """
+
+    if value >= 1 << (bits - 1):
+        return value - (1 << bits)
+
+    return value
+
+
+def to_unsigned(value, bits=SIGNATURE_BITS):
+    return value & ((1 << bits) - 1)
+
+
+def url_pattern(url):
+    """
+    A url with its variable path segments and query values replaced, so
+    the pages of a template share a pattern:
+
+    http://a.onion/item/1234?id=5&p=2 -> a.onion/item/*?id&p
+    """
+
+    url = url.split('#', 1)[0]
+    url, _, query = url.partition('?')
+    parts = url.split('/', 3)
+
+    if len(parts) < 3:
+        return None
+
+    segments = parts[3].split('/') if len(parts) > 3 else []
+    pattern = '/'.join([parts[2]] + [
+        '*' if VARIABLE_SEGMENT_RE.search(segment) else segment
+        for segment in segments
+    ])
+
+    if query:
+        keys = sorted(set(i.split('=', 1)[0] for i in query.split('&')))
+        pattern += '?' + '&'.join(keys)
+
+    return pattern
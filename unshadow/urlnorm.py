@@ -0,0 +1,178 @@
+import re
+import string
+import urllib.parse
+
+
+SCHEMES = ('http', 'https')
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443
+}
+
+# Characters left as they are in paths and queries, anything else is
+# percent-encoded. Existing escapes are kept, but escaped unreserved
+# characters are decoded (RFC 3986 6.2.2.2). Urls stored before are
+# rewritten by utils/normalize_urls.py.
+PATH_SAFE = "/%:@!$&'()*+,;=-._~"
+QUERY_SAFE = PATH_SAFE + "?"
+UNRESERVED = frozenset(string.ascii_letters + string.digits + "-._~")
+
+# Links that are already canonical, which is the common case on onion
+# pages: a lower case onion host without a port, or a path relative to the
+# root of the page's host, without escapes or dot segments.
+ONION_URL_RE = re.compile(
+    r"^(https?://(?:[a-z2-7]{16}|[a-z2-7]{56})\.onion)"
+    r"(/[A-Za-z0-9\-._~!$&'()*+,;=:@/]*)?"
+    r"(\?[A-Za-z0-9\-._~!$&'()*+,;=:@/?]*)?"
+    r"(?:#.*)?$"
+)
+ROOT_PATH_RE = re.compile(
+    r"^(/(?!/)[A-Za-z0-9\-._~!$&'()*+,;=:@/]*)"
+    r"(\?[A-Za-z0-9\-._~!$&'()*+,;=:@/?]*)?"
+    r"(?:#.*)?$"
+)
+# A percent sign, with the two hex digits of a valid escape.
+ESCAPE_RE = re.compile(r"%([0-9a-fA-F]{2})?")
+
+
+def remove_dot_segments(path):
+    if '.' not in path:
+        return path
+
+    output = []
+
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+
+    if path.endswith(('/.', '/..')):
+        output.append('')
+
+    return '/'.join(output)
+
+
+def normalize_escape(match):
+    digits = match.group(1)
+
+    # A percent sign that doesn't start an escape is escaped itself.
+    if digits is None:
+        return '%25'
+
+    character = chr(int(digits, 16))
+
+    if character in UNRESERVED:
+        return character
+
+    return '%' + digits.upper()
+
+
+def quote(value, safe):
+    value = urllib.parse.quote(value, safe=safe)
+
+    if '%' in value:
+        value = ESCAPE_RE.sub(normalize_escape, value)
+
+    return value
+
+
+class URLNormalizer(object):
+    """
+    Resolves the links of a page against its url and canonicalizes them.
+
+    Canonical urls have a lower case http(s) scheme and host, no default
+    port, no credentials, no dot segments, a path of at least "/",
+    consistently escaped paths and queries, and no fragment. Equal canonical
+    urls point to the same resource, so they can be used as dedup keys.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self.root = None
+
+        if base_url:
+            base = self.normalize(base_url)
+
+            if base:
+                self.base_url = base
+                self.root = base[:base.index('/', base.index('//') + 2)]
+
+    def normalize(self, url):
+        """
+        Canonical form of url, or None if it isn't an http(s) url.
+        """
+
+        if not url:
+            return None
+
+        url = url.strip()
+        match = ONION_URL_RE.match(url)
+
+        if match:
+            root, path, query = match.groups()
+
+            if not path or '/.' not in path:
+                return root + (path or '/') + (query or '')
+
+        if self.root:
+            match = ROOT_PATH_RE.match(url)
+
+            if match and '/.' not in match.group(1):
+                return self.root + match.group(1) + (match.group(2) or '')
+
+        try:
+            return self.canonicalize(url)
+        except ValueError:
+            return None
+
+    def normalize_many(self, urls):
+        """
+        Canonical forms of urls, without duplicates or invalid urls.
+        """
+
+        normalized = {}
+
+        for url in urls:
+            url = self.normalize(url)
+
+            if url:
+                normalized[url] = None
+
+        return list(normalized)
+
+    def canonicalize(self, url):
+        parts = urllib.parse.urlsplit(url)
+
+        if not parts.scheme and self.base_url:
+            parts = urllib.parse.urlsplit(
+                urllib.parse.urljoin(self.base_url, url)
+            )
+
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').rstrip('.')
+
+        if scheme not in SCHEMES or not host:
+            return None
+
+        port = parts.port
+
+        if ':' in host:
+            host = "[{}]".format(host)
+
+        if port and port != DEFAULT_PORTS[scheme]:
+            host = "{}:{}".format(host, port)
+
+        path = quote(remove_dot_segments(parts.path), PATH_SAFE) or '/'
+        query = quote(parts.query, QUERY_SAFE)
+
+        return urllib.parse.urlunsplit((scheme, host, path, query, ''))
+
+
+def normalize(url):
+    """
+    Canonical form of an absolute url, or None if it isn't an http(s) url.
+    """
+
+    return URLNormalizer().normalize(url)
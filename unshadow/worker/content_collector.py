@@ -0,0 +1,38 @@
+from unshadow import config
+from unshadow.content_store import ContentStore
+
+import logging
+import time
+
+
+class ContentCollector(object):
+    """
+    Runs the content store's gc() every gc_delay seconds. A single one runs
+    next to the stages, gc() walks the whole store.
+    """
+
+    def __init__(self, content_store, results_ttl=7 * 86400, gc_delay=600):
+        if config.LOG_PATH:
+            logging.basicConfig(filename=config.LOG_PATH)
+        else:
+            logging.basicConfig()
+
+        self.log = logging.getLogger()
+        self.log.setLevel(config.LOG_LEVEL)
+
+        self.content_store = ContentStore(content_store, results_ttl)
+        self.gc_delay = gc_delay
+
+    def start(self):
+        while True:
+            time.sleep(self.gc_delay)
+
+            try:
+                removed = self.content_store.gc()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                self.log.exception(e)
+            else:
+                msg = "Content store gc removed {} files"
+                self.log.debug(msg.format(removed))
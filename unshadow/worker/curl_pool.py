@@ -0,0 +1,72 @@
+import collections
+import pycurl
+
+
+class CurlPool:
+    """
+    Per-process cache of idle curl handles, keyed by host.
+
+    A handle keeps its live connections and DNS cache across reset(), so
+    handing the same handle back out for the same host reuses the
+    connection to the proxy instead of building a new circuit.
+    """
+
+    def __init__(self, max_handles=64, max_per_host=4):
+        self.max_handles = max_handles
+        self.max_per_host = max_per_host
+        self.idle = collections.OrderedDict()
+        self.size = 0
+
+    def acquire(self, host):
+        handles = self.idle.get(host)
+
+        if not handles:
+            return pycurl.Curl()
+
+        curl = handles.pop()
+        self.size -= 1
+
+        if not handles:
+            del self.idle[host]
+
+        curl.reset()
+
+        return curl
+
+    def release(self, host, curl):
+        handles = self.idle.get(host)
+
+        if handles is None:
+            handles = self.idle[host] = []
+        else:
+            self.idle.move_to_end(host)
+
+        if len(handles) >= self.max_per_host:
+            curl.close()
+            return
+
+        handles.append(curl)
+        self.size += 1
+
+        while self.size > self.max_handles:
+            self.evict()
+
+    def evict(self):
+        """
+        Close the oldest idle handle of the least recently used host.
+        """
+
+        host, handles = next(iter(self.idle.items()))
+        handles.pop(0).close()
+        self.size -= 1
+
+        if not handles:
+            del self.idle[host]
+
+    def close(self):
+        for handles in self.idle.values():
+            for curl in handles:
+                curl.close()
+
+        self.idle.clear()
+        self.size = 0
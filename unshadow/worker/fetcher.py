@@ -5,12 +5,14 @@ import http.client
 import io
 import pycurl
 import os
-import shutil
 import time
 import urllib.parse
 
 
+from unshadow.content_store import ContentStore
 from unshadow.dispatch import Stage
+from unshadow.dispatch.mailbox import open_mailbox
+from unshadow.worker.curl_pool import CurlPool
 
 
 class MockSocket:
@@ -21,6 +23,32 @@ class MockSocket:
         return self._file
 
 
+class Transfer:
+    """
+    State of a single in-flight HTTP request.
+    """
+
+    def __init__(
+        self,
+        curl,
+        metadata,
+        path,
+        header_buffer,
+        content_buffer,
+        md5_buffer
+    ):
+        self.curl = curl
+        self.metadata = metadata
+        self.path = path
+        self.header_buffer = header_buffer
+        self.content_buffer = content_buffer
+        self.md5_buffer = md5_buffer
+        self.start = None
+        self.message = None
+        self.receipt = None
+        self.ssl_retried = False
+
+
 class Fetcher(Stage):
     def init(
         self,
@@ -31,7 +59,13 @@ class Fetcher(Stage):
         proxy_host=None,
         proxy_port=None,
         content_folder='',
-        outboxes=[]
+        outboxes=[],
+        concurrency=1,
+        timeout=None,
+        pool_size=64,
+        pool_size_per_host=4,
+        content_store=None,
+        content_store_results_ttl=7 * 86400
     ):
         self.max_http_retries = max_http_retries
         self.max_size = max_size
@@ -42,40 +76,37 @@ class Fetcher(Stage):
         self.proxy_port = proxy_port
         self.content_folder = content_folder
         self.outboxes = outboxes
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.multi = None
+        self.transfers = {}
+        self.content_store = None
+        self.curl_pool = CurlPool(pool_size, pool_size_per_host)
+        self.outbox_mailboxes = [
+            (open_mailbox(outbox['inbox']), outbox['content'])
+            for outbox in outboxes
+        ]
+
+        if self.concurrency > 1:
+            self.multi = pycurl.CurlMulti()
+
+        if content_store:
+            self.content_store = ContentStore(
+                content_store,
+                content_store_results_ttl
+            )
 
         self.generate_content_folders()
 
-    def claim_file(self):
-        if self.outbox_has_space:
-            all_files = os.listdir(self.inbox)
-            self.report_metric("inbox_size",  len(all_files))
-            paths = filter(self.inbox_regex.match, all_files)
-
-            for file_name in sorted(paths, key=lambda i: int(i.split('-')[0])):
-                old_path = os.path.join(self.inbox, file_name)
-                new_path = os.path.join(self.inbox,
-                                        "{}.claimed".format(file_name))
-
-                try:
-                    shutil.move(old_path, new_path)
-                except (KeyboardInterrupt, SystemExit):
-                    self.kill_process()
-                except:
-                    pass
-                else:
-                    return new_path
-
     @property
     def outbox_has_space(self):
         if self.ignore_outbox:
             return True
 
-        for outbox in self.outboxes:
-            inbox = outbox['inbox']
-
-            if len(os.listdir(inbox)) > self.outbox_max_size:
+        for mailbox, content_folder in self.outbox_mailboxes:
+            if mailbox.size() > self.outbox_max_size:
                 return False
-        
+
         return True
 
     def generate_content_folders(self):
@@ -92,6 +123,7 @@ class Fetcher(Stage):
             pass
 
     def create_content_buffer(self):
+        self.sequence += 1
         name = "{}_{}_{}".format(
             self.pid,
             int(time.time()),
@@ -119,7 +151,7 @@ class Fetcher(Stage):
 
         buffer.write(data)
 
-    def get_url(self, url):
+    def create_transfer(self, url, headers=None):
         metadata = urllib.parse.urlparse(url)
         header_buffer = io.BytesIO()
         content_buffer, path = self.create_content_buffer()
@@ -132,25 +164,51 @@ class Fetcher(Stage):
 
         header_fn = functools.partial(self.write_header, header_buffer)
 
-        curl = pycurl.Curl()
+        curl = self.curl_pool.acquire(metadata.netloc)
         curl.setopt(curl.URL, url)
         curl.setopt(curl.WRITEFUNCTION, write_fn)
         curl.setopt(curl.HEADERFUNCTION, header_fn)
         curl.setopt(curl.USERAGENT, self.user_agent)
+        curl.setopt(curl.TCP_KEEPALIVE, 1)
+
+        if headers:
+            curl.setopt(curl.HTTPHEADER, headers)
+
+        if self.timeout:
+            curl.setopt(curl.TIMEOUT, self.timeout)
 
         if self.enable_proxy:
             curl.setopt(curl.PROXY, self.proxy_host)
             curl.setopt(curl.PROXYPORT, self.proxy_port)
             curl.setopt(curl.PROXYTYPE, 7)
 
+        return Transfer(
+            curl,
+            metadata,
+            path,
+            header_buffer,
+            content_buffer,
+            md5_buffer
+        )
+
+    def get_url(self, url, headers=None):
+        transfer = self.create_transfer(url, headers)
+
         self.log.debug("GET: {}".format(url))
 
-        start = time.time()
+        transfer.start = time.time()
         success = self.perform_get(
-            curl,
-            metadata.scheme,
+            transfer.curl,
+            transfer.metadata.scheme,
             self.max_http_retries
         )
+
+        return self.finish_transfer(transfer, success)
+
+    def finish_transfer(self, transfer, success):
+        curl = transfer.curl
+        header_buffer = transfer.header_buffer
+        start = transfer.start
         end = time.time()
 
         if success and success != -1:
@@ -162,13 +220,13 @@ class Fetcher(Stage):
                 redirect_url = None
 
             result = self.generate_http_result(
-                metadata,
-                path,
+                transfer.metadata,
+                transfer.path,
                 header_buffer,
                 int(end - start),
                 http_code,
                 start,
-                md5_buffer.hexdigest(),
+                transfer.md5_buffer.hexdigest(),
                 redirect=redirect_url
             )
         else:
@@ -176,7 +234,7 @@ class Fetcher(Stage):
             partial = success == -1 and not rejected
 
             result = self.generate_http_result(
-                metadata,
+                transfer.metadata,
                 None,
                 None,
                 int(end - start),
@@ -187,11 +245,11 @@ class Fetcher(Stage):
                 partial=partial,
                 rejected=True
             )
-            
-        curl.close()
-        content_buffer.close()
+
+        self.curl_pool.release(transfer.metadata.netloc, curl)
+        transfer.content_buffer.close()
         header_buffer.close()
-       
+
         return result
 
     def generate_http_result(
@@ -242,6 +300,8 @@ class Fetcher(Stage):
             result['header'] = str(base64.b64encode(header), encoding="utf-8")
             header_map = self.get_headers(header)
             result['server'] = header_map.get('server', None)
+            result['etag'] = header_map.get('etag', None)
+            result['last_modified'] = header_map.get('last-modified', None)
 
     def get_headers(self, header_content):
         socket = MockSocket(header_content)
@@ -281,10 +341,48 @@ class Fetcher(Stage):
             else:
                 raise e
 
+    def get_conditional_headers(self, message):
+        """
+        Validators of a previous visit, sent by the frontier on recrawls.
+        """
+
+        headers = []
+
+        if message.get('etag', None):
+            headers.append("If-None-Match: {}".format(message['etag']))
+
+        if message.get('last_modified', None):
+            last_modified = message['last_modified']
+            headers.append("If-Modified-Since: {}".format(last_modified))
+
+        return headers
+
+    def check_unchanged(self, message, result):
+        """
+        Flag results whose content is the same as on the previous visit.
+        """
+
+        if result.get('http_code', None) == 304:
+            result['not_modified'] = True
+
+            # A 304 may omit the validators, keep the previous ones.
+            for key in ('etag', 'last_modified'):
+                if not result.get(key, None):
+                    result[key] = message.get(key, None)
+        elif all([
+            message.get('content_md5', None),
+            message.get('content_md5', None) == result['content_md5']
+        ]):
+            result['unchanged'] = True
+
     def on_message(self, message):
         url = message['url']
-        message.update(self.get_url(url))
-        
+        headers = self.get_conditional_headers(message)
+        result = self.get_url(url, headers)
+
+        self.check_unchanged(message, result)
+        message.update(result)
+
         return message
 
     def process_work(self, message):
@@ -306,26 +404,166 @@ class Fetcher(Stage):
         content_exists = origin_content_path is not None
         content_name = None
 
+        # Unchanged pages need no parsing or analysis downstream.
+        if content_exists and result is not None and any([
+            result.get('not_modified', None),
+            result.get('unchanged', None)
+        ]):
+            os.remove(origin_content_path)
+            message['content_path'] = None
+            content_exists = False
+
         if content_exists:
             content_name = os.path.basename(origin_content_path)
+            content_md5 = message.get('content_md5', None)
+            stored = bool(self.content_store and content_md5)
 
+            if stored:
+                self.content_store.put(origin_content_path, content_md5)
 
         # TODO pass in dictionary
         if result is not None:
             name = self.generate_unique_name()
 
-            for outbox in self.outboxes:
-                inbox = outbox['inbox']
-                content_folder = outbox['content']
-
+            for mailbox, content_folder in self.outbox_mailboxes:
                 if content_exists:
                     destination = os.path.join(content_folder, content_name)
                     message['content_path'] = destination
-                    os.link(origin_content_path, destination)
 
-                inbox_destination = os.path.join(inbox, name)
+                    if stored:
+                        self.content_store.link(
+                            content_md5,
+                            destination,
+                            origin_content_path
+                        )
+                    else:
+                        os.link(origin_content_path, destination)
 
-                self.write_result(result, path=inbox_destination)
+                mailbox.put(name, result)
 
             if content_exists:
                 os.remove(origin_content_path)
+
+    def find_and_process_work(self):
+        if not self.multi:
+            return super(Fetcher, self).find_and_process_work()
+
+        self.add_transfers()
+
+        if self.transfers:
+            start = time.time()
+            in_flight = len(self.transfers)
+            self.perform_transfers()
+
+            # Fetchers mostly wait on the network, so they count as busy
+            # for the share of their transfer slots in use.
+            elapsed = time.time() - start
+            self.busy += elapsed * in_flight / self.concurrency
+        else:
+            time.sleep(self.sleep_time)
+
+    def add_transfers(self):
+        """
+        Top up the multi handle with newly claimed messages until
+        concurrency transfers are in flight.
+        """
+
+        free = self.concurrency - len(self.transfers)
+
+        if free <= 0:
+            return
+
+        for receipt, message in self.claim_messages(free):
+            try:
+                headers = self.get_conditional_headers(message)
+                transfer = self.create_transfer(message['url'], headers)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                self.log.exception(e)
+                self.inbox_mailbox.ack(receipt)
+            else:
+                self.log.debug("GET: {}".format(message['url']))
+
+                transfer.message = message
+                transfer.receipt = receipt
+                transfer.start = time.time()
+
+                self.multi.add_handle(transfer.curl)
+                self.transfers[transfer.curl] = transfer
+
+    def perform_transfers(self):
+        self.multi.select(1.0)
+
+        while True:
+            ret, active = self.multi.perform()
+
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+
+        while True:
+            queued, succeeded, failed = self.multi.info_read()
+
+            for curl in succeeded:
+                self.complete_transfer(curl, True)
+
+            for curl, errno, errmsg in failed:
+                self.fail_transfer(curl, errno, errmsg)
+
+            if queued == 0:
+                break
+
+    def fail_transfer(self, curl, errno, errmsg):
+        transfer = self.transfers[curl]
+        scheme = transfer.metadata.scheme
+
+        if errno == pycurl.E_WRITE_ERROR:
+            self.complete_transfer(curl, -1)
+        elif all([
+            scheme == 'https',
+            errno == pycurl.E_SSL_PEER_CERTIFICATE,
+            not transfer.ssl_retried
+        ]):
+            # Same fallback as get_https, without blocking the other
+            # transfers.
+            transfer.ssl_retried = True
+            self.multi.remove_handle(curl)
+            curl.setopt(curl.SSL_VERIFYHOST, 0)
+            self.multi.add_handle(curl)
+        else:
+            self.log.warning(errmsg)
+            self.complete_transfer(curl, False)
+
+    def complete_transfer(self, curl, success):
+        self.multi.remove_handle(curl)
+        transfer = self.transfers.pop(curl)
+        message = transfer.message
+        result = None
+
+        try:
+            transfer_result = self.finish_transfer(transfer, success)
+            self.check_unchanged(message, transfer_result)
+            message.update(transfer_result)
+            result = message
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            self.log.exception(e)
+        finally:
+            self.export_fetcher_result(message, result)
+
+        self.inbox_mailbox.ack(transfer.receipt)
+        self.processed += 1
+
+    def drain_transfers(self):
+        while self.transfers:
+            self.perform_transfers()
+
+    def on_exit(self):
+        # Transfers in flight are finished before the worker goes, so their
+        # messages are exported and acknowledged.
+        if self.multi:
+            self.drain_transfers()
+            self.multi.close()
+
+        self.curl_pool.close()
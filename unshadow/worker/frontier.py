@@ -1,8 +1,17 @@
+from collections import Counter
 from urllib.parse import urlparse
 from time import time
 
+from unshadow import similarity
+from unshadow.cache import BloomFilter, LRUCache
 from unshadow.dispatch import Stage
 from unshadow.db import DatabaseClass
+from unshadow.scope import ScopeFilter
+from unshadow.urlnorm import normalize
+from unshadow.worker.scheduler import HostScheduler
+
+import json
+import os
 
 
 class Frontier(Stage, DatabaseClass):
@@ -13,6 +22,9 @@ class Frontier(Stage, DatabaseClass):
     ignore_outbox = True
     check_delay = 10
     domain_delay = 60
+    # Unemitted urls read per url the refill emits, as it emits one per
+    # domain.
+    refill_urls_per_domain = 4
 
     SCHEMA = """
         CREATE TABLE domain (
@@ -39,11 +51,6 @@ class Frontier(Stage, DatabaseClass):
                 REFERENCES domain (id) MATCH SIMPLE
         );
 
-        CREATE TABLE graph (
-            src VARCHAR NOT NULL,
-            dst VARCHAR NOT NULL
-        );
-
         CREATE INDEX domain_id_idx ON domain (id);
         CREATE INDEX url_last_emit_idx ON url (last_emit);
         CREATE INDEX domain_location_trgm_idx ON domain
@@ -54,246 +61,892 @@ class Frontier(Stage, DatabaseClass):
 
     """
 
+    REVISIT_SCHEMA = """
+        CREATE TABLE url_revisit (
+            id SERIAL NOT NULL PRIMARY KEY,
+            domain_id INTEGER NOT NULL,
+            url VARCHAR NOT NULL,
+            etag VARCHAR,
+            last_modified VARCHAR,
+            content_md5 VARCHAR,
+            interval INTEGER NOT NULL,
+            next_visit INTEGER NOT NULL,
+            visits INTEGER NOT NULL DEFAULT 1,
+            changes INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE UNIQUE INDEX url_revisit_url_md5_idx
+            ON url_revisit (md5(url));
+        CREATE INDEX url_revisit_next_visit_idx ON url_revisit (next_visit);
+    """
+
+    INDEX_SCHEMA = """
+        CREATE UNIQUE INDEX IF NOT EXISTS domain_location_idx
+            ON domain (location);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS url_url_md5_idx
+            ON url (md5(url));
+
+        CREATE INDEX IF NOT EXISTS url_unemitted_idx
+            ON url (domain_id) WHERE last_emit IS NULL;
+    """
+
+    # Links between domains, one row per pair with the number of links seen
+    # from pages of src to pages of dst.
+    EDGE_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS domain_edge (
+            src_id INTEGER NOT NULL,
+            dst_id INTEGER NOT NULL,
+            link_count BIGINT NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            PRIMARY KEY (src_id, dst_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS domain_edge_dst_id_idx
+            ON domain_edge (dst_id);
+    """
+
     def init(
         self,
         db_name=None,
         db_user=None,
         db_pass=None,
         db_host=None,
-        db_port=None
+        db_port=None,
+        domain_cache_size=100000,
+        url_filter_capacity=10000000,
+        url_filter_error_rate=0.001,
+        url_filter_path=None,
+        url_filter_warm=False,
+        max_delay=3600,
+        max_urls_per_host=1000,
+        latency_factor=10,
+        checkpoint_folder=None,
+        checkpoint_delay=60,
+        refill_delay=60,
+        recrawl=False,
+        recrawl_min_interval=86400,
+        recrawl_max_interval=2592000,
+        scope=None,
+        duplicate_rate=None,
+        duplicate_min_pages=20,
+        duplicate_refresh_delay=300
     ):
         self.db_name = db_name
         self.db_user = db_user
         self.db_pass = db_pass
         self.db_host = db_host
         self.db_port = db_port
+        self.domain_ids = LRUCache(domain_cache_size)
+        self.scope = scope or ScopeFilter()
+        self.url_filter_path = url_filter_path
+        self.url_filter_capacity = url_filter_capacity
+        self.url_filter_error_rate = url_filter_error_rate
+        self.url_filter_warm = url_filter_warm
+        self.checkpoint_folder = checkpoint_folder
+        self.checkpoint_delay = checkpoint_delay
+        self.refill_delay = refill_delay
+        self.next_checkpoint = int(time()) + checkpoint_delay
+        self.next_refill = 0
+        self.recrawl = recrawl
+        self.recrawl_min_interval = recrawl_min_interval
+        self.recrawl_max_interval = recrawl_max_interval
+        self.revisits = {}
+        self.duplicate_rate = duplicate_rate
+        self.duplicate_min_pages = duplicate_min_pages
+        self.duplicate_refresh_delay = duplicate_refresh_delay
+        self.next_duplicate_refresh = 0
+        self.duplicate_patterns = set()
+        self.scheduler = HostScheduler(
+            self.domain_delay,
+            max_delay,
+            max_urls_per_host=max_urls_per_host,
+            latency_factor=latency_factor
+        )
 
         self.setup_database('domain')
+        self.ensure_schema(self.INDEX_SCHEMA)
+        self.ensure_schema(self.EDGE_SCHEMA)
 
-    def on_message(self, message):
-        urls = message.get('urls', [])
-        title = message.get('title', None)
-        error = message.get('error', None)
-        server = message.get('server', None)
-        redirect = message.get('redirect', None)
-        rejected = message.get('rejected', None)
-        partial = message.get('partial', None)
-        http_code = message.get('http_code', None)
-        has_header = message.get('header', None) is not None
-        description = message.get('description', None)
-        origin = message['origin']
-        origin_location = urlparse(origin).netloc
-
-        # Update origin
-        self.update_origin(
-            origin,
-            origin_location,
-            title,
-            description,
-            has_header,
-            http_code,
-            error,
-            server,
-            rejected,
-            partial
+        if self.recrawl:
+            self.setup_database('url_revisit', self.REVISIT_SCHEMA)
+
+        if self.duplicate_rate is not None:
+            self.ensure_schema(similarity.URL_PATTERN_SCHEMA)
+
+        self.seen_urls = self.load_url_filter()
+
+        if self.checkpoint_folder:
+            os.makedirs(self.checkpoint_folder, exist_ok=True)
+            self.adopt_checkpoints()
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.checkpoint_folder, "{}.json".format(self.pid))
+
+    def adopt_checkpoints(self):
+        """
+        Take over the schedules left behind by frontiers that are gone.
+        """
+
+        for file_name in os.listdir(self.checkpoint_folder):
+            pid, extension = os.path.splitext(file_name)
+
+            if extension != '.json' or not pid.isdigit():
+                continue
+
+            if self.process_exists(int(pid)):
+                continue
+
+            path = os.path.join(self.checkpoint_folder, file_name)
+            claimed_path = "{}.{}".format(path, self.pid)
+
+            try:
+                os.rename(path, claimed_path)
+            except OSError:
+                continue
+
+            try:
+                self.load_checkpoint(claimed_path)
+            except (OSError, ValueError) as e:
+                self.log.warning(e)
+
+            os.remove(claimed_path)
+
+    def process_exists(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def save_checkpoint(self):
+        """
+        Write the schedule, with the validators of the revisits it holds,
+        for whichever frontier adopts it.
+        """
+
+        if not self.checkpoint_folder:
+            return
+
+        state = {
+            'hosts': self.scheduler.to_dict(),
+            'revisits': self.revisits
+        }
+
+        temp_path = "{}.tmp".format(self.checkpoint_path)
+
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(state))
+
+        os.replace(temp_path, self.checkpoint_path)
+
+    def load_checkpoint(self, path):
+        with open(path, 'r') as f:
+            state = json.loads(f.read())
+
+        # Checkpoints written before revisits were saved only hold hosts.
+        if 'hosts' in state:
+            hosts, revisits = state['hosts'], state['revisits']
+        else:
+            hosts, revisits = state, {}
+
+        rejected = set(self.scheduler.merge(hosts))
+        self.revisits.update(
+            (url, message) for url, message in revisits.items()
+            if url not in rejected
         )
 
-        for url in urls:
-            location = urlparse(url).netloc
+        with self.get_cursor() as cursor:
+            self.reset_revisits(
+                cursor,
+                int(time()),
+                [url for url in revisits if url in rejected]
+            )
+
+    HAS_URLS_QUERY = """
+        SELECT EXISTS (SELECT 1 FROM url)
+    """
 
-            if location.endswith(".onion"):
-                # Update Domain
-                domain_id = self.set_or_update_domain(location)
+    def load_url_filter(self):
+        """
+        Load the persisted seen-url filter. It is rebuilt when it's past its
+        capacity, as its false positives would silently drop new urls, or
+        when the url table is empty, as it would drop every url it has
+        seen.
+        """
+
+        path = self.url_filter_path
+
+        if path and os.path.exists(path):
+            try:
+                persisted = BloomFilter.load(path)
+            except (OSError, ValueError) as e:
+                self.log.warning(e)
+            else:
+                with self.get_cursor() as cursor:
+                    cursor.execute(self.HAS_URLS_QUERY)
+                    has_urls = cursor.fetchone()[0]
 
-                # Update URL
-                self.set_or_update_url(url, domain_id)
+                self.db.commit()
+
+                if all([
+                    persisted.compatible(self.create_url_filter()),
+                    persisted.count < self.url_filter_capacity,
+                    has_urls
+                ]):
+                    return persisted
+
+        return self.build_url_filter()
+
+    def create_url_filter(self):
+        return BloomFilter(
+            self.url_filter_capacity,
+            self.url_filter_error_rate
+        )
+
+    def build_url_filter(self):
+        """
+        A new filter, optionally filled from the url table.
+        """
+
+        seen_urls = self.create_url_filter()
+
+        if self.url_filter_warm:
+            self.warm_url_filter(seen_urls)
+
+        return seen_urls
+
+    # The filter is filled to half its capacity at most, the urls left out
+    # are only checked against the table.
+    WARM_URLS_QUERY = """
+        SELECT url FROM url LIMIT %s
+    """
 
-                # Update graph
-                self.update_graph(origin_location, location)
+    def warm_url_filter(self, seen_urls):
+        with self.db.cursor(name='warm_url_filter') as cursor:
+            cursor.itersize = 10000
+            cursor.execute(
+                self.WARM_URLS_QUERY,
+                (self.url_filter_capacity // 2,)
+            )
 
-    def update_origin(
+            for row in cursor:
+                seen_urls.add(row[0])
+
+        self.db.commit()
+
+    def check_url_filter(self):
+        if self.seen_urls.count < self.url_filter_capacity:
+            return
+
+        self.log.info("Url filter past its capacity of {}, rebuilding".format(
+            self.url_filter_capacity
+        ))
+        self.seen_urls = self.build_url_filter()
+
+    def on_exit(self):
+        self.save_checkpoint()
+
+        # Without a checkpoint, no other frontier takes over the revisits
+        # this one holds.
+        if not self.checkpoint_folder and self.revisits:
+            with self.get_cursor() as cursor:
+                self.reset_revisits(cursor, int(time()), list(self.revisits))
+
+        if not self.url_filter_path:
+            return
+
+        # Fold in whatever other frontiers persisted since we loaded. A
+        # merged filter past its capacity is rebuilt by the next frontier
+        # that loads it.
+        if os.path.exists(self.url_filter_path):
+            try:
+                persisted = BloomFilter.load(self.url_filter_path)
+            except (OSError, ValueError):
+                pass
+            else:
+                if persisted.compatible(self.seen_urls):
+                    self.seen_urls.update(persisted)
+
+        self.seen_urls.save(self.url_filter_path)
+
+    def on_message(self, message):
+        self.ingest([message])
+
+    def on_batch(self, messages):
+        self.ingest(messages)
+
+    def ingest(self, messages):
+        """
+        Store the origins, links and graph edges of a batch of extractor
+        messages in one transaction.
+        """
+
+        now = int(time())
+        domains = {}
+        origins = {}
+        links = {}
+        edges = []
+        fetches = []
+        visits = {}
+
+        for message in messages:
+            error = message.get('error', None)
+            has_header = message.get('header', None) is not None
+            origin = message['origin']
+            origin_location = urlparse(origin).netloc
+
+            domains[origin_location] = has_header and not error
+            fetches.append((
+                origin_location,
+                message.get('elapsed_time', None) or 0,
+                bool(error)
+            ))
+            origins[origin] = (
+                origin_location,
+                message.get('title', None),
+                message.get('description', None),
+                message.get('http_code', None),
+                message.get('server', None),
+                message.get('rejected', None),
+                message.get('partial', None)
+            )
+
+            if message.get('http_code', None) is not None:
+                visits[origin] = (
+                    origin_location,
+                    message.get('etag', None),
+                    message.get('last_modified', None),
+                    message.get('content_md5', None),
+                    bool(message.get('not_modified', None))
+                )
+
+            # Urls are deduplicated on their canonical form. Links from the
+            # extractor are canonical already and only cost a regex match.
+            for url in set(map(normalize, message.get('urls', []))):
+                if url is None:
+                    continue
+
+                location = urlparse(url).netloc
+
+                if self.scope.allows(url):
+                    domains.setdefault(location, None)
+                    links[url] = location
+                    edges.append((origin_location, location))
+
+        # Links known to this worker already have a row.
+        links = {
+            url: location
+            for url, location in links.items()
+            if url not in self.seen_urls
+        }
+
+        with self.get_cursor() as cursor:
+            domain_ids = self.upsert_domains(cursor, domains, now)
+
+            self.upsert_origins(cursor, origins, domain_ids, now)
+            new_urls = self.insert_urls(cursor, links, domain_ids)
+            self.upsert_edges(cursor, edges, domain_ids, now)
+
+            if self.recrawl:
+                self.update_revisits(cursor, visits, domain_ids, now)
+
+            self.db.commit()
+
+        self.schedule(domains, domain_ids, new_urls, links, edges, fetches, now)
+
+        for location, domain_id in domain_ids.items():
+            self.domain_ids.set(location, domain_id)
+
+        for url in links:
+            self.seen_urls.add(url)
+
+        for url in origins:
+            self.seen_urls.add(url)
+
+    def schedule(
         self,
-        origin,
-        location,
-        title,
-        description,
-        has_header,
-        http_code,
-        error,
-        server,
-        rejected,
-        partial
+        domains,
+        domain_ids,
+        new_urls,
+        links,
+        edges,
+        fetches,
+        now
     ):
-        accessible = has_header and not error
-        # Set or update domain
-        domain_id = self.set_or_update_domain(location, accessible=accessible)
+        for location, elapsed_time, error in fetches:
+            self.scheduler.record_fetch(
+                domain_ids[location],
+                now,
+                elapsed_time,
+                error
+            )
+
+        # Revisits of inaccessible domains wait for their next interval.
+        for location, accessible in domains.items():
+            if accessible is False:
+                for url in self.scheduler.drop(domain_ids[location]):
+                    self.revisits.pop(url, None)
+
+        for url in new_urls:
+            later = bool(self.duplicate_patterns) and (
+                similarity.url_pattern(url) in self.duplicate_patterns
+            )
+
+            self.scheduler.add(domain_ids[links[url]], url, later)
+
+        for src, dst in edges:
+            if src != dst:
+                self.scheduler.add_priority(domain_ids[dst])
+
+    UPSERT_DOMAINS_QUERY = """
+        INSERT INTO domain (location, found, last_seen, accessible)
+        VALUES {}
+        ON CONFLICT (location) DO UPDATE SET
+            last_seen = EXCLUDED.last_seen,
+            accessible = COALESCE(EXCLUDED.accessible, domain.accessible)
+        RETURNING location, id
+    """
 
-        # Set or update url
-        self.set_or_update_url(
-            origin,
-            domain_id,
-            visited=True,
-            title=title,
-            description=description,
-            http_code=http_code,
-            server=server,
-            rejected=rejected,
-            partial=partial
+    TOUCH_DOMAINS_QUERY = """
+        UPDATE domain SET last_seen = %s WHERE id = ANY(%s)
+    """
+
+    def upsert_domains(self, cursor, domains, now):
+        """
+        Create or touch every domain, returns a location to id mapping.
+        Cached domains that don't change accessibility are only touched.
+        """
+
+        domain_ids = {}
+        upserts = []
+
+        for location in domains:
+            domain_id = self.domain_ids.get(location)
+
+            if domain_id is None or domains[location] is not None:
+                upserts.append(location)
+            else:
+                domain_ids[location] = domain_id
+
+        if domain_ids:
+            touched = sorted(domain_ids.values())
+            cursor.execute(self.TOUCH_DOMAINS_QUERY, (now, touched))
+
+        rows = [
+            (location, now, now, domains[location])
+            for location in sorted(upserts)
+        ]
+
+        result = self.execute_values(
+            cursor,
+            self.UPSERT_DOMAINS_QUERY,
+            "(%s, %s, %s, %s)",
+            rows
         )
 
-    GET_DOMAIN_QUERY = """
-        SELECT id FROM domain WHERE location = %s
+        domain_ids.update(result)
+
+        return domain_ids
+
+    INSERT_URLS_QUERY = """
+        INSERT INTO url (domain_id, url) VALUES {}
+        ON CONFLICT (md5(url)) DO NOTHING
+        RETURNING url
     """
 
-    UPDATE_DOMAIN_QUERY = """
-        UPDATE domain SET last_seen = %s WHERE id = %s
+    def insert_urls(self, cursor, links, domain_ids):
+        """
+        Insert links, returns the urls that didn't exist yet.
+        """
+
+        rows = [(domain_ids[links[url]], url) for url in sorted(links)]
+        result = self.execute_values(
+            cursor,
+            self.INSERT_URLS_QUERY,
+            "(%s, %s)",
+            rows
+        )
+
+        return [i[0] for i in result]
+
+    UPSERT_ORIGINS_QUERY = """
+        INSERT INTO url (
+            domain_id,
+            url,
+            title,
+            description,
+            http_code,
+            http_server,
+            rejected,
+            partial,
+            last_visited
+        )
+        VALUES {}
+        ON CONFLICT (md5(url)) DO UPDATE SET
+            last_visited = EXCLUDED.last_visited,
+            http_code = EXCLUDED.http_code,
+            http_server = EXCLUDED.http_server,
+            rejected = EXCLUDED.rejected,
+            partial = EXCLUDED.partial
     """
 
-    UPDATE_DOMAIN_WITH_ACCESSIBLE_QUERY = """
-        UPDATE domain SET last_seen = %s, accessible = %s WHERE id = %s
+    def upsert_origins(self, cursor, origins, domain_ids, now):
+        # TODO, this does not display history
+        rows = []
+
+        for url in sorted(origins):
+            location, title, description, *fetch = origins[url]
+            domain_id = domain_ids[location]
+            rows.append((domain_id, url, title, description, *fetch, now))
+
+        self.execute_values(
+            cursor,
+            self.UPSERT_ORIGINS_QUERY,
+            "(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows
+        )
+
+    UPSERT_EDGES_QUERY = """
+        INSERT INTO domain_edge (
+            src_id,
+            dst_id,
+            link_count,
+            first_seen,
+            last_seen
+        )
+        VALUES {}
+        ON CONFLICT (src_id, dst_id) DO UPDATE SET
+            link_count = domain_edge.link_count + EXCLUDED.link_count,
+            last_seen = EXCLUDED.last_seen
     """
 
-    CREATE_DOMAIN_QUERY = """
-        INSERT INTO domain (location, found, last_seen, accessible)
-        VALUES (%s, %s, %s, %s)
+    def upsert_edges(self, cursor, edges, domain_ids, now):
+        """
+        Add the links of a batch to the weights of their domain edges.
+        """
+
+        link_counts = Counter(
+            (domain_ids[src], domain_ids[dst]) for src, dst in edges
+        )
+
+        rows = [
+            (src_id, dst_id, link_count, now, now)
+            for (src_id, dst_id), link_count in sorted(link_counts.items())
+        ]
+
+        self.execute_values(
+            cursor,
+            self.UPSERT_EDGES_QUERY,
+            "(%s, %s, %s, %s, %s)",
+            rows
+        )
+
+    GET_REVISITS_QUERY = """
+        SELECT url, interval, content_md5 FROM url_revisit
+        WHERE md5(url) IN (SELECT md5(u) FROM unnest(%s::varchar[]) AS u)
     """
 
-    def set_or_update_domain(self, location, accessible=None):
-        with self.get_cursor() as cursor:
-            cursor.execute(self.GET_DOMAIN_QUERY, (location,))
+    UPSERT_REVISITS_QUERY = """
+        INSERT INTO url_revisit (
+            domain_id,
+            url,
+            etag,
+            last_modified,
+            content_md5,
+            interval,
+            next_visit,
+            changes
+        )
+        VALUES {}
+        ON CONFLICT (md5(url)) DO UPDATE SET
+            etag = EXCLUDED.etag,
+            last_modified = EXCLUDED.last_modified,
+            content_md5 = EXCLUDED.content_md5,
+            interval = EXCLUDED.interval,
+            next_visit = EXCLUDED.next_visit,
+            visits = url_revisit.visits + 1,
+            changes = url_revisit.changes + EXCLUDED.changes
+    """
 
-            result = cursor.fetchall()
+    def update_revisits(self, cursor, visits, domain_ids, now):
+        """
+        Store the validators of visited urls and schedule their next visit.
+        The interval halves when a page changed and doubles when it didn't.
+        """
 
-            if result:
-                _id = result[0][0]
+        if not visits:
+            return
 
-                if accessible is not None:
-                    update_query = self.UPDATE_DOMAIN_WITH_ACCESSIBLE_QUERY
-                    update_args = (int(time()), accessible, _id)
-                else:
-                    update_query = self.UPDATE_DOMAIN_QUERY
-                    update_args = (int(time()), _id)
+        urls = sorted(visits)
+        cursor.execute(self.GET_REVISITS_QUERY, (urls,))
+        previous = {i[0]: i[1:] for i in cursor.fetchall()}
+        rows = []
 
-                cursor.execute(update_query, update_args)
-                self.db.commit()
-            else:
-                now = int(time())
-                params = (location, now, now, accessible)
-                cursor.execute(self.CREATE_DOMAIN_QUERY, params)
-                self.db.commit()
+        for url in urls:
+            location, etag, last_modified, content_md5, not_modified = \
+                visits[url]
+            interval = self.recrawl_min_interval
+            changes = 0
 
-                cursor.execute(self.GET_DOMAIN_QUERY, (location,))
-                result = cursor.fetchall()
-                _id = result[0][0]
+            if url in previous:
+                previous_interval, previous_md5 = previous[url]
 
-        return _id
+                if not_modified:
+                    content_md5 = previous_md5
 
-    GET_URL_QUERY = """
-        SELECT 1 FROM url WHERE url = %s
-    """
+                if content_md5 == previous_md5:
+                    interval = previous_interval * 2
+                else:
+                    interval = previous_interval // 2
+                    changes = 1
+
+                interval = min(self.recrawl_max_interval, interval)
+                interval = max(self.recrawl_min_interval, interval)
+
+            rows.append((
+                domain_ids[location],
+                url,
+                etag,
+                last_modified,
+                content_md5,
+                interval,
+                now + interval,
+                changes
+            ))
+
+        self.execute_values(
+            cursor,
+            self.UPSERT_REVISITS_QUERY,
+            "(%s, %s, %s, %s, %s, %s, %s, %s)",
+            rows
+        )
 
-    UPDATE_URL_QUERY = """
-        UPDATE url SET
-        last_visited = %s,
-        http_code = %s,
-        http_server = %s,
-        rejected = %s,
-        partial = %s
-        WHERE url = %s
+    CLAIM_REVISITS_QUERY = """
+        UPDATE url_revisit SET next_visit = %s + interval
+        WHERE id IN (
+            SELECT id FROM url_revisit
+            WHERE next_visit <= %s
+            ORDER BY next_visit
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING domain_id, url, etag, last_modified, content_md5
     """
 
-    CREATE_URL_QUERY = """
-        INSERT INTO url (domain_id, url, title, description, http_code, http_server, rejected, partial)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    RESET_REVISITS_QUERY = """
+        UPDATE url_revisit SET next_visit = %s
+        WHERE md5(url) IN (SELECT md5(u) FROM unnest(%s::varchar[]) AS u)
     """
 
-    def set_or_update_url(
-        self,
-        url,
-        domain_id,
-        visited=False,
-        title=None,
-        description=None,
-        http_code=None,
-        server=None,
-        rejected=None,
-        partial=None
-    ):
-        with self.get_cursor() as cursor:
-            cursor.execute(self.GET_URL_QUERY, (url,))
+    def schedule_revisits(self, cursor, now, count):
+        """
+        Move up to count urls that are due for a revisit into the scheduler.
+        """
+
+        cursor.execute(self.CLAIM_REVISITS_QUERY, (now, now, count))
+        revisits = cursor.fetchall()
+        rejected = []
+
+        for domain_id, url, etag, last_modified, content_md5 in revisits:
+            if self.scheduler.add(domain_id, url):
+                self.revisits[url] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "content_md5": content_md5
+                }
+            else:
+                rejected.append(url)
 
-            result = cursor.fetchall()
-            now = int(time())
+        self.reset_revisits(cursor, now, rejected)
 
-            if not result:
-                create_args = (domain_id, url, title, description, http_code, server, rejected, partial)
-                cursor.execute(self.CREATE_URL_QUERY, create_args)
-                self.db.commit()
+    def reset_revisits(self, cursor, now, urls):
+        """
+        Give back claimed revisits that won't be emitted, they are due
+        again once their domain's delay has passed.
+        """
 
-            if visited:
-                # TODO, this does not display history
-                update_args = (now, http_code, server, rejected, partial, url)
-                cursor.execute(self.UPDATE_URL_QUERY, update_args)
+        if urls and self.recrawl:
+            params = (now + self.domain_delay, sorted(urls))
+            cursor.execute(self.RESET_REVISITS_QUERY, params)
 
-                self.db.commit()
+        self.db.commit()
 
-    UPDATE_GRAPH_QUERY = """
-        INSERT INTO graph (src, dst) VALUES (%s, %s)
+    GET_DUPLICATE_PATTERNS_QUERY = """
+        SELECT pattern FROM url_pattern
+        WHERE pages >= %s AND duplicates >= pages * %s
     """
 
-    def update_graph(self, src, dst):
-        with self.get_cursor() as cursor:
-            cursor.execute(self.UPDATE_GRAPH_QUERY, (src, dst))
-
-    GET_NEXT_DOMAINS_QUERY = """
-        SELECT
-            DISTINCT ON (domain.id)
-            domain.id,
-            url.url
-        FROM domain
-        JOIN url ON url.domain_id = domain.id
+    def load_duplicate_patterns(self, cursor, now):
+        """
+        Reload the url patterns whose pages mostly turned out to be near
+        duplicates, their new urls are scheduled after the others of their
+        domain.
+        """
+
+        if now < self.next_duplicate_refresh:
+            return
+
+        self.next_duplicate_refresh = now + self.duplicate_refresh_delay
+        params = (self.duplicate_min_pages, self.duplicate_rate)
+        cursor.execute(self.GET_DUPLICATE_PATTERNS_QUERY, params)
+        self.duplicate_patterns = set(row[0] for row in cursor)
+        self.db.commit()
+
+    # Walks the unemitted urls through their partial index and stops at
+    # the limit, instead of joining every url to sort them by domain.
+    GET_UNEMITTED_URLS_QUERY = """
+        SELECT url.domain_id, url.url
+        FROM url
+        JOIN domain ON domain.id = url.domain_id
         WHERE
-            (domain.last_emit < %s  OR domain.last_emit IS NULL) AND
-            (domain.accessible IS NULL OR domain.accessible = TRUE) AND
-            url.last_emit IS NULL
+            url.last_emit IS NULL AND
+            (domain.last_emit < %s OR domain.last_emit IS NULL) AND
+            (domain.accessible IS NULL OR domain.accessible = TRUE)
         LIMIT %s
     """
 
     def on_check(self):
+        now = int(time())
+        space = self.outbox_space or 0
+        emitted = 0
+
+        self.check_url_filter()
+
         with self.get_cursor() as cursor:
-            now = int(time())
-            delay_threshold = now - self.domain_delay
-            params = (delay_threshold, self.outbox_space)
+            if self.duplicate_rate is not None:
+                self.load_duplicate_patterns(cursor, now)
+
+            if self.recrawl and space > len(self.scheduler):
+                self.schedule_revisits(cursor, now, space)
+
+            candidates = self.scheduler.pop_ready(now, space)
+
+            if candidates:
+                emitted = self.emit_scheduled(cursor, now, candidates)
+
+            # Urls that no scheduler holds, such as those found before a
+            # restart, are still picked up by scanning now and then.
+            if emitted < space and now >= self.next_refill:
+                self.next_refill = now + self.refill_delay
+                self.refill(cursor, now, space - emitted)
+
+        if now >= self.next_checkpoint:
+            self.next_checkpoint = now + self.checkpoint_delay
 
-            cursor.execute(self.GET_NEXT_DOMAINS_QUERY, params)
-            domains = cursor.fetchall()
+            # Frontiers stopped while the others run, when their pool is
+            # scaled down, leave their schedules to the remaining ones.
+            if self.checkpoint_folder:
+                self.adopt_checkpoints()
 
-            if domains:
-                self.emit_domains(cursor, now, domains)
+            self.save_checkpoint()
 
-    URL_EMIT_QUERY = """
+    CLAIM_DOMAINS_QUERY = """
+        UPDATE domain SET last_emit = %s
+        WHERE
+            id = ANY(%s) AND
+            (last_emit < %s OR last_emit IS NULL) AND
+            (accessible IS NULL OR accessible = TRUE)
+        RETURNING id
+    """
+
+    CLAIM_URLS_QUERY = """
         UPDATE url SET last_emit = %s
-        WHERE url = %s
+        FROM unnest(%s::varchar[]) AS emit (url)
+        WHERE
+            md5(url.url) = md5(emit.url) AND
+            url.url = emit.url AND
+            url.last_emit IS NULL
+        RETURNING url.url
     """
 
-    DOMAIN_EMIT_QUERY = """
-        UPDATE domain SET last_emit = %s
-        WHERE id = %s
+    RELEASE_URLS_QUERY = """
+        UPDATE url SET last_emit = NULL
+        FROM unnest(%s::varchar[]) AS emit (url)
+        WHERE
+            md5(url.url) = md5(emit.url) AND
+            url.url = emit.url
     """
 
-    def emit_domains(self, cursor, now, domains):
-        # TODO mogrify instead of doing executemany
-        # Set last emit for urls.
-        url_emit_params = [(now, i[1]) for i in domains]
-        domain_emit_params = [(now, i[0]) for i in domains]
+    def emit_scheduled(self, cursor, now, candidates, defer=True):
+        """
+        Emit the (domain_id, url) candidates whose url no other frontier
+        emitted and whose domain's delay has passed. Urls are claimed
+        before their domains, so a url emitted elsewhere in the meantime
+        doesn't use up its domain's delay. Urls whose domain isn't ready
+        go back to the scheduler when defer is set. Returns the emitted
+        count.
+        """
+
+        # Revisits were claimed when they were scheduled.
+        new_urls = sorted(set(
+            url for domain_id, url in candidates if url not in self.revisits
+        ))
+
+        cursor.execute(self.CLAIM_URLS_QUERY, (now, new_urls))
+        claimed_urls = set(i[0] for i in cursor.fetchall())
+        claimed_urls.update(url for domain_id, url in candidates
+                            if url in self.revisits)
+
+        candidates = [i for i in candidates if i[1] in claimed_urls]
+        delay_threshold = now - self.domain_delay
+        domain_ids = sorted(set(i[0] for i in candidates))
+
+        params = (now, domain_ids, delay_threshold)
+        cursor.execute(self.CLAIM_DOMAINS_QUERY, params)
+        claimed_domains = set(i[0] for i in cursor.fetchall())
+
+        released = sorted(
+            url for domain_id, url in candidates
+            if domain_id not in claimed_domains and url not in self.revisits
+        )
 
-        cursor.executemany(self.URL_EMIT_QUERY, url_emit_params)
-        cursor.executemany(self.DOMAIN_EMIT_QUERY, domain_emit_params)
+        if released:
+            cursor.execute(self.RELEASE_URLS_QUERY, (released,))
 
         self.db.commit()
-        # Push a set number of them out, depending on the outbox size.
 
-        for domain_id, url in domains:
-            self.write_result({
-                "url": url
-            }, prefix="0-")
+        messages = []
+
+        for domain_id, url in candidates:
+            if domain_id not in claimed_domains:
+                if defer:
+                    until = now + self.domain_delay
+                    self.scheduler.defer(domain_id, url, until)
+
+                continue
+
+            message = self.revisits.pop(url, {})
+            message['url'] = url
+            messages.append(message)
+
+        self.write_results(messages, priority=0)
+
+        return len(messages)
+
+    def refill(self, cursor, now, count):
+        """
+        Emit up to count unemitted urls, one per domain. Urls that a
+        scheduler holds as well are emitted once, by whichever frontier
+        claims them first.
+        """
+
+        delay_threshold = now - self.domain_delay
+        params = (delay_threshold, count * self.refill_urls_per_domain)
+        cursor.execute(self.GET_UNEMITTED_URLS_QUERY, params)
+
+        candidates = {}
+
+        for domain_id, url in cursor.fetchall():
+            candidates.setdefault(domain_id, url)
+
+            if len(candidates) >= count:
+                break
+
+        if candidates:
+            self.emit_scheduled(cursor, now, list(candidates.items()), False)
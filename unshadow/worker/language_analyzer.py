@@ -1,27 +1,20 @@
 import urllib
-import lxml.html
 import os
-import string
 import math
-import json
 
 
-from unshadow.dispatch import Stage
-from lxml.html.clean import clean_html
-from nltk.corpus import stopwords
-from nltk import word_tokenize
 from collections import Counter
-from heapq import nlargest
+from unshadow import corpus
+from unshadow import similarity
+from unshadow.cache import LRUCache
+from unshadow.content_store import ContentStore
+from unshadow.dispatch import Stage
+from unshadow.worker import page
+from unshadow.worker import language_id
+from unshadow.worker import terms
 from urllib.parse import urlparse
-from operator import itemgetter
 from unshadow.db import DatabaseClass
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
-
-
-PUNCTUATION_MAP = str.maketrans({i: ' ' for i in string.punctuation})
-STOPWORDS = stopwords.words('english')
-BAD_TAGS = ['script', 'style']
+from unshadow.worker.language_id import LanguageIdentifier
 
 
 class LanguageAnalyzer(Stage, DatabaseClass):
@@ -31,6 +24,7 @@ class LanguageAnalyzer(Stage, DatabaseClass):
 
     SCHEMA = """
         CREATE TABLE fingerprint (
+            id SERIAL NOT NULL PRIMARY KEY,
             url VARCHAR NOT NULL,
             domain VARCHAR NOT NULL,
             language VARCHAR,
@@ -38,9 +32,118 @@ class LanguageAnalyzer(Stage, DatabaseClass):
         );
     """
 
-    INSERT_ID_QUERY = """
-        INSERT INTO fingerprint (domain, url, language, term_frequency)
-        VALUES (%s, %s, %s, %s)
+    # Term frequencies are stored as postings of a term dictionary. The
+    # term_frequency column only holds rows written before, see
+    # utils/backfill_postings.py.
+    TERM_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS term (
+            id SERIAL NOT NULL PRIMARY KEY,
+            term VARCHAR NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS posting (
+            term_id INTEGER NOT NULL,
+            fingerprint_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (term_id, fingerprint_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS term_statistic (
+            term_id INTEGER NOT NULL PRIMARY KEY,
+            document_count BIGINT NOT NULL,
+            term_count BIGINT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS corpus_statistic (
+            name VARCHAR NOT NULL PRIMARY KEY,
+            value BIGINT NOT NULL
+        );
+
+        CREATE UNIQUE INDEX IF NOT EXISTS term_term_idx ON term (term);
+        CREATE INDEX IF NOT EXISTS posting_fingerprint_id_idx
+            ON posting (fingerprint_id);
+        CREATE INDEX IF NOT EXISTS fingerprint_domain_idx
+            ON fingerprint (domain);
+    """
+
+    # SimHash signatures of the fingerprinted pages, looked up by band to
+    # find near duplicates.
+    SIGNATURE_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS page_signature (
+            fingerprint_id INTEGER NOT NULL PRIMARY KEY,
+            signature BIGINT NOT NULL,
+            bands BIGINT[] NOT NULL,
+            duplicate_of INTEGER
+        );
+
+        CREATE INDEX IF NOT EXISTS page_signature_bands_idx
+            ON page_signature USING gin (bands);
+    """
+
+    # Longer terms are mostly encoded data and would not fit in the index.
+    MAX_TERM_LENGTH = 200
+
+    # RETURNING isn't guaranteed to follow the VALUES order, so ids are
+    # drawn first and returned with the position of their row.
+    INSERT_FINGERPRINTS_QUERY = """
+        WITH
+            fingerprints (n, domain, url, language) AS (VALUES {}),
+            ids AS (
+                SELECT
+                    n,
+                    nextval(pg_get_serial_sequence('fingerprint', 'id')) AS id
+                FROM fingerprints
+            ),
+            inserted AS (
+                INSERT INTO fingerprint (id, domain, url, language)
+                SELECT ids.id, domain, url, language
+                FROM fingerprints JOIN ids USING (n)
+            )
+        SELECT n, id FROM ids
+    """
+
+    INSERT_TERMS_QUERY = """
+        INSERT INTO term (term) VALUES {}
+        ON CONFLICT (term) DO NOTHING
+        RETURNING term, id
+    """
+
+    GET_TERMS_QUERY = """
+        SELECT term, id FROM term WHERE term = ANY(%s)
+    """
+
+    INSERT_POSTINGS_QUERY = """
+        INSERT INTO posting (term_id, fingerprint_id, count) VALUES {}
+    """
+
+    FIND_DUPLICATE_QUERY = """
+        SELECT page_signature.fingerprint_id
+        FROM page_signature
+        JOIN fingerprint ON fingerprint.id = page_signature.fingerprint_id
+        WHERE
+            page_signature.bands && %s::bigint[] AND
+            fingerprint.url <> %s AND
+            length(replace(
+                (page_signature.signature # %s)::bit(64)::text, '0', ''
+            )) <= %s
+        LIMIT 1
+    """
+
+    INSERT_SIGNATURES_QUERY = """
+        INSERT INTO page_signature (
+            fingerprint_id,
+            signature,
+            bands,
+            duplicate_of
+        )
+        VALUES {}
+    """
+
+    UPSERT_URL_PATTERNS_QUERY = """
+        INSERT INTO url_pattern (pattern, pages, duplicates) VALUES {}
+        ON CONFLICT (pattern) DO UPDATE SET
+            pages = url_pattern.pages + EXCLUDED.pages,
+            duplicates = url_pattern.duplicates + EXCLUDED.duplicates
     """
 
     def init(
@@ -50,87 +153,329 @@ class LanguageAnalyzer(Stage, DatabaseClass):
         db_user=None,
         db_pass=None,
         db_host=None,
-        db_port=None
+        db_port=None,
+        content_store=None,
+        language_backend='langdetect',
+        language_sample_size=2000,
+        language_max_sample_size=32000,
+        language_confidence=0.95,
+        language_domain_confidence=0.8,
+        language_cache_size=100000,
+        term_cache_size=100000,
+        statistics_flush_delay=60,
+        duplicate_distance=3
     ):
         self.tf_limit = tf_limit
+        self.duplicate_distance = duplicate_distance
+        self.term_ids = LRUCache(term_cache_size)
+        self.document_frequencies = corpus.DocumentFrequencies()
+        self.check_delay = statistics_flush_delay
+        self.language_identifier = LanguageIdentifier(
+            language_backend,
+            language_sample_size,
+            language_max_sample_size,
+            language_confidence,
+            language_domain_confidence,
+            language_cache_size
+        )
+        self.content_store = None
         self.db_name = db_name
         self.db_user = db_user
         self.db_pass = db_pass
         self.db_host = db_host
         self.db_port = db_port
 
+        if content_store:
+            self.content_store = ContentStore(content_store)
+
         self.setup_database('fingerprint')
+        self.ensure_schema(self.TERM_SCHEMA)
+        self.ensure_schema(self.SIGNATURE_SCHEMA)
+        self.ensure_schema(similarity.URL_PATTERN_SCHEMA)
+
+    @classmethod
+    def warm_up(cls, language_backend='langdetect', **kwargs):
+        language_id.get_backend(language_backend)
+        terms.load_tokenizer()
 
     def on_message(self, message):
+        fingerprint = self.get_fingerprint(message)
+
+        if fingerprint:
+            self.insert_fingerprints([fingerprint])
+
+        self.remove_content(message)
+
+    def on_check(self):
+        self.document_frequencies.flush(self)
+
+    def on_exit(self):
+        self.document_frequencies.flush(self)
+
+    def on_batch(self, messages):
+        fingerprints = []
+
+        for message in messages:
+            try:
+                fingerprint = self.get_fingerprint(message)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                self.log.exception(e)
+            else:
+                if fingerprint:
+                    fingerprints.append(fingerprint)
+
+        self.insert_fingerprints(fingerprints)
+
+        # Content is only removed once the batch is stored, so a failed
+        # insert can be retried message by message.
+        for message in messages:
+            self.remove_content(message)
+
+    def get_fingerprint(self, message):
         origin_url = message['origin']
         content_path = message.get('content_path', None)
+        content_md5 = message.get('content_md5', None)
+        analysis = None
+
+        if not content_path:
+            return None
+
+        if self.content_store:
+            analysis = self.get_cached_analysis(content_md5)
+
+        if analysis is None:
+            analysis = self.analyze(
+                content_path,
+                content_md5,
+                urlparse(origin_url).netloc
+            )
+
+            if self.content_store:
+                self.content_store.set_result(
+                    'analysis',
+                    content_md5,
+                    analysis
+                )
+
+        language, term_frequency, signature = analysis
+
+        if language:
+            return origin_url, term_frequency, language, signature
+
+    def get_cached_analysis(self, content_md5):
+        analysis = self.content_store.get_result('analysis', content_md5)
+
+        # Analyses cached before pages were signed are done again.
+        if analysis is None or len(analysis) < 3:
+            return None
+
+        return analysis
+
+    def analyze(self, content_path, content_md5=None, domain=None):
+        """
+        Language, term frequency and SimHash signature of a page, as a
+        [language, tf, signature] list.
+        """
+
+        document = page.load_document(content_path)
+
+        return self.analyze_document(document, content_md5, domain)
+
+    def analyze_document(self, document, content_md5=None, domain=None):
         language = None
         term_frequency = None
- 
-        if content_path:
-            descriptor = open(content_path, 'rb')
-            words = self.get_words(descriptor)
+        signature = None
+        words = page.get_text(document)
 
-            if words:
-                language = self.get_language(words)
+        if words:
+            language = self.get_language(words, content_md5, domain)
 
-                if language == "en":
-                    term_frequency = self.find_tf(words)
+        if language:
+            term_counts = terms.count_terms(words)
+            signature = similarity.simhash(term_counts)
 
-                if language:
-                    self.insert_fingerprint(origin_url, term_frequency, language)
-                
+            if language == "en":
+                term_frequency = self.find_tf(term_counts)
+
+        return [language, term_frequency, signature]
+
+    def remove_content(self, message):
+        content_path = message.get('content_path', None)
+
+        if content_path and os.path.exists(content_path):
             os.remove(content_path)
 
-    def insert_fingerprint(self, url, tf, language):
-        domain = urlparse(url).netloc
+    def insert_fingerprints(self, fingerprints):
+        if not fingerprints:
+            return
+
+        rows = [
+            (n, urlparse(url).netloc, url, language)
+            for n, (url, tf, language, signature) in enumerate(fingerprints)
+        ]
 
         with self.get_cursor() as cursor:
-            args = (domain, url, language, json.dumps(tf))
-            cursor.execute(self.INSERT_ID_QUERY, args)
+            result = dict(self.execute_values(
+                cursor,
+                self.INSERT_FINGERPRINTS_QUERY,
+                "(%s, %s, %s, %s)",
+                rows
+            ))
+            fingerprint_ids = [result[n] for n in range(len(fingerprints))]
+
+            term_frequencies = [
+                (fingerprint_id, [
+                    (term, count) for term, count in tf or []
+                    if len(term) <= self.MAX_TERM_LENGTH
+                ])
+                for fingerprint_id, (url, tf, language, signature)
+                in zip(fingerprint_ids, fingerprints)
+            ]
+
+            terms = set(
+                term for fingerprint_id, tf in term_frequencies
+                for term, count in tf
+            )
+            term_ids = self.get_term_ids(cursor, terms)
+
+            postings = [
+                (term_ids[term], fingerprint_id, count)
+                for fingerprint_id, tf in term_frequencies
+                for term, count in tf
+            ]
+
+            self.execute_values(
+                cursor,
+                self.INSERT_POSTINGS_QUERY,
+                "(%s, %s, %s)",
+                postings
+            )
+
+            self.insert_signatures(cursor, [
+                (fingerprint_id, url, signature)
+                for fingerprint_id, (url, tf, language, signature)
+                in zip(fingerprint_ids, fingerprints)
+                if signature is not None
+            ])
 
             self.db.commit()
 
+        for term, term_id in term_ids.items():
+            self.term_ids.set(term, term_id)
 
-    def get_document(self, html_content):
-        document = None
+        # Documents are counted once stored, the counts are added to the
+        # statistics tables by on_check.
+        for fingerprint_id, tf in term_frequencies:
+            self.document_frequencies.add(
+                {term_ids[term]: count for term, count in tf}
+            )
 
-        try:
-            document = lxml.html.document_fromstring(html_content)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception:
-            pass
+    def get_term_ids(self, cursor, terms):
+        """
+        Create missing terms, returns a term to id mapping.
+        """
 
-        return document
+        term_ids = {}
+        missing = []
 
-    def replace_escapes(self, text):
-        return text.replace("\n", "").replace("\t", "").replace("\r", "")
+        for term in terms:
+            term_id = self.term_ids.get(term)
 
-    def get_words(self, descriptor):
-        content = descriptor.read().decode("utf-8", "ignore")
-        document = self.get_document(content)
+            if term_id is None:
+                missing.append(term)
+            else:
+                term_ids[term] = term_id
 
-        if document is not None:
-            document = clean_html(document)
-            extracted_text = document.text_content()
-            without_escapes = self.replace_escapes(extracted_text)
-            as_lower_case = without_escapes.lower()
-            without_punctuation = as_lower_case.translate(PUNCTUATION_MAP)
+        missing.sort()
 
-            return without_punctuation
+        result = self.execute_values(
+            cursor,
+            self.INSERT_TERMS_QUERY,
+            "(%s)",
+            [(term,) for term in missing]
+        )
 
-    def find_tf(self, words):
-        tokens = word_tokenize(words)
-        words = [w for w in tokens if w not in STOPWORDS]
+        term_ids.update(result)
+        existing = [term for term in missing if term not in term_ids]
 
-        return self.limit_tf(Counter(words))
+        if existing:
+            cursor.execute(self.GET_TERMS_QUERY, (existing,))
+            term_ids.update(cursor.fetchall())
 
-    def limit_tf(self, counter):
-        return nlargest(self.tf_limit, counter.items(), key=itemgetter(1))
+        return term_ids
 
-    def get_language(self, words):
-        try:
-            return detect(words)
-        except LangDetectException:
-            return None
+    def insert_signatures(self, cursor, signatures):
+        """
+        Store (fingerprint_id, url, signature) triples with the page each is
+        a near duplicate of, if any, and count near duplicates per url
+        pattern.
+        """
+
+        rows = []
+        pages = Counter()
+        duplicates = Counter()
+        band_count = self.duplicate_distance + 1
+
+        for n, (fingerprint_id, url, signature) in enumerate(signatures):
+            bands = similarity.bands(signature, band_count)
+            duplicate_of = None
+
+            # Pages of the batch aren't stored yet.
+            for other_id, other_url, other_signature in signatures[:n]:
+                distance = similarity.distance(signature, other_signature)
+
+                if other_url != url and distance <= self.duplicate_distance:
+                    duplicate_of = other_id
+                    break
+
+            if duplicate_of is None:
+                cursor.execute(self.FIND_DUPLICATE_QUERY, (
+                    bands,
+                    url,
+                    similarity.to_signed(signature),
+                    self.duplicate_distance
+                ))
+                row = cursor.fetchone()
+                duplicate_of = row[0] if row else None
+
+            rows.append((
+                fingerprint_id,
+                similarity.to_signed(signature),
+                bands,
+                duplicate_of
+            ))
+
+            pattern = similarity.url_pattern(url)
+
+            if pattern is None:
+                continue
+
+            pages[pattern] += 1
+
+            if duplicate_of is not None:
+                duplicates[pattern] += 1
+
+        self.execute_values(
+            cursor,
+            self.INSERT_SIGNATURES_QUERY,
+            "(%s, %s, %s::bigint[], %s)",
+            rows
+        )
+
+        self.execute_values(
+            cursor,
+            self.UPSERT_URL_PATTERNS_QUERY,
+            "(%s, %s, %s)",
+            [
+                (pattern, pages[pattern], duplicates[pattern])
+                for pattern in sorted(pages)
+            ]
+        )
+
+    def find_tf(self, term_counts):
+        return terms.top_counts(term_counts, self.tf_limit)
+
+    def get_language(self, words, content_md5=None, domain=None):
+        return self.language_identifier.identify(words, content_md5, domain)
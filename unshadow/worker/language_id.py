@@ -0,0 +1,146 @@
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+from langdetect.lang_detect_exception import LangDetectException
+from unshadow.cache import LRUCache
+
+
+class LangdetectBackend(object):
+    """
+    langdetect with its own factory, so the profiles are loaded once per
+    backend and detections are reproducible.
+    """
+
+    def __init__(self, seed=0):
+        self.factory = DetectorFactory()
+        self.factory.load_profile(PROFILES_DIRECTORY)
+        self.factory.set_seed(seed)
+
+    def detect(self, text):
+        """
+        (language, probability) pairs, most probable first.
+        """
+
+        detector = self.factory.create()
+        detector.append(text)
+
+        try:
+            return [(i.lang, i.prob) for i in detector.get_probabilities()]
+        except LangDetectException:
+            return []
+
+
+BACKENDS = {
+    'langdetect': LangdetectBackend
+}
+
+# Backends loaded by get_backend, shared by the identifiers of a process
+# and by the workers forked from it once warmed up.
+LOADED_BACKENDS = {}
+
+
+def get_backend(name, seed=0):
+    key = (name, seed)
+
+    if key not in LOADED_BACKENDS:
+        LOADED_BACKENDS[key] = BACKENDS[name](seed)
+
+    return LOADED_BACKENDS[key]
+
+
+class LanguageIdentifier(object):
+    """
+    Detects the language of page text from samples of it.
+
+    Detection starts on sample_size characters taken from a few places in
+    the text. The sample is made four times larger, up to max_sample_size,
+    until the most probable language reaches confidence. A domain's last
+    detected language is accepted at domain_confidence. Results are cached
+    per content md5 and per domain.
+    """
+
+    def __init__(
+        self,
+        backend='langdetect',
+        sample_size=2000,
+        max_sample_size=32000,
+        confidence=0.95,
+        domain_confidence=0.8,
+        cache_size=100000,
+        seed=0
+    ):
+        self.backend = get_backend(backend, seed)
+        self.sample_size = sample_size
+        self.max_sample_size = max_sample_size
+        self.confidence = confidence
+        self.domain_confidence = domain_confidence
+        self.contents = LRUCache(cache_size)
+        self.domains = LRUCache(cache_size)
+
+    def sample(self, text, size, pieces=4):
+        """
+        About size characters from pieces evenly spaced windows of text,
+        cut at whitespace.
+        """
+
+        if len(text) <= size:
+            return text
+
+        window = size // pieces
+        step = len(text) // pieces
+        windows = []
+
+        for i in range(pieces):
+            start = text.find(' ', i * step)
+
+            if start == -1:
+                start = i * step
+
+            end = text.rfind(' ', start, start + window)
+
+            if end <= start:
+                end = start + window
+
+            windows.append(text[start:end])
+
+        return ' '.join(windows)
+
+    def identify(self, text, content_md5=None, domain=None):
+        if content_md5 and content_md5 in self.contents:
+            return self.contents.get(content_md5)
+
+        language = self.detect(text, self.domains.get(domain))
+
+        if content_md5:
+            self.contents.set(content_md5, language)
+
+        if domain and language:
+            self.domains.set(domain, language)
+
+        return language
+
+    def detect(self, text, domain_language=None):
+        size = self.sample_size
+
+        while True:
+            probabilities = self.backend.detect(self.sample(text, size))
+
+            if not probabilities:
+                language = None
+                probability = 0
+            else:
+                language, probability = probabilities[0]
+
+            if probability >= self.confidence:
+                break
+
+            if all([
+                language == domain_language,
+                probability >= self.domain_confidence
+            ]):
+                break
+
+            if size >= len(text) or size >= self.max_sample_size:
+                break
+
+            size *= 4
+
+        return language
@@ -0,0 +1,260 @@
+import codecs
+import functools
+import re
+import string
+import lxml.etree
+import lxml.html
+import urllib.parse
+
+
+from lxml.html.clean import Cleaner
+from lxml.html.defs import link_attrs
+
+
+PUNCTUATION_MAP = str.maketrans({i: ' ' for i in string.punctuation})
+CLEANER = Cleaner()
+REFRESH_URL_RE = re.compile(r'url\s*=\s*[\'"]?([^\'"]+)', re.I)
+# The patterns lxml's iterlinks() finds stylesheet links with.
+CSS_URL_RE = re.compile(r'url\(("[^"]*"|\'[^\']*\'|[^)]*)\)', re.I)
+CSS_IMPORT_RE = re.compile(r'@import "(.*?)"')
+
+
+def load_document(path):
+    """
+    Parse the page at path, returns None if it isn't HTML. Bodies are
+    decoded as UTF-8 when they can be, otherwise lxml guesses the encoding
+    from the page itself.
+    """
+
+    with open(path, 'rb') as f:
+        html_content = f.read()
+
+    contents = [html_content]
+
+    # lxml refuses strings with an encoding declaration, like an XML
+    # declaration, those are parsed from the bytes.
+    try:
+        contents.insert(0, html_content.decode('utf-8'))
+    except UnicodeDecodeError:
+        pass
+
+    for content in contents:
+        try:
+            return lxml.html.document_fromstring(content)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except ValueError:
+            continue
+        except Exception:
+            return None
+
+    return None
+
+
+def get_page(document):
+    """
+    Raw links, title and description of a document. Links are resolved
+    against the origin later so the result can be shared by every url
+    serving the same content.
+    """
+
+    if document is None:
+        return {}
+
+    title_elem = document.find('.//title')
+    desc_elem = document.find('.//meta[@name="description"]')
+
+    return {
+        'links': [link[2] for link in document.iterlinks()],
+        'title': title_elem.text if title_elem is not None else None,
+        'description': (
+            desc_elem.get("content") if desc_elem is not None else None
+        )
+    }
+
+
+def get_text(document):
+    """
+    Lower case text of a document without scripts, styles or punctuation.
+    The document is cleaned in place, so it must not be read afterwards.
+    """
+
+    if document is None:
+        return None
+
+    CLEANER(document)
+    extracted_text = document.text_content()
+    without_escapes = extracted_text \
+        .replace("\n", "") \
+        .replace("\t", "") \
+        .replace("\r", "")
+
+    return without_escapes.lower().translate(PUNCTUATION_MAP)
+
+
+class PageTarget(object):
+    """
+    lxml parser target collecting the same links, title and description as
+    get_page() while the page is parsed, without building a tree. Links in
+    stylesheets are found with lxml's own patterns, so both agree.
+    """
+
+    def __init__(self):
+        self.links = []
+        self.title = None
+        self.description = None
+        self.in_title = False
+        self.seen_title = False
+        # Text of the current <style> element and links of its style
+        # attribute, which iterlinks() reports after those of its text.
+        self.style = None
+        self.style_links = []
+
+    def start(self, tag, attrib):
+        if self.in_title:
+            self.in_title = False
+
+        if tag == 'object':
+            codebase = attrib.get('codebase', None)
+
+            for name in ('codebase', 'classid', 'data', 'archive'):
+                value = attrib.get(name, None)
+
+                if value is None:
+                    continue
+
+                if name == 'archive':
+                    values = value.split()
+                else:
+                    values = [value]
+
+                for value in values:
+                    if codebase is not None and name != 'codebase':
+                        value = urllib.parse.urljoin(codebase, value)
+
+                    self.links.append(value)
+        else:
+            for name, value in attrib.items():
+                if name in link_attrs:
+                    self.links.append(value)
+
+        if tag == 'title' and not self.seen_title:
+            self.in_title = True
+            self.seen_title = True
+        elif tag == 'meta':
+            name = attrib.get('name', None)
+            http_equiv = attrib.get('http-equiv', '').lower()
+
+            if name == 'description' and self.description is None:
+                self.description = attrib.get('content', None)
+            elif http_equiv == 'refresh':
+                match = REFRESH_URL_RE.search(attrib.get('content', ''))
+
+                if match:
+                    self.links.append(match.group(1).strip())
+        elif tag == 'param':
+            if (attrib.get('valuetype', None) or '').lower() == 'ref':
+                self.links.append(attrib.get('value', None))
+
+        style_links = get_css_links(attrib.get('style', ''))
+
+        if tag == 'style':
+            self.style = ''
+            self.style_links = style_links
+        else:
+            self.links.extend(style_links)
+
+    def end(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        elif tag == 'style' and self.style is not None:
+            self.links.extend(get_css_links(self.style, True))
+            self.links.extend(self.style_links)
+            self.style = None
+            self.style_links = []
+
+    def data(self, data):
+        if self.in_title:
+            self.title = (self.title or '') + data
+        elif self.style is not None:
+            self.style += data
+
+    def close(self):
+        return {
+            'links': self.links,
+            'title': self.title,
+            'description': self.description
+        }
+
+
+def unquote_css_url(url, start):
+    """
+    (start, url) of a url() argument without its quotes.
+    """
+
+    if url[:1] in ('"', "'") and url[-1:] == url[:1]:
+        return start + 1, url[1:-1]
+
+    return start, url
+
+
+def get_css_links(css, imports=False):
+    """
+    Links of a stylesheet, or of a style attribute without imports, in the
+    order iterlinks() reports them.
+    """
+
+    if not css:
+        return []
+
+    links = [
+        unquote_css_url(match.group(1), match.start(1))
+        for match in CSS_URL_RE.finditer(css)
+    ]
+
+    if imports:
+        links += [
+            (match.start(1), match.group(1))
+            for match in CSS_IMPORT_RE.finditer(css)
+        ]
+
+    return [url for start, url in sorted(links, reverse=True)]
+
+
+def stream_page(path, chunk_size=65536):
+    """
+    Like get_page(load_document(path)) but parsed chunk by chunk, so the
+    page is never held in memory as a whole or as a tree. Returns {} if
+    nothing could be parsed.
+    """
+
+    try:
+        return feed_page(path, chunk_size, 'utf-8')
+    except UnicodeDecodeError:
+        return feed_page(path, chunk_size, None)
+
+
+def feed_page(path, chunk_size, encoding):
+    parser = lxml.etree.HTMLParser(target=PageTarget())
+
+    if encoding:
+        decoder = codecs.getincrementaldecoder(encoding)()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, chunk_size), b''):
+            if encoding:
+                chunk = decoder.decode(chunk)
+
+            if chunk:
+                parser.feed(chunk)
+
+    if encoding:
+        chunk = decoder.decode(b'', final=True)
+
+        if chunk:
+            parser.feed(chunk)
+
+    try:
+        return parser.close()
+    except lxml.etree.XMLSyntaxError:
+        return {}
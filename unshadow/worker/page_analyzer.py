@@ -0,0 +1,111 @@
+from urllib.parse import urlparse
+from unshadow.worker import page
+from unshadow.worker.language_analyzer import LanguageAnalyzer
+from unshadow.worker.parser import LinkExtractor
+
+
+class PageAnalyzer(LinkExtractor, LanguageAnalyzer):
+    '''
+    Extracts links and computes term frequency and language of web content,
+    parsing every page only once.
+    '''
+
+    def init(self, scope=None, **kwargs):
+        self.scope = scope
+
+        LanguageAnalyzer.init(self, **kwargs)
+
+    def on_message(self, message):
+        fingerprint = self.analyze_message(message)
+
+        if fingerprint:
+            self.insert_fingerprints([fingerprint])
+
+        return self.finish_message(message)
+
+    def on_batch(self, messages):
+        results = []
+        fingerprints = []
+
+        for message in messages:
+            try:
+                fingerprint = self.analyze_message(message)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                self.log.exception(e)
+                results.append(None)
+            else:
+                if fingerprint:
+                    fingerprints.append(fingerprint)
+
+                results.append(message)
+
+        self.insert_fingerprints(fingerprints)
+
+        # Messages that failed are not forwarded, but their content is
+        # removed all the same.
+        for message, result in zip(messages, results):
+            if result is None:
+                self.remove_content(message)
+
+        return [
+            self.finish_message(message) if message else None
+            for message in results
+        ]
+
+    def analyze_message(self, message):
+        """
+        Add the page's links, title and description to message, returns its
+        fingerprint.
+        """
+
+        origin_url = message['origin']
+        content_path = message.get('content_path', None)
+        content_md5 = message.get('content_md5', None)
+        parsed = None
+        analysis = None
+
+        if not content_path:
+            return None
+
+        if self.content_store:
+            parsed = self.content_store.get_result('page', content_md5)
+            analysis = self.get_cached_analysis(content_md5)
+
+        if parsed is None or analysis is None:
+            document = page.load_document(content_path)
+
+            # The text is extracted last, cleaning modifies the document.
+            if parsed is None:
+                parsed = page.get_page(document)
+
+                if self.content_store:
+                    self.content_store.set_result('page', content_md5, parsed)
+
+            if analysis is None:
+                analysis = self.analyze_document(
+                    document,
+                    content_md5,
+                    urlparse(origin_url).netloc
+                )
+
+                if self.content_store:
+                    self.content_store.set_result(
+                        'analysis',
+                        content_md5,
+                        analysis
+                    )
+
+        message.update(self.get_metadata(parsed, origin_url))
+        language, term_frequency, signature = analysis
+
+        if language:
+            return origin_url, term_frequency, language, signature
+
+    def finish_message(self, message):
+        self.remove_content(message)
+        message.pop('content_path', None)
+        self.add_additional_urls(message)
+
+        return message
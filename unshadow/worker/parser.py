@@ -1,10 +1,10 @@
-import urllib
-import urllib.parse
-import lxml.html
 import os
 
 
+from unshadow.content_store import ContentStore
 from unshadow.dispatch import Stage
+from unshadow.urlnorm import URLNormalizer
+from unshadow.worker import page
 
 
 class LinkExtractor(Stage):
@@ -12,12 +12,31 @@ class LinkExtractor(Stage):
     Extracts links from urls.
     '''
 
+    def init(
+        self,
+        content_store=None,
+        streaming=False,
+        chunk_size=65536,
+        scope=None
+    ):
+        self.content_store = None
+        self.scope = scope
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+
+        if content_store:
+            self.content_store = ContentStore(content_store)
+
     def on_message(self, message):
         origin_url = message['origin']
         content_path = message['content_path']
  
         if content_path:
-            metadata = self.parse_page(content_path, origin_url)
+            metadata = self.parse_page(
+                content_path,
+                origin_url,
+                message.get('content_md5', None)
+            )
 
             message.update(metadata)
             os.remove(content_path)
@@ -29,96 +48,75 @@ class LinkExtractor(Stage):
 
         return message
 
+    def on_batch(self, messages):
+        return [self.handle_message(message) for message in messages]
+
     def add_additional_urls(self, message):
         redirect = message.get("redirect", None)
         origin = message['origin']
         urls = message.get('urls', [])
+        normalizer = URLNormalizer(origin)
+        redirect = normalizer.normalize(redirect)
 
-        if redirect is not None:
+        if redirect is not None and self.in_scope(redirect):
             urls.append(redirect)
 
-        metadata = urllib.parse.urlparse(origin)
-        urls.append("{}://{}".format(metadata.scheme, metadata.netloc))
+        if normalizer.root and self.in_scope(normalizer.root + '/'):
+            urls.append(normalizer.root + '/')
 
         message['urls'] = urls
 
-    def parse_page(self, path, origin_url):
-        metadata = {}
+    def parse_page(self, path, origin_url, content_md5=None):
+        parsed = None
 
-        with open(path, 'rb') as f:
-            html_content = f.read()
+        if self.content_store:
+            parsed = self.content_store.get_result('page', content_md5)
 
-        document = self.get_document(html_content)
-
-        if document is not None:
-            metadata.update({
-                'urls': self.get_urls(document, origin_url),
-                'title': self.get_title(document),
-                "description": self.get_description(document)
-            })
+        if parsed is None:
+            parsed = self.read_page(path)
 
-        return metadata
+            if self.content_store:
+                self.content_store.set_result('page', content_md5, parsed)
 
-    def get_title(self, document):
-        title_elem = document.find('.//title')
+        return self.get_metadata(parsed, origin_url)
 
-        return title_elem.text if title_elem is not None else None
+    def get_metadata(self, parsed, origin_url):
+        metadata = {}
 
-    def get_description(self, document):
-        desc_elem = document.find('.//meta[@name="description"]')
+        if parsed:
+            metadata.update({
+                'urls': self.get_urls(parsed['links'], origin_url),
+                'title': parsed['title'],
+                "description": parsed['description']
+            })
 
-        return desc_elem.get("content") if desc_elem is not None else None
+        return metadata
 
-    def get_document(self, html_content):
-        document = None
+    def read_page(self, path):
+        if self.streaming:
+            return page.stream_page(path, self.chunk_size)
 
-        try:
-            document = lxml.html.document_fromstring(html_content)
+        return page.get_page(page.load_document(path))
 
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception:
-            pass
+    def get_urls(self, links, origin_url):
+        urls = []
 
-        return document
+        normalizer = URLNormalizer(origin_url)
 
-    def get_urls(self, document, origin_url):
-        urls = []
+        for link in links:
+            url = normalizer.normalize(link)
 
-        for document_link in document.iterlinks():
-            url = self.clean_url(document_link[2], origin_url)
-            if url:
+            if not url:
+                self.save_garbage(link, origin_url)
+            elif self.in_scope(url):
                 urls.append(url)
-            else:
-                self.save_garbage(url, origin_url)
 
         self.log.info('{} urls extracted'.format(len(urls)))
 
         return urls
 
+    def in_scope(self, url):
+        return self.scope is None or self.scope.allows(url)
+
     def save_garbage(self, url, origin_url):
         pass
-
-    def clean_url(self, url, origin_url):
-        try:
-            origin_url_metadata = urllib.parse.urlparse(origin_url)
-            url_metadata = urllib.parse.urlparse(url)
-
-            if url.startswith("//"):
-                origin_scheme = origin_url_metadata.scheme
-                url = "{}:{}".format(origin_scheme, url)
-
-            if not url_metadata.netloc:
-                url = urllib.parse.urljoin(origin_url, url_metadata.path)
-
-            new_metadata = urllib.parse.urlparse(url)
-            base = "{}://{}".format(new_metadata.scheme, new_metadata.netloc)
-            quoted_url = urllib.parse.quote(new_metadata.path)
-
-            return urllib.parse.urljoin(base, quoted_url)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception as e:
-            self.log.warning("Parse failed with: {}".format(e))
-
-            return None
@@ -0,0 +1,261 @@
+import collections
+import heapq
+import itertools
+
+
+class Host(object):
+    """
+    Pending urls and politeness state of a single domain. Urls in later
+    are only handed out once urls is empty.
+    """
+
+    __slots__ = (
+        'urls',
+        'later',
+        'next_allowed',
+        'delay',
+        'priority',
+        'latency',
+        'errors',
+        'version'
+    )
+
+    def __init__(self, delay):
+        self.urls = collections.deque()
+        self.later = collections.deque()
+        self.next_allowed = 0
+        self.delay = delay
+        self.priority = 0
+        self.latency = None
+        self.errors = 0
+        self.version = 0
+
+    def pending(self):
+        return len(self.urls) + len(self.later)
+
+    def popleft(self):
+        if self.urls:
+            return self.urls.popleft()
+
+        return self.later.popleft()
+
+    def to_list(self):
+        return [
+            list(self.urls),
+            self.next_allowed,
+            self.delay,
+            self.priority,
+            self.latency,
+            self.errors,
+            list(self.later)
+        ]
+
+
+class HostScheduler(object):
+    """
+    Per-domain url queues. A domain is handed out again only once its
+    delay has passed, and among the domains that are ready the ones with
+    the highest priority go first.
+
+    A domain's delay follows its measured latency, between min_delay and
+    max_delay, and is multiplied by error_backoff for every consecutive
+    failed fetch. Hosts without urls are forgotten once their delay has
+    passed.
+    """
+
+    def __init__(
+        self,
+        min_delay,
+        max_delay,
+        max_urls_per_host=1000,
+        latency_factor=10,
+        error_backoff=2
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_urls_per_host = max_urls_per_host
+        self.latency_factor = latency_factor
+        self.error_backoff = error_backoff
+        self.hosts = {}
+        self.pending = 0
+        # Versions are unique across hosts, so entries of a forgotten host
+        # never match the host that replaces it.
+        self.versions = itertools.count(1)
+        # (next_allowed, version, domain_id) of hosts waiting for their
+        # delay, or to be forgotten when they have no urls
+        self.waiting = []
+        # (-priority, version, domain_id) of hosts that can be fetched now
+        self.ready = []
+
+    def __len__(self):
+        return self.pending
+
+    def get_host(self, domain_id):
+        host = self.hosts.get(domain_id)
+
+        if host is None:
+            host = self.hosts[domain_id] = Host(self.min_delay)
+            self.schedule(domain_id, host)
+
+        return host
+
+    def schedule(self, domain_id, host):
+        host.version = next(self.versions)
+        entry = (host.next_allowed, host.version, domain_id)
+        heapq.heappush(self.waiting, entry)
+
+    def add(self, domain_id, url, later=False):
+        """
+        Queue a url, returns False if its domain's queue is full. Urls added
+        later only go once the domain's other urls are gone.
+        """
+
+        host = self.get_host(domain_id)
+
+        if host.pending() >= self.max_urls_per_host:
+            return False
+
+        if later:
+            host.later.append(url)
+        else:
+            host.urls.append(url)
+
+        self.pending += 1
+
+        if host.pending() == 1:
+            self.schedule(domain_id, host)
+
+        return True
+
+    def defer(self, domain_id, url, until):
+        """
+        Put back a url that could not be emitted, to be retried at until.
+        """
+
+        host = self.get_host(domain_id)
+        host.urls.appendleft(url)
+        self.pending += 1
+        host.next_allowed = max(host.next_allowed, until)
+
+        self.schedule(domain_id, host)
+
+    def drop(self, domain_id):
+        """
+        Forget a domain's urls, returns them.
+        """
+
+        host = self.hosts.get(domain_id)
+
+        if not host:
+            return []
+
+        dropped = list(host.urls) + list(host.later)
+        self.pending -= host.pending()
+        host.urls.clear()
+        host.later.clear()
+        self.schedule(domain_id, host)
+
+        return dropped
+
+    def add_priority(self, domain_id, amount=1):
+        self.get_host(domain_id).priority += amount
+
+    def record_fetch(self, domain_id, now, elapsed_time, error=False):
+        """
+        Adapt a domain's delay to the outcome of a fetch.
+        """
+
+        host = self.get_host(domain_id)
+
+        if error:
+            host.errors += 1
+            delay = host.delay * self.error_backoff
+        else:
+            host.errors = 0
+
+            if host.latency is None:
+                host.latency = elapsed_time
+            else:
+                host.latency = 0.8 * host.latency + 0.2 * elapsed_time
+
+            delay = host.latency * self.latency_factor
+
+        host.delay = min(self.max_delay, max(self.min_delay, delay))
+
+        if host.next_allowed < now + host.delay:
+            host.next_allowed = now + host.delay
+            self.schedule(domain_id, host)
+
+    def pop_ready(self, now, count):
+        """
+        Take up to count (domain_id, url) pairs, at most one per domain.
+        """
+
+        while self.waiting and self.waiting[0][0] <= now:
+            next_allowed, version, domain_id = heapq.heappop(self.waiting)
+            host = self.hosts.get(domain_id)
+
+            if host is None or host.version != version:
+                continue
+
+            if host.pending():
+                entry = (-host.priority, version, domain_id)
+                heapq.heappush(self.ready, entry)
+            else:
+                del self.hosts[domain_id]
+
+        emitted = []
+
+        while self.ready and len(emitted) < count:
+            priority, version, domain_id = heapq.heappop(self.ready)
+            host = self.hosts.get(domain_id)
+
+            if host is None or host.version != version or not host.pending():
+                continue
+
+            emitted.append((domain_id, host.popleft()))
+            self.pending -= 1
+            host.next_allowed = now + host.delay
+            self.schedule(domain_id, host)
+
+        return emitted
+
+    def to_dict(self):
+        return {
+            domain_id: host.to_list()
+            for domain_id, host in self.hosts.items()
+        }
+
+    def merge(self, state):
+        """
+        Merge the hosts of another scheduler's to_dict() into this one,
+        returns the urls that didn't fit in their domain's queue.
+        """
+
+        rejected = []
+
+        for domain_id, values in state.items():
+            urls, next_allowed, delay, priority, latency, errors = values[:6]
+            # Checkpoints written before urls could be put off have no
+            # later urls.
+            later = values[6] if len(values) > 6 else []
+            domain_id = int(domain_id)
+            host = self.get_host(domain_id)
+            host.next_allowed = max(host.next_allowed, next_allowed)
+            host.delay = max(host.delay, delay)
+            host.priority += priority
+            host.latency = latency if host.latency is None else host.latency
+            host.errors = max(host.errors, errors)
+
+            pending = host.pending()
+            room = max(self.max_urls_per_host - host.pending(), 0)
+            host.urls.extend(urls[:room])
+            rejected.extend(urls[room:])
+            room = max(self.max_urls_per_host - host.pending(), 0)
+            host.later.extend(later[:room])
+            rejected.extend(later[room:])
+            self.pending += host.pending() - pending
+
+            self.schedule(domain_id, host)
+
+        return rejected
@@ -0,0 +1,88 @@
+import re
+
+
+from collections import Counter
+from heapq import nlargest
+from nltk import word_tokenize
+from nltk.corpus import stopwords
+from operator import itemgetter
+
+
+STOPWORDS = frozenset(stopwords.words('english'))
+
+# Text that is only word characters and whitespace, which is what pages
+# are reduced to once ASCII punctuation is removed. The only treebank rules
+# that apply to such text split these contractions, each after its third
+# letter.
+SIMPLE_TEXT_RE = re.compile(r"^[\w\s]*$")
+CONTRACTIONS = frozenset([
+    'cannot',
+    'gimme',
+    'gonna',
+    'gotta',
+    'lemme',
+    'wanna'
+])
+CONTRACTION_RE = re.compile(
+    r"(?i)\b(?:{})\b".format("|".join(sorted(CONTRACTIONS)))
+)
+
+
+def tokenize(text):
+    """
+    Same tokens as nltk's word_tokenize, without running the punkt and
+    treebank tokenizers on text they would only split on whitespace.
+    """
+
+    if not SIMPLE_TEXT_RE.match(text):
+        return word_tokenize(text)
+
+    tokens = text.split()
+
+    if not CONTRACTION_RE.search(text):
+        return tokens
+
+    split_tokens = []
+
+    for token in tokens:
+        if token.lower() in CONTRACTIONS:
+            split_tokens.append(token[:3])
+            split_tokens.append(token[3:])
+        else:
+            split_tokens.append(token)
+
+    return split_tokens
+
+
+def load_tokenizer():
+    """
+    Load the models nltk's word_tokenize loads on its first call.
+    """
+
+    word_tokenize("Loading the tokenizer's models.")
+
+
+def count_terms(text):
+    """
+    Occurrences of every term of text that isn't a stopword, in the order
+    they first appear.
+    """
+
+    counter = Counter(tokenize(text))
+
+    for stopword in STOPWORDS.intersection(counter):
+        del counter[stopword]
+
+    return counter
+
+
+def top_counts(counter, limit):
+    return nlargest(limit, counter.items(), key=itemgetter(1))
+
+
+def top_terms(text, limit):
+    return top_counts(count_terms(text), limit)
+
+
+def top_terms_many(texts, limit):
+    return [top_terms(text, limit) for text in texts]
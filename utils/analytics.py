@@ -0,0 +1,124 @@
+import heapq
+import math
+
+
+BLACKLIST_PATH = "blacklist"
+FONT_PATH = "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf"
+
+# Rows fetched from the server at a time by stream().
+ITERSIZE = 10000
+
+# Only the heaviest terms are drawn, the rest would be too small to read.
+MAX_WORDS = 2000
+
+DOCUMENT_COUNT_QUERY = """
+SELECT value FROM corpus_statistic WHERE name = 'documents'
+"""
+
+# Statistics kept up to date by the language analyzers, see
+# unshadow/corpus.py.
+TERM_STATISTICS_QUERY = """
+SELECT term.term, term_statistic.term_count, term_statistic.document_count
+FROM term_statistic
+JOIN term ON term.id = term_statistic.term_id
+WHERE length(term.term) >= %s
+"""
+
+
+def load_blacklist(path=BLACKLIST_PATH):
+    with open(path) as f:
+        return set(f.read().split())
+
+
+def stream(db, query, params=None, name="analytics", itersize=ITERSIZE):
+    """
+    Rows of query read through a server-side cursor, so only itersize of
+    them are in memory at once.
+    """
+
+    with db.cursor(name) as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query, params)
+
+        for row in cursor:
+            yield row
+
+
+def get_document_count(db):
+    with db.cursor() as cursor:
+        cursor.execute(DOCUMENT_COUNT_QUERY)
+        row = cursor.fetchone()
+
+    return row[0] if row else 0
+
+
+def term_statistics(db, min_length=1):
+    """
+    (term, term_count, document_count) rows of every term.
+    """
+
+    return stream(db, TERM_STATISTICS_QUERY, (min_length,))
+
+
+def aggregate(rows, weight, blacklist=(), max_words=MAX_WORDS):
+    """
+    Weights of the max_words heaviest terms of (term, ...) rows, weight
+    being called with the rest of every row. Terms weighing nothing are
+    left out.
+    """
+
+    weights = (
+        (term, weight(*values))
+        for term, *values in rows
+        if term not in blacklist
+    )
+
+    return dict(heapq.nlargest(
+        max_words,
+        ((term, value) for term, value in weights if value > 0),
+        key=lambda i: i[1]
+    ))
+
+
+def idf(document_count):
+    def weight(term_count, term_document_count):
+        return math.log(document_count / term_document_count)
+
+    return weight
+
+
+def tfidf(document_count, per_document=False):
+    """
+    Weighs terms by their count, or their mean count in the documents they
+    appear in, times their idf.
+    """
+
+    def weight(term_count, term_document_count):
+        tf = term_count
+
+        if per_document:
+            tf = term_count / term_document_count
+
+        return tf * math.log(document_count / term_document_count)
+
+    return weight
+
+
+def term_count(term_count, term_document_count):
+    return term_count
+
+
+def render(weights, path, font_path=FONT_PATH, width=4000, height=4000):
+    # Imported here, so weights can be computed where wordcloud isn't
+    # installed.
+    from wordcloud import WordCloud
+
+    wordcloud = WordCloud(
+        font_path=font_path,
+        width=width,
+        height=height,
+        max_words=len(weights)
+    )
+
+    wordcloud.generate_from_frequencies(weights)
+    wordcloud.to_file(path)
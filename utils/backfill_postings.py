@@ -0,0 +1,89 @@
+import json
+import psycopg2
+import psycopg2.extras
+
+
+DB_CONFIG = {
+    "database": "unshadow",
+    "user": "unshadow",
+    "password": "",
+    "port": 5432,
+    "host": "localhost"
+}
+
+BATCH_SIZE = 1000
+MAX_TERM_LENGTH = 200
+
+
+# Fingerprints written before term frequencies were stored as postings.
+# Their JSON is cleared once their postings exist, so the script can be
+# stopped and run again.
+QUERY = """
+    SELECT id, term_frequency FROM fingerprint
+    WHERE term_frequency IS NOT NULL
+    ORDER BY id
+    LIMIT %s
+"""
+
+INSERT_TERMS_QUERY = """
+    INSERT INTO term (term) VALUES %s
+    ON CONFLICT (term) DO NOTHING
+"""
+
+GET_TERMS_QUERY = """
+    SELECT term, id FROM term WHERE term = ANY(%s)
+"""
+
+INSERT_POSTINGS_QUERY = """
+    INSERT INTO posting (term_id, fingerprint_id, count) VALUES %s
+    ON CONFLICT (term_id, fingerprint_id) DO NOTHING
+"""
+
+CLEAR_QUERY = """
+    UPDATE fingerprint SET term_frequency = NULL WHERE id = ANY(%s)
+"""
+
+
+db = psycopg2.connect(**DB_CONFIG)
+cursor = db.cursor()
+total = 0
+
+while True:
+    cursor.execute(QUERY, (BATCH_SIZE,))
+    rows = cursor.fetchall()
+
+    if not rows:
+        break
+
+    term_frequencies = []
+
+    for fingerprint_id, data in rows:
+        tf = json.loads(data) if data != "null" else None
+
+        for term, count in tf or []:
+            if len(term) <= MAX_TERM_LENGTH:
+                term_frequencies.append((fingerprint_id, term, count))
+
+    terms = sorted(set(i[1] for i in term_frequencies))
+
+    psycopg2.extras.execute_values(
+        cursor,
+        INSERT_TERMS_QUERY,
+        [(term,) for term in terms]
+    )
+    cursor.execute(GET_TERMS_QUERY, (terms,))
+    term_ids = dict(cursor.fetchall())
+
+    psycopg2.extras.execute_values(
+        cursor,
+        INSERT_POSTINGS_QUERY,
+        [
+            (term_ids[term], fingerprint_id, count)
+            for fingerprint_id, term, count in term_frequencies
+        ]
+    )
+    cursor.execute(CLEAR_QUERY, ([i[0] for i in rows],))
+    db.commit()
+
+    total += len(rows)
+    print("{} fingerprints backfilled".format(total))
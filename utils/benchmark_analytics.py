@@ -0,0 +1,138 @@
+"""
+Compares the word cloud weights computed by the analytics module with the
+former approach of writing every term to a file once per unit of weight,
+on a synthetic corpus.
+
+python benchmark_analytics.py [documents] [vocabulary]
+"""
+
+import analytics
+import collections
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+
+TERMS_PER_DOCUMENT = 50
+
+
+def synthetic_statistics(documents, vocabulary):
+    """
+    (term, term_count, document_count) rows of documents with Zipf
+    distributed terms.
+    """
+
+    random.seed(0)
+    terms = ["term{}".format(i) for i in range(vocabulary)]
+    cumulative = [1 / (i + 1) for i in range(vocabulary)]
+
+    for i in range(1, vocabulary):
+        cumulative[i] += cumulative[i - 1]
+
+    term_counts = collections.Counter()
+    document_counts = collections.Counter()
+
+    for n in range(documents):
+        document = collections.Counter(random.choices(
+            terms,
+            cum_weights=cumulative,
+            k=TERMS_PER_DOCUMENT * 4
+        ))
+        top = document.most_common(TERMS_PER_DOCUMENT)
+
+        term_counts.update(dict(top))
+        document_counts.update(term for term, count in top)
+
+    return [
+        (term, term_counts[term], document_counts[term])
+        for term in document_counts
+    ]
+
+
+def repeated_words(rows, weight, path):
+    """
+    The former idf.py: every term written int(weight * 1000) times, read
+    back and counted word by word as WordCloud.generate did.
+    """
+
+    with open(path, "w") as f:
+        for term, *values in rows:
+            for n in range(int(weight(*values) * 1000)):
+                f.write(term + "\n")
+
+    size = os.path.getsize(path)
+
+    with open(path) as f:
+        weights = collections.Counter(f.read().split())
+
+    os.remove(path)
+
+    return weights, size
+
+
+def run(queue, function, args):
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * resource.getpagesize()
+
+    start = time.time()
+    result = function(*args)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    queue.put((result, elapsed, max(peak - rss, 0)))
+
+
+def measure(function, *args):
+    """
+    Result, duration and memory growth of function, run in a forked process
+    so every measure starts from the same peak.
+    """
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=run,
+        args=(queue, function, args)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+
+documents = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+vocabulary = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+rows = synthetic_statistics(documents, vocabulary)
+weight = analytics.idf(documents)
+
+print("{} documents, {} terms".format(documents, len(rows)))
+
+with tempfile.TemporaryDirectory() as folder:
+    (old, size), elapsed, peak = measure(
+        repeated_words,
+        rows,
+        weight,
+        os.path.join(folder, "counter")
+    )
+
+print("repeated words: {:.2f}s, {:.1f} MB peak, {:.1f} MB file".format(
+    elapsed,
+    peak / 2 ** 20,
+    size / 2 ** 20
+))
+
+new, elapsed, peak = measure(analytics.aggregate, iter(rows), weight)
+
+print("analytics: {:.2f}s, {:.1f} MB peak".format(
+    elapsed,
+    peak / 2 ** 20
+))
+
+# The former weights were truncated to thousandths.
+print("same weights: {}".format(all(
+    abs(old[term] / 1000 - w) < 0.001 for term, w in new.items()
+)))
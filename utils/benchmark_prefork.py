@@ -0,0 +1,131 @@
+"""
+Compares workers forked from a cold manager, which load their stage's
+models themselves, with workers forked from a manager that warmed them up.
+Reports per stage the time a worker takes to load what it needs, and its
+resident (RSS), proportional (PSS) and private (USS) memory.
+
+python benchmark_prefork.py [workers per stage]
+"""
+
+import gc
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from unshadow import config
+from unshadow.worker.fetcher import Fetcher
+from unshadow.worker.parser import LinkExtractor
+from unshadow.worker.frontier import Frontier
+from unshadow.worker.language_analyzer import LanguageAnalyzer
+from unshadow.worker.page_analyzer import PageAnalyzer
+
+
+STAGES = [
+    ('fetcher', Fetcher, {}),
+    ('extractor', LinkExtractor, {}),
+    ('frontier', Frontier, {}),
+    (
+        'language_analyzer',
+        LanguageAnalyzer,
+        {'language_backend': config.LANGUAGE_ANALYZER_LANGUAGE_BACKEND}
+    ),
+    (
+        'page_analyzer',
+        PageAnalyzer,
+        {'language_backend': config.LANGUAGE_ANALYZER_LANGUAGE_BACKEND}
+    )
+]
+
+
+def warm_up(Worker, kwargs):
+    try:
+        Worker.warm_up(**kwargs)
+    except LookupError:
+        # The rest is loaded by then.
+        print("nltk tokenizer data is missing", file=sys.stderr)
+
+
+def worker(connection, Worker, kwargs, forked):
+    warm_up(Worker, kwargs)
+    connection.send(time.time() - forked)
+    connection.recv()
+
+
+def memory(pid):
+    """
+    RSS, PSS and USS of a process, in bytes.
+    """
+
+    values = {}
+
+    with open("/proc/{}/smaps_rollup".format(pid)) as f:
+        for line in f:
+            parts = line.split()
+
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+
+    uss = values['Private_Clean'] + values['Private_Dirty']
+
+    return values['Rss'], values['Pss'], uss
+
+
+def measure(warm, count):
+    context = multiprocessing.get_context('fork')
+
+    if warm:
+        for name, Worker, kwargs in STAGES:
+            warm_up(Worker, kwargs)
+
+        gc.collect()
+        gc.freeze()
+
+    for name, Worker, kwargs in STAGES:
+        processes = []
+        results = []
+
+        for n in range(count):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=worker,
+                args=(child, Worker, kwargs, time.time())
+            )
+            process.start()
+            processes.append((process, parent))
+
+        # Workers are measured together, so they share what they can.
+        for process, parent in processes:
+            elapsed = parent.recv()
+            results.append((elapsed,) + memory(process.pid))
+
+        for process, parent in processes:
+            parent.send(None)
+            process.join()
+
+        averages = [sum(i) / len(results) for i in zip(*results)]
+
+        print("{:>6} {:<18} {:8.1f} ms {:7.1f} {:7.1f} {:7.1f} MB".format(
+            "warm" if warm else "cold",
+            name,
+            averages[0] * 1000,
+            *[i / 2 ** 20 for i in averages[1:]]
+        ))
+
+
+if len(sys.argv) > 2:
+    measure(sys.argv[2] == 'warm', int(sys.argv[1]))
+else:
+    count = sys.argv[1] if len(sys.argv) > 1 else '4'
+
+    print("{:>6} {:<18} {:>11} {:>7} {:>7} {:>7}".format(
+        "", "stage", "spawn", "rss", "pss", "uss"
+    ))
+
+    # Every mode runs in its own interpreter, so the cold one loads nothing
+    # the warm one loaded.
+    for mode in ('cold', 'warm'):
+        subprocess.check_call([sys.executable, __file__, count, mode])
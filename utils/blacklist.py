@@ -1,3 +1,3 @@
-BLACKLIST = {"boolean", "dfn", "text-indent", "margin", "accelerator", "address", "-moz-border-right-colors", "onkeypress", "serif", "animation", "embed", "border-bottom-style", "vertical-align", "position", "page", "font-variant", "protected", "defaultstatus", "typeof", "parsefloat", "legend", "button", "frames", "debugger", "scrollbar-shadow-color", "text-decoration", "dt", "layout-grid", "scrollbar-highlight-color", "webkit", "break", "catch", "align", "if", "solid", "font", "ruby-position", "margin-top", "package", "onkeydown", "play-during", "text-underline-position", "-moz-border-radius-topleft", "cue", "for", "behavior", "text-justify", "isnan", "include-source", "table", "border-left-width", "-moz-border-bottom-colors", "final", "border-left", "short", "mimetypes", "text-align", "background", "ruby-overhang", "scrollbar-base-color", "layout-grid-line", "public", "anchor", "scrollbar-arrow-color", "constructor", "border-width", "http", "word-wrap", "scrollbar-dark-shadow-color", "undefined", "-moz-outline-style", "voice-family", "i", "radius", "crypto", "link", "helper", "index", "nodetype", "pitch-range", "sub", "pagexoffset", "label", "tostring", "layout-grid-char", "outline-width", "object", "col", "th", "font-size", "base", "optgroup", "param", "tr", "-moz-user-input", "outerheight", "speak-punctuation", "opacity", "ins", "min-height", "script", "layers", "parseint", "azimuth", "in", "images", "padding-bottom", "byte", "offscreenbuffering", "extends", "h3", "continue", "border-right-style", "disabled", "first", "background-color", "-moz-border-radius-bottomright", "rotate", "style", "border-style", "member", "dd", "scrollbar-face-color", "string", "pause-before", "throws", "marker-offset", "outline", "speech-rate", "big", "border-right", "synchronized", "abbr", "escape", "head", "cursor", "class", "innerwidth", "settimeout", "hasownproperty", "-moz-binding", "unicode-bidi", "layer-background-color", "text-transform", "all", "overflow-y", "page-break-inside", "else", "title", "word-spacing", "closed", "sup", "em", "body", "native", "throw", "layout-grid-char-spacing", "nan", "selecttor", "pitch", "interface", "border-color", "orphans", "double", "div", "border-bottom", "try", "anchors", "letter-spacing", "import", "child", "margin-right", "colgroup", "focus", "-use-link-source", "blockquote", "padding", "quotes", "font-weight", "line-break", "format", "marks", "background-position", "with", "form", "implements", "background-position-x", "thead", "export", "-moz-border-left-colors", "yield", "transparent", "kbd", "array", "empty-cells", "noscript", "-moz-border-radius", "active", "clip", "math", "decodeuri", "content", "richness", "date", "font-stretch", "page-break-after", "super", "pkcs11", "input", "color", "char", "screeny", "border-top-style", "packages", "absolute", "confirm", "text", "-moz-border-radius-topright", "text-autospace", "opener", "-moz-user-select", "background-image", "long", "name", "bottom", "false", "h4", "float", "history", "cover", "caption", "private", "onload", "img", "counter-reset", "min-width", "layer", "size", "list-style-image", "-replace", "return", "valueof", "navigate", "white-space", "max-width", "cue-before", "static", "event", "propertyisenum", "p", "setinterval", "-set-link-source", "onsubmit", "br", "-moz-opacity", "layout-flow", "assign", "onblur", "could", "scroll", "small", "-moz-border-top-colors", "embeds", "submit", "border", "secure", "screenx", "td", "border-top-color", "select", "text-align-last", "let", "visibility", "document", "password", "ime-mode", "h1", "border-right-width", "list-style", "onclick", "pageyoffset", "switch", "writing-mode", "top", "cleartimeout", "margin-left", "instanceof", "new", "transform", "eval", "length", "stress", "map", "widows", "onfocus", "volume", "offset", "isfinite", "onerror", "border-left-style", "acronym", "counter-increment", "pause", "-moz-border-radius-bottomleft", "pause-after", "encodeuricomponent", "tt", "left", "background-repeat", "10px", "block", "onmousedown", "table-layout", "void", "layer-background-image", "transition", "int", "onmouseover", "border-spacing", "right", "do", "parentnode", "caption-side", "ul", "innerheight", "-moz-outline", "outerwidth", "translatex", "number", "strong", "-moz-user-modify", "background-attachment", "untaint", "scrollbar-track-color", "radio", "blur", "outline-style", "prompt", "option", "nodename", "text-kashida-space", "h6", "speak", "decoration", "samp", "list-style-type", "background-position-y", "list-style-position", "self", "forms", "options", "hr", "data", "while", "prototype", "container", "group", "page-break-before", "area", "pre", "html", "clearinterval", "close", "decodeuricomponent", "plugin", "text-shadow", "image", "border-left-color", "span", "height", "a", "cite", "tfoot", "border-top", "li", "tbody", "-moz-outline-width", "volatile", "font-family", "element", "parent", "onmouseup", "navbar", "padding-left", "delete", "transient", "reset", "word-break", "status", "border-collapse", "font-size-adjust", "window", "text-overflow", "open", "scrollbar-3d-light-color", "glyphicon", "fieldset", "infinity", "fileupload", "hidden", "layout-grid-mode", "onkeyup", "encodeuri", "-moz-outline-color", "function", "border-right-color", "var", "error", "padding-right", "max-height", "textarea", "https", "line-height", "h2", "this", "border-top-width", "default", "width", "taint", "layout-grid-type", "dl", "-moz-user-focus", "finally", "filter", "overflow-x", "arguments", "overflow", "q", "framerate", "outline-color", "clientinformation", "null", "font-style", "navigator", "ol", "isprototypeof", "unescape", "direction", "frame", "meta", "case", "bdo", "enum", "display", "dropdown", "b", "del", "elevation", "cue-after", "alert", "padding-top", "speak-header", "true", "border-bottom-width", "location", "ruby-align", "alertabstract", "h5", "elements", "margin-bottom", "goto", "speak-numeral", "template", "clear", "border-bottom-color", "code", "checkbox", "const", "source", "hover", "panel", "important", "value", "users", "stats", "weight", "ffffff", "000000", "noarch", "click", "gradient", "support", "server", "linear", "front", "using", "datepicker", "repeat", "topics", "please", "sites", "center", "message", "shared", "system", "inline", "glyphicon", "glyphicons", "description", "dialog", "target", "trigger", "media", "network", "files", "links", "normal", "field", "would", "circle"
-"collapse", "total", "oldid", "module", "method", "keyframes", "example", "widget", "asciidoctor", "proxy", "holder", "compressed", "uncompressed", " screen", "login" "modal", "bower", "control", "settings", "found", "state", "removeclass", "month", "board", "calligra", "scale", "pictures", "change", "license", "account", "toggle", "highlight", "access", "download", "selector", "responsive", "vertical", "parser", "dates", "version", "action", "visible", "relative", "exports", "overlay", "pager", "pagination", "pages", "register", "wrapper", "affix", "stack", "bytes", "lists", "fontawesome", "flags", "thread"
+BLACKLIST = {"boolean", "dfn", "text-indent", "margin", "accelerator", "address", "-moz-border-right-colors", "onkeypress", "serif", "animation", "embed", "border-bottom-style", "vertical-align", "position", "page", "font-variant", "protected", "defaultstatus", "typeof", "parsefloat", "legend", "button", "frames", "debugger", "scrollbar-shadow-color", "text-decoration", "dt", "layout-grid", "scrollbar-highlight-color", "webkit", "break", "catch", "align", "if", "solid", "font", "ruby-position", "margin-top", "package", "onkeydown", "play-during", "text-underline-position", "-moz-border-radius-topleft", "cue", "for", "behavior", "text-justify", "isnan", "include-source", "table", "border-left-width", "-moz-border-bottom-colors", "final", "border-left", "short", "mimetypes", "text-align", "background", "ruby-overhang", "scrollbar-base-color", "layout-grid-line", "public", "anchor", "scrollbar-arrow-color", "constructor", "border-width", "http", "word-wrap", "scrollbar-dark-shadow-color", "undefined", "-moz-outline-style", "voice-family", "i", "radius", "crypto", "link", "helper", "index", "nodetype", "pitch-range", "sub", "pagexoffset", "label", "tostring", "layout-grid-char", "outline-width", "object", "col", "th", "font-size", "base", "optgroup", "param", "tr", "-moz-user-input", "outerheight", "speak-punctuation", "opacity", "ins", "min-height", "script", "layers", "parseint", "azimuth", "in", "images", "padding-bottom", "byte", "offscreenbuffering", "extends", "h3", "continue", "border-right-style", "disabled", "first", "background-color", "-moz-border-radius-bottomright", "rotate", "style", "border-style", "member", "dd", "scrollbar-face-color", "string", "pause-before", "throws", "marker-offset", "outline", "speech-rate", "big", "border-right", "synchronized", "abbr", "escape", "head", "cursor", "class", "innerwidth", "settimeout", "hasownproperty", "-moz-binding", "unicode-bidi", "layer-background-color", "text-transform", "all", "overflow-y", "page-break-inside", "else", "title", "word-spacing", "closed", "sup", "em", "body", "native", "throw", "layout-grid-char-spacing", "nan", "selecttor", "pitch", "interface", "border-color", "orphans", "double", "div", "border-bottom", "try", "anchors", "letter-spacing", "import", "child", "margin-right", "colgroup", "focus", "-use-link-source", "blockquote", "padding", "quotes", "font-weight", "line-break", "format", "marks", "background-position", "with", "form", "implements", "background-position-x", "thead", "export", "-moz-border-left-colors", "yield", "transparent", "kbd", "array", "empty-cells", "noscript", "-moz-border-radius", "active", "clip", "math", "decodeuri", "content", "richness", "date", "font-stretch", "page-break-after", "super", "pkcs11", "input", "color", "char", "screeny", "border-top-style", "packages", "absolute", "confirm", "text", "-moz-border-radius-topright", "text-autospace", "opener", "-moz-user-select", "background-image", "long", "name", "bottom", "false", "h4", "float", "history", "cover", "caption", "private", "onload", "img", "counter-reset", "min-width", "layer", "size", "list-style-image", "-replace", "return", "valueof", "navigate", "white-space", "max-width", "cue-before", "static", "event", "propertyisenum", "p", "setinterval", "-set-link-source", "onsubmit", "br", "-moz-opacity", "layout-flow", "assign", "onblur", "could", "scroll", "small", "-moz-border-top-colors", "embeds", "submit", "border", "secure", "screenx", "td", "border-top-color", "select", "text-align-last", "let", "visibility", "document", "password", "ime-mode", "h1", "border-right-width", "list-style", "onclick", "pageyoffset", "switch", "writing-mode", "top", "cleartimeout", "margin-left", "instanceof", "new", "transform", "eval", "length", "stress", "map", "widows", "onfocus", "volume", "offset", "isfinite", "onerror", "border-left-style", "acronym", "counter-increment", "pause", "-moz-border-radius-bottomleft", "pause-after", "encodeuricomponent", "tt", "left", "background-repeat", "10px", "block", "onmousedown", "table-layout", "void", "layer-background-image", "transition", "int", "onmouseover", "border-spacing", "right", "do", "parentnode", "caption-side", "ul", "innerheight", "-moz-outline", "outerwidth", "translatex", "number", "strong", "-moz-user-modify", "background-attachment", "untaint", "scrollbar-track-color", "radio", "blur", "outline-style", "prompt", "option", "nodename", "text-kashida-space", "h6", "speak", "decoration", "samp", "list-style-type", "background-position-y", "list-style-position", "self", "forms", "options", "hr", "data", "while", "prototype", "container", "group", "page-break-before", "area", "pre", "html", "clearinterval", "close", "decodeuricomponent", "plugin", "text-shadow", "image", "border-left-color", "span", "height", "a", "cite", "tfoot", "border-top", "li", "tbody", "-moz-outline-width", "volatile", "font-family", "element", "parent", "onmouseup", "navbar", "padding-left", "delete", "transient", "reset", "word-break", "status", "border-collapse", "font-size-adjust", "window", "text-overflow", "open", "scrollbar-3d-light-color", "glyphicon", "fieldset", "infinity", "fileupload", "hidden", "layout-grid-mode", "onkeyup", "encodeuri", "-moz-outline-color", "function", "border-right-color", "var", "error", "padding-right", "max-height", "textarea", "https", "line-height", "h2", "this", "border-top-width", "default", "width", "taint", "layout-grid-type", "dl", "-moz-user-focus", "finally", "filter", "overflow-x", "arguments", "overflow", "q", "framerate", "outline-color", "clientinformation", "null", "font-style", "navigator", "ol", "isprototypeof", "unescape", "direction", "frame", "meta", "case", "bdo", "enum", "display", "dropdown", "b", "del", "elevation", "cue-after", "alert", "padding-top", "speak-header", "true", "border-bottom-width", "location", "ruby-align", "alertabstract", "h5", "elements", "margin-bottom", "goto", "speak-numeral", "template", "clear", "border-bottom-color", "code", "checkbox", "const", "source", "hover", "panel", "important", "value", "users", "stats", "weight", "ffffff", "000000", "noarch", "click", "gradient", "support", "server", "linear", "front", "using", "datepicker", "repeat", "topics", "please", "sites", "center", "message", "shared", "system", "inline", "glyphicon", "glyphicons", "description", "dialog", "target", "trigger", "media", "network", "files", "links", "normal", "field", "would", "circle",
+"collapse", "total", "oldid", "module", "method", "keyframes", "example", "widget", "asciidoctor", "proxy", "holder", "compressed", "uncompressed", "screen", "login", "modal", "bower", "control", "settings", "found", "state", "removeclass", "month", "board", "calligra", "scale", "pictures", "change", "license", "account", "toggle", "highlight", "access", "download", "selector", "responsive", "vertical", "parser", "dates", "version", "action", "visible", "relative", "exports", "overlay", "pager", "pagination", "pages", "register", "wrapper", "affix", "stack", "bytes", "lists", "fontawesome", "flags", "thread"
 }
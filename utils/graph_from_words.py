@@ -17,21 +17,25 @@ word = sys.argv[-1]
 
 
 QUERY = """
-    SELECT distinct graph.src, graph.dst
-    FROM graph
-    JOIN fingerprint f_dst ON f_dst.domain = graph.dst
-    JOIN fingerprint f_src ON f_src.domain = graph.src
-    WHERE f_dst.term_frequency ilike '%["{word}",%'
-    AND f_src.term_frequency ilike '%["{word}",%'
-""".format(word=word)
-
-cursor.execute(QUERY)
+    WITH domains AS (
+        SELECT DISTINCT domain.id, domain.location
+        FROM term
+        JOIN posting ON posting.term_id = term.id
+        JOIN fingerprint ON fingerprint.id = posting.fingerprint_id
+        JOIN domain ON domain.location = fingerprint.domain
+        WHERE term.term = %s
+    )
+    SELECT d_src.location, d_dst.location, domain_edge.link_count
+    FROM domain_edge
+    JOIN domains d_src ON d_src.id = domain_edge.src_id
+    JOIN domains d_dst ON d_dst.id = domain_edge.dst_id
+"""
+
+cursor.execute(QUERY, (word,))
 
 
 with open("tor-{}-graph.csv".format(word), "w") as f:
-    f.write("Source,Target\n")
+    f.write("Source,Target,Weight\n")
 
-    for index, row in enumerate(cursor):
-        src = row[0]
-        tgt = row[1]
-        f.write("{},{}\n".format(src, tgt))
+    for src, tgt, weight in cursor:
+        f.write("{},{},{}\n".format(src, tgt, weight))
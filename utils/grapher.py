@@ -12,20 +12,23 @@ DB_CONFIG = {
 
 
 QUERY = """
-SELECT distinct src, dst FROM graph
-join domain sd on sd.location = src
-join domain ld on ld.location = dst
-where sd.accessible = true
-and ld.accessible = true
+SELECT src.location, dst.location, domain_edge.link_count
+FROM domain_edge
+JOIN domain src ON src.id = domain_edge.src_id
+JOIN domain dst ON dst.id = domain_edge.dst_id
+WHERE src.accessible = true
+AND dst.accessible = true
 """
 
 mode = sys.argv[-1]
 
 if mode == "complex":
     QUERY = """
-        SELECT graph.src, graph.dst FROM graph
-        JOIN domain ON domain.location = graph.dst
-        WHERE domain.accessible = true
+        SELECT src.location, dst.location, domain_edge.link_count
+        FROM domain_edge
+        JOIN domain src ON src.id = domain_edge.src_id
+        JOIN domain dst ON dst.id = domain_edge.dst_id
+        WHERE dst.accessible = true
     """
 
 db = psycopg2.connect(**DB_CONFIG)
@@ -34,9 +37,7 @@ cursor = db.cursor()
 cursor.execute(QUERY)
 
 with open("tor-new.csv", "w") as f:
-    f.write("Source,Target\n")
+    f.write("Source,Target,Weight\n")
 
-    for index, row in enumerate(cursor):
-        src = row[0]
-        tgt = row[1]
-        f.write("{},{}\n".format(src, tgt))
+    for src, tgt, weight in cursor:
+        f.write("{},{},{}\n".format(src, tgt, weight))
@@ -0,0 +1,167 @@
+"""
+Rewrites the urls stored before they were normalized, or normalized by an
+older version of unshadow.urlnorm, in their canonical form. Urls whose
+canonical form is stored already are folded into it. Run it with the
+crawler stopped, it can be run again.
+
+python normalize_urls.py
+"""
+
+import os
+import psycopg2
+import psycopg2.extras
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from unshadow.urlnorm import normalize
+
+
+DB_CONFIG = {
+    "database": "unshadow",
+    "user": "unshadow",
+    "password": "",
+    "port": 5432,
+    "host": "localhost"
+}
+
+BATCH_SIZE = 1000
+
+QUERY = "SELECT url FROM url"
+
+EXISTING_QUERY = """
+    SELECT url FROM {} WHERE md5(url) IN (
+        SELECT md5(u) FROM unnest(%s::varchar[]) AS u
+    )
+"""
+
+RENAME_QUERY = """
+    UPDATE {0} SET url = renamed.new
+    FROM (VALUES %s) AS renamed (old, new)
+    WHERE md5({0}.url) = md5(renamed.old) AND {0}.url = renamed.old
+"""
+
+# The canonical row keeps the latest visit and emission of all its urls.
+MERGE_QUERY = """
+    UPDATE url SET
+        last_visited = GREATEST(url.last_visited, merged.last_visited),
+        last_emit = GREATEST(url.last_emit, merged.last_emit)
+    FROM (
+        SELECT
+            changes.new,
+            MAX(old.last_visited) AS last_visited,
+            MAX(old.last_emit) AS last_emit
+        FROM (VALUES %s) AS changes (old, new)
+        JOIN url old
+            ON md5(old.url) = md5(changes.old) AND old.url = changes.old
+        GROUP BY changes.new
+    ) AS merged
+    WHERE md5(url.url) = md5(merged.new) AND url.url = merged.new
+"""
+
+HAS_REVISITS_QUERY = "SELECT to_regclass('url_revisit') IS NOT NULL"
+
+DELETE_QUERY = """
+    DELETE FROM {} WHERE md5(url) IN (
+        SELECT md5(u) FROM unnest(%s::varchar[]) AS u
+    )
+"""
+
+
+def get_changes(db):
+    """
+    {canonical url: [stored urls]} of the stored urls that aren't
+    canonical.
+    """
+
+    changes = {}
+
+    with db.cursor('normalize_urls') as cursor:
+        cursor.itersize = 10000
+        cursor.execute(QUERY)
+
+        for (url,) in cursor:
+            canonical = normalize(url)
+
+            if canonical and canonical != url:
+                changes.setdefault(canonical, []).append(url)
+
+    db.commit()
+
+    return changes
+
+
+def rewrite(cursor, table, changes):
+    """
+    Rename the rows of table to their canonical url, or merge them into the
+    row of their canonical url when there is one.
+    """
+
+    cursor.execute(EXISTING_QUERY.format(table), (list(changes),))
+    existing = set(row[0] for row in cursor.fetchall())
+
+    renames = []
+    merges = []
+
+    for canonical, urls in changes.items():
+        if canonical not in existing:
+            renames.append((urls[0], canonical))
+            urls = urls[1:]
+
+        merges.extend((url, canonical) for url in urls)
+
+    # Merged rows are folded into canonical rows that exist already or were
+    # just renamed.
+    psycopg2.extras.execute_values(
+        cursor,
+        RENAME_QUERY.format(table),
+        renames
+    )
+
+    if table == 'url':
+        psycopg2.extras.execute_values(cursor, MERGE_QUERY, merges)
+
+    cursor.execute(DELETE_QUERY.format(table), ([i[0] for i in merges],))
+
+    return len(renames), len(merges)
+
+
+def has_revisits(db):
+    with db.cursor() as cursor:
+        cursor.execute(HAS_REVISITS_QUERY)
+        exists = cursor.fetchone()[0]
+
+    db.commit()
+
+    return exists
+
+
+def apply_changes(db, changes, revisits):
+    with db.cursor() as cursor:
+        # Revisit schedules are keyed by url too, the canonical url keeps
+        # its own schedule. The table only exists when recrawling is on.
+        if revisits:
+            rewrite(cursor, 'url_revisit', changes)
+
+        counts = rewrite(cursor, 'url', changes)
+
+    db.commit()
+
+    return counts
+
+
+db = psycopg2.connect(**DB_CONFIG)
+changes = list(get_changes(db).items())
+revisits = has_revisits(db)
+renamed = merged = 0
+
+for i in range(0, len(changes), BATCH_SIZE):
+    batch_renamed, batch_merged = apply_changes(
+        db,
+        dict(changes[i:i + BATCH_SIZE]),
+        revisits
+    )
+    renamed += batch_renamed
+    merged += batch_merged
+
+    print("{} urls renamed, {} merged".format(renamed, merged))